@@ -0,0 +1,237 @@
+import os
+import json  # Метаданные кэша (длительности кадров, FPS)
+import hashlib  # Хэш содержимого исходного файла - ключ кэша
+import threading  # Фоновая запись кэша для больших анимаций
+import multiprocessing  # Контекст spawn для пула процессов-декодеров
+from concurrent.futures import ProcessPoolExecutor, as_completed  # Параллельное декодирование ассетов
+
+import numpy as np
+from PIL import Image, ImageSequence
+
+# Версия формата кэша: при изменении формата или способа декодирования старые записи перестают совпадать по ключу
+CACHE_FORMAT_VERSION = 1
+FRAMES_FILE_SUFFIX = ".npy"
+METADATA_FILE_SUFFIX = ".json"
+
+# Уже посчитанные ключи: (путь, mtime, размер, режим) -> ключ, чтобы не хэшировать один файл несколько раз за запуск
+_cache_key_memo = {}
+
+
+def decode_frames(file_path: str, mode: str) -> tuple[np.ndarray, float, np.ndarray]:
+    """
+    Декодирует все кадры GIF или PNG файла в цветовом режиме mode ("RGB" или "RGBA").
+    Кадры пишутся в один заранее выделенный массив N x H x W x C, без отдельного выделения памяти на кадр.
+    Возвращает (стек кадров, оригинальный FPS, длительности кадров в секундах, float64). Ошибки чтения пробрасываются.
+    """
+    with Image.open(file_path) as im:
+        if file_path.endswith(".gif"):
+            frame_count = getattr(im, "n_frames", 1)
+            frames = np.empty((frame_count, im.height, im.width, len(mode)), dtype=np.uint8)
+            frame_durations = np.empty(frame_count, dtype=np.float64)
+            for frame_index, frame in enumerate(ImageSequence.Iterator(im)):
+                frames[frame_index] = np.asarray(frame.convert(mode))
+                # Сохраняем длительность каждого кадра в секундах
+                frame_durations[frame_index] = frame.info.get("duration", 100) / 1000.0
+
+            # Пытаемся получить duration из GIF и рассчитать FPS
+            if 'duration' in im.info and im.info['duration'] > 0:
+                original_fps = 1000.0 / im.info['duration']
+            else:
+                # Если duration не определен, используем разумное значение по умолчанию для GIF
+                original_fps = 15.0
+                print(
+                    f"  ПРЕДУПРЕЖДЕНИЕ: Не удалось определить точный FPS для GIF '{os.path.basename(file_path)}'. Использую значение по умолчанию ({original_fps:.2f}).")
+
+        else:  # PNG (статичное изображение)
+            frames = np.array(im.convert(mode))[np.newaxis]
+            original_fps = 1.0  # Статичные изображения имеют 1 FPS
+            frame_durations = np.array([1.0 / original_fps])  # Для PNG длительность кадра - 1/FPS
+
+    return frames, original_fps, frame_durations
+
+
+def get_cache_key(file_path: str, mode: str) -> str | None:
+    """
+    Ключ кэша для файла: SHA-1 его содержимого, цветовой режим кадров ("RGB"/"RGBA") и версия формата.
+    При изменении файла меняется и ключ, поэтому устаревшие записи просто перестают использоваться.
+    Возвращает None, если файл не удалось прочитать.
+    """
+    digest = hashlib.sha1()
+    try:
+        file_stat = os.stat(file_path)
+        memo_key = (os.path.realpath(file_path), file_stat.st_mtime_ns, file_stat.st_size, mode)
+        if memo_key in _cache_key_memo:
+            return _cache_key_memo[memo_key]
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+    except OSError as e:
+        print(f"  ПРЕДУПРЕЖДЕНИЕ: Не удалось прочитать '{file_path}' для кэша кадров: {e}")
+        return None
+    cache_key = f"{digest.hexdigest()}_{mode}_v{CACHE_FORMAT_VERSION}"
+    _cache_key_memo[memo_key] = cache_key
+    return cache_key
+
+
+def _entry_paths(cache_dir: str, cache_key: str) -> tuple[str, str]:
+    base_path = os.path.join(cache_dir, cache_key)
+    return base_path + FRAMES_FILE_SUFFIX, base_path + METADATA_FILE_SUFFIX
+
+
+def has_entry(cache_dir: str, cache_key: str) -> bool:
+    """Есть ли в кэше полная запись (кадры и метаданные) для ключа."""
+    frames_path, metadata_path = _entry_paths(cache_dir, cache_key)
+    return os.path.exists(frames_path) and os.path.exists(metadata_path)
+
+
+def load_frames(cache_dir: str, cache_key: str | None) -> tuple[np.ndarray, np.ndarray, float] | None:
+    """
+    Открывает запись кэша через np.load(mmap_mode='r'): кадры не декодируются и не копируются в память процесса,
+    ОС подгружает их страницами по мере обращения.
+    Возвращает (стек кадров N x H x W x C, длительности кадров в секундах, FPS) или None при промахе.
+    """
+    if cache_key is None:
+        return None
+    frames_path, metadata_path = _entry_paths(cache_dir, cache_key)
+    if not has_entry(cache_dir, cache_key):
+        return None
+    try:
+        with open(metadata_path, 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+        frames = np.load(frames_path, mmap_mode='r')
+        if frames.ndim != 4 or len(frames) != len(metadata["durations"]):
+            print(f"  ПРЕДУПРЕЖДЕНИЕ: Запись кэша кадров '{cache_key}' повреждена. Декодирую файл заново.")
+            return None
+        return frames, np.asarray(metadata["durations"], dtype=np.float64), float(metadata["fps"])
+    except Exception as e:
+        print(f"  ПРЕДУПРЕЖДЕНИЕ: Не удалось открыть запись кэша кадров '{cache_key}': {e}")
+        return None
+
+
+def _write_metadata(metadata_path: str, durations, fps: float):
+    temp_path = metadata_path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({"durations": np.asarray(durations, dtype=np.float64).tolist(), "fps": fps}, f)
+    os.replace(temp_path, metadata_path)
+
+
+def store_frames(cache_dir: str, cache_key: str | None, frames: np.ndarray, durations: np.ndarray, fps: float):
+    """Сохраняет стек декодированных кадров в кэш. Запись атомарна: сначала временный файл, затем os.replace."""
+    if cache_key is None or len(frames) == 0:
+        return
+    frames_path, metadata_path = _entry_paths(cache_dir, cache_key)
+    temp_path = frames_path + ".tmp"
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(temp_path, 'wb') as f:
+            np.save(f, frames)
+        os.replace(temp_path, frames_path)
+        # Метаданные пишутся последними: запись без них считается отсутствующей
+        _write_metadata(metadata_path, durations, fps)
+    except Exception as e:
+        print(f"  ПРЕДУПРЕЖДЕНИЕ: Не удалось сохранить кадры в кэш '{cache_key}': {e}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def _stream_frames_to_cache(cache_dir: str, cache_key: str, file_path: str, mode: str,
+                            frame_count: int, size: tuple[int, int], durations: np.ndarray, fps: float):
+    frames_path, metadata_path = _entry_paths(cache_dir, cache_key)
+    temp_path = frames_path + ".tmp"
+    channels = len(mode)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        stack = np.lib.format.open_memmap(temp_path, mode='w+', dtype=np.uint8,
+                                          shape=(frame_count, size[1], size[0], channels))
+        with Image.open(file_path) as im:
+            for frame_index in range(frame_count):
+                im.seek(frame_index)
+                stack[frame_index] = np.asarray(im.convert(mode))
+        stack.flush()
+        del stack
+        os.replace(temp_path, frames_path)
+        _write_metadata(metadata_path, durations, fps)
+        print(f"  Кадры '{os.path.basename(file_path)}' сохранены в кэш, следующий запуск не будет их декодировать.")
+    except Exception as e:
+        print(f"  ПРЕДУПРЕЖДЕНИЕ: Не удалось сохранить кадры '{file_path}' в кэш: {e}")
+        try:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        except OSError:
+            pass
+
+
+def store_frames_in_background(cache_dir: str, cache_key: str | None, file_path: str, mode: str,
+                               frame_count: int, size: tuple[int, int], durations: np.ndarray, fps: float):
+    """
+    Для анимаций, которые не декодируются целиком: кадры по одному декодируются в фоновом потоке
+    и сразу пишутся в файл кэша через np.lib.format.open_memmap, не удерживая всю анимацию в памяти.
+    """
+    if cache_key is None or frame_count <= 0:
+        return
+    threading.Thread(target=_stream_frames_to_cache,
+                     args=(cache_dir, cache_key, file_path, mode, frame_count, size, durations, fps),
+                     daemon=True).start()
+
+
+def decode_to_cache(cache_dir: str, cache_key: str, file_path: str, mode: str,
+                    max_decoded_bytes: int | None = None) -> bool:
+    """
+    Задача процесса-декодера: декодирует файл и записывает кадры в кэш.
+    Кадры возвращаются в родительский процесс не через pickle, а через файл кэша, который родитель отображает в память.
+    Анимации больше max_decoded_bytes не декодируются (родитель откроет их для ленивого декодирования).
+    Возвращает True, если запись кэша создана.
+    """
+    if file_path.endswith(".gif") and max_decoded_bytes is not None:
+        with Image.open(file_path) as im:
+            frame_count = im.n_frames
+            decoded_size = frame_count * im.width * im.height * len(mode)
+        if frame_count > 1 and decoded_size > max_decoded_bytes:
+            return False
+    frames, original_fps, frame_durations = decode_frames(file_path, mode)
+    store_frames(cache_dir, cache_key, frames, frame_durations, original_fps)
+    return has_entry(cache_dir, cache_key)
+
+
+def decode_files_in_parallel(cache_dir: str, files: list[tuple[str, str]], max_decoded_bytes: int | None = None):
+    """
+    Декодирует файлы (путь, режим), которых еще нет в кэше, в пуле процессов: одна задача на уникальный файл.
+    После возврата кадры этих файлов лежат в кэше, и load_frames отображает их в память без декодирования.
+    Если в кэше не хватает меньше двух файлов, пул не создается: запуск процессов дороже одного декодирования.
+    """
+    pending = []
+    for file_path, mode in dict.fromkeys(files):
+        cache_key = get_cache_key(file_path, mode)
+        if cache_key is not None and not has_entry(cache_dir, cache_key):
+            pending.append((cache_key, file_path, mode))
+    if len(pending) < 2:
+        return
+
+    worker_count = min(len(pending), os.cpu_count() or 1)
+    print(f"  Параллельное декодирование {len(pending)} файлов ассетов ({worker_count} процессов)...")
+    try:
+        with ProcessPoolExecutor(max_workers=worker_count, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = {pool.submit(decode_to_cache, cache_dir, cache_key, file_path, mode, max_decoded_bytes): file_path
+                       for cache_key, file_path, mode in pending}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"  ПРЕДУПРЕЖДЕНИЕ: Не удалось декодировать '{futures[future]}' в отдельном процессе: {e}")
+    except Exception as e:
+        # Файлы, которые не попали в кэш, будут декодированы последовательно при загрузке
+        print(f"  ПРЕДУПРЕЖДЕНИЕ: Параллельное декодирование ассетов недоступно: {e}")
+
+
+def prune(cache_dir: str, keys_in_use: set[str]):
+    """Удаляет записи кэша, которые не соответствуют ни одному текущему файлу ассетов."""
+    if not os.path.isdir(cache_dir):
+        return
+    for file_name in os.listdir(cache_dir):
+        cache_key = file_name.split(".", 1)[0]
+        if cache_key in keys_in_use or file_name.endswith(".tmp"):
+            continue
+        try:
+            os.remove(os.path.join(cache_dir, file_name))
+        except OSError:
+            pass  # Файл может быть занят (например, отображен в память), удалим при следующем запуске
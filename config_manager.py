@@ -31,6 +31,10 @@ def load_config():
                 f.write("INSTANT_TALK_TRANSITION=True\n")
                 f.write("DIM_ENABLED=True\n")
                 f.write("DIM_PERCENTAGE=50\n")
+                f.write("FRAME_CACHE_MEMORY_MB=512\n")
+                f.write("COMPACT_GIF_FRAMES=False\n")
+                f.write("OUTPUT_RESOLUTION=auto\n")  # auto - по размеру фона, или высота кадра: 720p, 1080p
+                f.write("ADAPTIVE_QUALITY=True\n")
             print(f"Файл '{user_config_file_path}' успешно создан.")
         except Exception as e:
             print(f"Критическая ошибка при создании файла '{user_config_file_path}': {e}")
@@ -70,6 +74,18 @@ def load_config():
         if 'DIM_PERCENTAGE' not in config_data:
             config_data['DIM_PERCENTAGE'] = '50'
             updated = True
+        if 'FRAME_CACHE_MEMORY_MB' not in config_data:
+            config_data['FRAME_CACHE_MEMORY_MB'] = '512'
+            updated = True
+        if 'COMPACT_GIF_FRAMES' not in config_data:
+            config_data['COMPACT_GIF_FRAMES'] = 'False'
+            updated = True
+        if 'OUTPUT_RESOLUTION' not in config_data:
+            config_data['OUTPUT_RESOLUTION'] = 'auto'
+            updated = True
+        if 'ADAPTIVE_QUALITY' not in config_data:
+            config_data['ADAPTIVE_QUALITY'] = 'True'
+            updated = True
 
         # Если были добавлены новые поля, сохраняем обновленный конфиг
         if updated:
@@ -78,7 +94,9 @@ def load_config():
                     # Проверяем, что ключ является пользовательской настройкой
                     if key in ['CAM_FPS', 'CROSS_FADE_ENABLED', 'BOUNCING_ENABLED',
                                'CROSS_FADE_DURATION_MS', 'RESET_ANIMATION_ON_STATUS_CHANGE',
-                               'INSTANT_TALK_TRANSITION', 'DIM_ENABLED', 'DIM_PERCENTAGE']:
+                               'INSTANT_TALK_TRANSITION', 'DIM_ENABLED', 'DIM_PERCENTAGE',
+                               'FRAME_CACHE_MEMORY_MB', 'COMPACT_GIF_FRAMES', 'OUTPUT_RESOLUTION',
+                               'ADAPTIVE_QUALITY']:
                         f.write(f"{key}={value}\n")
             print(f"Файл '{user_config_file_path}' обновлен новыми настройками.")
 
@@ -157,7 +175,8 @@ def save_config(config_data):
         # Удалены 'CAM_WIDTH', 'CAM_HEIGHT', 'USE_BG_RESOLUTION'
         if key in ['CAM_FPS', 'CROSS_FADE_ENABLED', 'BOUNCING_ENABLED',
                    'CROSS_FADE_DURATION_MS', 'RESET_ANIMATION_ON_STATUS_CHANGE', 'INSTANT_TALK_TRANSITION',
-                   'DIM_ENABLED', 'DIM_PERCENTAGE']:
+                   'DIM_ENABLED', 'DIM_PERCENTAGE', 'FRAME_CACHE_MEMORY_MB', 'COMPACT_GIF_FRAMES',
+                   'OUTPUT_RESOLUTION', 'ADAPTIVE_QUALITY']:
             user_data_to_save[key] = value
         else:  # Все остальные настройки идут в app_config
             app_data_to_save[key] = value
@@ -0,0 +1,147 @@
+import math
+import threading  # Стадии записываются из потока рендеринга и потока отправки конвейера
+import time
+from collections import deque  # Скользящее окно времени отправки кадров
+
+# Стадии кадра, для которых ведутся гистограммы задержек
+STAGE_ANIMATION = "animation"  # Продвижение анимаций и выбор слоев аватара (под _avatar_frames_lock)
+STAGE_COMPOSE = "compose"  # Композиция кадра (в слот общей памяти или в буфер конвейера)
+STAGE_SHM_WRITE = "shm_write"  # Копирование кадра в общую память и публикация слота (без сигнала)
+STAGE_SIGNAL = "signal"  # Сигнал потребителю (frameReady/номер кадра и событие)
+STAGE_PREVIEW = "preview"  # Копия кадра для предпросмотра в GUI
+STAGE_FRAME = "frame"  # Вся работа итерации цикла без ожидания дедлайна
+STAGE_PIPELINE_QUEUE = "pipeline_queue"  # Ожидание кадра конвейера в очереди от постановки до начала отправки
+STAGE_PIPELINE_SEND = "pipeline_send"  # Отправка кадра потоком конвейера (запись, сигнал и предпросмотр)
+STAGES = (STAGE_ANIMATION, STAGE_COMPOSE, STAGE_SHM_WRITE, STAGE_SIGNAL, STAGE_PREVIEW, STAGE_FRAME,
+          STAGE_PIPELINE_QUEUE, STAGE_PIPELINE_SEND)
+
+# Корзины гистограммы идут с шагом 2^(1/BUCKETS_PER_OCTAVE) от HISTOGRAM_MIN_MS (~19% ширины корзины)
+HISTOGRAM_MIN_MS = 0.01
+BUCKETS_PER_OCTAVE = 4
+BUCKET_COUNT = 80  # 20 октав: от 0.01 мс до ~10 с
+PERCENTILES = (50, 95, 99)
+FPS_WINDOW_SECONDS = 2.0  # Окно (заканчивается в момент снимка), по которому считается достигнутый FPS
+
+
+class LatencyHistogram:
+    """
+    Гистограмма задержек с логарифмическими корзинами фиксированного размера.
+    Запись - одно вычисление индекса корзины без выделения памяти; перцентили считаются по корзинам
+    (верхняя граница корзины, но не больше наблюдавшегося максимума).
+    """
+
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, value_ms: float):
+        if value_ms <= HISTOGRAM_MIN_MS:
+            bucket = 0
+        else:
+            bucket = min(BUCKET_COUNT - 1, int(math.log2(value_ms / HISTOGRAM_MIN_MS) * BUCKETS_PER_OCTAVE))
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total_ms += value_ms
+        if value_ms > self.max_ms:
+            self.max_ms = value_ms
+
+    def percentile(self, percent: float) -> float:
+        """Значение (мс), ниже которого лежит percent процентов записей (0, если записей нет)."""
+        if self.count == 0:
+            return 0.0
+        threshold = self.count * percent / 100.0
+        cumulative = 0
+        for bucket, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= threshold:
+                upper_edge = HISTOGRAM_MIN_MS * 2 ** ((bucket + 1) / BUCKETS_PER_OCTAVE)
+                return min(upper_edge, self.max_ms)
+        return self.max_ms
+
+    def summary(self) -> dict:
+        """Количество, среднее, перцентили PERCENTILES и максимум в мс."""
+        stats = {
+            "count": self.count,
+            "avg_ms": self.total_ms / self.count if self.count else 0.0,
+            "max_ms": self.max_ms,
+        }
+        for percent in PERCENTILES:
+            stats[f"p{percent}_ms"] = self.percentile(percent)
+        return stats
+
+
+class FrameMetrics:
+    """
+    Телеметрия цикла кадров: гистограммы задержек стадий STAGES, счетчики отправленных, пропущенных без изменений,
+    отброшенных (все буферы конвейера заняты) и опоздавших (работа дольше бюджета кадра) кадров, достигнутый FPS.
+    Запись дешевая и потокобезопасная; snapshot() возвращает независимую копию, которую можно опрашивать из GUI и логов.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Обнуляет гистограммы и счетчики."""
+        with self._lock:
+            self._histograms = {stage: LatencyHistogram() for stage in STAGES}
+            self._sent_times = deque()
+            self.started_at = time.perf_counter()
+            self.sent_frames = 0
+            self.skipped_frames = 0
+            self.dropped_frames = 0
+            self.late_frames = 0
+
+    def record_stage(self, stage: str, duration_ms: float):
+        """Добавляет длительность стадии (мс) в ее гистограмму."""
+        with self._lock:
+            self._histograms[stage].record(duration_ms)
+
+    def record_frame(self, work_ms: float, budget_ms: float, sent: bool = True, skipped: bool = False,
+                     dropped: bool = False):
+        """
+        Учитывает итерацию цикла: время работы (мс) и бюджет кадра (мс) с учетом пониженной частоты кадров.
+        sent - потребитель получил новый кадр; skipped - содержимое не изменилось, композиция пропущена
+        и потребитель получил только сигнал; dropped - кадр отброшен из-за заполненного конвейера.
+        """
+        with self._lock:
+            self._histograms[STAGE_FRAME].record(work_ms)
+            if budget_ms > 0 and work_ms > budget_ms:
+                self.late_frames += 1
+            if skipped:
+                self.skipped_frames += 1
+            if dropped:
+                self.dropped_frames += 1
+            if sent:
+                self.sent_frames += 1
+                now = time.perf_counter()
+                self._sent_times.append(now)
+                self._drop_old_sent_times(now)
+
+    def _drop_old_sent_times(self, now: float):
+        """Удаляет время отправки кадров, вышедших из окна FPS_WINDOW_SECONDS (вызывается под _lock)."""
+        while self._sent_times and self._sent_times[0] < now - FPS_WINDOW_SECONDS:
+            self._sent_times.popleft()
+
+    def snapshot(self) -> dict:
+        """
+        Снимок телеметрии: достигнутый FPS (новые кадры за последние FPS_WINDOW_SECONDS до момента снимка,
+        поэтому без новых кадров он падает до 0), счетчики кадров
+        и для каждой стадии count/avg_ms/p50_ms/p95_ms/p99_ms/max_ms.
+        """
+        with self._lock:
+            now = time.perf_counter()
+            self._drop_old_sent_times(now)
+            window = min(FPS_WINDOW_SECONDS, now - self.started_at)
+            achieved_fps = len(self._sent_times) / window if window > 0 else 0.0
+            return {
+                "achieved_fps": achieved_fps,
+                "uptime_s": now - self.started_at,
+                "sent_frames": self.sent_frames,
+                "skipped_frames": self.skipped_frames,
+                "dropped_frames": self.dropped_frames,
+                "late_frames": self.late_frames,
+                "stages": {stage: histogram.summary() for stage, histogram in self._histograms.items()},
+            }
@@ -0,0 +1,104 @@
+import threading
+import queue  # Очереди свободных и готовых буферов
+import time
+
+import numpy as np
+
+import frame_metrics
+
+DEFAULT_PIPELINE_DEPTH = 3  # Количество заранее выделенных буферов кадров
+
+
+class FramePipeline:
+    """
+    Двухстадийный конвейер кадров: стадия композиции (вызывающий поток) заполняет буферы из пула
+    заранее выделенных кадров, а стадия отправки (собственный поток) публикует их потребителю.
+    Пока отправляется кадр N, уже собирается кадр N+1.
+    Обратное давление: если все буферы заняты отправкой, acquire() ждет не дольше таймаута
+    и сообщает, что кадр нужно пропустить, - композиция никогда не обгоняет отправку больше чем на глубину пула.
+    Время ожидания в очереди и отправки записывается в metrics (frame_metrics.FrameMetrics), если он задан.
+    """
+
+    def __init__(self, frame_shape: tuple, send_frame, depth: int = DEFAULT_PIPELINE_DEPTH,
+                 name: str = "FrameSenderThread", metrics: frame_metrics.FrameMetrics | None = None):
+        self.frame_shape = frame_shape
+        self.buffers = [np.empty(frame_shape, dtype=np.uint8) for _ in range(depth)]
+        self._send_frame = send_frame  # Функция (буфер кадра или None, данные кадра) -> None, вызывается в потоке отправки
+        self._free_buffers = queue.Queue()
+        for buffer_index in range(depth):
+            self._free_buffers.put(buffer_index)
+        # Готовые кадры; сигналы без нового кадра тоже проходят через очередь, чтобы сохранить порядок
+        self._ready_frames = queue.Queue(maxsize=depth * 2)
+        self._name = name
+        self._thread = None
+        self._metrics = metrics
+
+    @property
+    def depth(self) -> int:
+        return len(self.buffers)
+
+    def start(self):
+        """Запускает поток стадии отправки."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._sender_loop, name=self._name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0) -> bool:
+        """Отправляет уже поставленные кадры и останавливает поток отправки. Возвращает True, если поток завершился."""
+        thread = self._thread
+        if thread is None:
+            return True
+        self._ready_frames.put(None)
+        thread.join(timeout)
+        self._thread = None
+        return not thread.is_alive()
+
+    def acquire(self, timeout: float) -> int | None:
+        """
+        Берет свободный буфер для композиции следующего кадра.
+        Возвращает номер буфера или None, если за timeout ни один буфер не освободился (кадр пропускается).
+        """
+        try:
+            return self._free_buffers.get(timeout=max(timeout, 0.0))
+        except queue.Empty:
+            return None
+
+    def release(self, buffer_index: int):
+        """Возвращает в пул буфер, взятый acquire(), если кадр в нем не удалось собрать или поставить в очередь."""
+        self._free_buffers.put(buffer_index)
+
+    def submit(self, buffer_index: int | None, payload):
+        """
+        Передает собранный кадр (или только сигнал, если buffer_index None) стадии отправки.
+        Сигнал без кадра при переполненной очереди отбрасывается: следующий кадр все равно разбудит потребителя.
+        """
+        item = (buffer_index, payload, time.perf_counter())
+        if buffer_index is None:
+            try:
+                self._ready_frames.put_nowait(item)
+            except queue.Full:
+                pass
+            return
+        self._ready_frames.put(item)
+
+    def _sender_loop(self):
+        while True:
+            item = self._ready_frames.get()
+            if item is None:
+                break
+            buffer_index, payload, submitted_time = item
+            send_start = time.perf_counter()
+            try:
+                frame = self.buffers[buffer_index] if buffer_index is not None else None
+                self._send_frame(frame, payload)
+            except Exception as e:
+                print(f"ОШИБКА в потоке отправки кадров: {e}")
+            finally:
+                if buffer_index is not None:
+                    if self._metrics is not None:
+                        self._metrics.record_stage(frame_metrics.STAGE_PIPELINE_QUEUE,
+                                                   (send_start - submitted_time) * 1000)
+                        self._metrics.record_stage(frame_metrics.STAGE_PIPELINE_SEND,
+                                                   (time.perf_counter() - send_start) * 1000)
+                    self._free_buffers.put(buffer_index)
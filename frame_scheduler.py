@@ -0,0 +1,157 @@
+import sys
+import time  # time.perf_counter() - монотонные часы высокого разрешения
+import math
+from collections import deque  # Скользящее окно статистики
+
+# Последние SPIN_THRESHOLD_SECONDS до дедлайна ожидаются активным циклом: sleep на этом отрезке часто просыпается поздно
+SPIN_THRESHOLD_SECONDS = 0.001
+# Верхняя граница адаптивного запаса: даже если sleep систематически просыпается поздно, активное ожидание
+# не растягивается на весь кадр и не отнимает процессор у потока отправки, GUI и Playwright
+MAX_SLEEP_MARGIN_SECONDS = 0.002
+STATS_WINDOW_SIZE = 240  # Количество последних кадров для скользящей статистики (FPS, джиттер)
+
+_timer_resolution_raised = False
+
+
+def _raise_timer_resolution():
+    """
+    На Windows по умолчанию таймер сна имеет разрешение ~15.6 мс.
+    timeBeginPeriod(1) повышает его до 1 мс на время работы процесса.
+    """
+    global _timer_resolution_raised
+    if _timer_resolution_raised or sys.platform != "win32":
+        return
+    try:
+        import ctypes
+        ctypes.windll.winmm.timeBeginPeriod(1)
+        _timer_resolution_raised = True
+    except Exception as e:
+        print(f"ПРЕДУПРЕЖДЕНИЕ: Не удалось повысить разрешение системного таймера: {e}")
+
+
+def raise_current_thread_priority():
+    """Повышает приоритет текущего потока (Windows: THREAD_PRIORITY_HIGHEST), чтобы кадры не ждали других потоков."""
+    if sys.platform != "win32":
+        return
+    try:
+        import ctypes
+        THREAD_PRIORITY_HIGHEST = 2
+        kernel32 = ctypes.windll.kernel32
+        kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_PRIORITY_HIGHEST)
+    except Exception as e:
+        print(f"ПРЕДУПРЕЖДЕНИЕ: Не удалось повысить приоритет потока рендеринга: {e}")
+
+
+class FrameScheduler:
+    """
+    Планировщик кадров по абсолютным дедлайнам.
+    Дедлайны идут по сетке start + k * period (next_deadline += period), поэтому ошибки сна не накапливаются.
+    Ожидание гибридное: сон до дедлайна минус запас, затем активное ожидание последних ~1 мс.
+    Запас адаптивный - он растет, если сон систематически просыпается позже запрошенного, но не больше
+    MAX_SLEEP_MARGIN_SECONDS. Активное ожидание на каждой итерации отдает GIL (time.sleep(0)).
+    Если цикл опоздал больше чем на период, пропущенные дедлайны не догоняются: планировщик переходит
+    к ближайшему будущему дедлайну сетки.
+    """
+
+    def __init__(self, fps: float, spin_threshold: float = SPIN_THRESHOLD_SECONDS):
+        self.period = 1.0 / fps if fps > 0 else 0.0
+        self.fps = fps
+        self.spin_threshold = spin_threshold
+        self._sleep_margin = spin_threshold  # Текущий запас перед дедлайном, который не доверяется sleep
+        self.next_deadline = None
+
+        # Статистика
+        self.frame_count = 0
+        self.missed_deadlines = 0  # Итерации, закончившиеся уже после своего дедлайна
+        self.skipped_deadlines = 0  # Дедлайны, пропущенные целиком при переходе вперед по сетке
+        self._wake_times = deque(maxlen=STATS_WINDOW_SIZE)
+        self._lateness = deque(maxlen=STATS_WINDOW_SIZE)  # Опоздание пробуждения относительно дедлайна (с)
+
+        _raise_timer_resolution()
+
+    def set_fps(self, fps: float):
+        """Меняет частоту кадров; следующий дедлайн отсчитывается от текущего с новым периодом."""
+        if fps == self.fps:
+            return
+        self.fps = fps
+        self.period = 1.0 / fps if fps > 0 else 0.0
+        self.next_deadline = None
+
+    def _begin_wait(self) -> float:
+        """Возвращает оставшееся до дедлайна время (с), при необходимости переходя вперед по сетке."""
+        now = time.perf_counter()
+        if self.next_deadline is None:
+            self.next_deadline = now + self.period
+        remaining = self.next_deadline - now
+        if remaining < 0:
+            self.missed_deadlines += 1
+            if -remaining > self.period > 0:
+                # Опоздали больше чем на период: пропускаем прошедшие дедлайны и ждем ближайший будущий
+                skipped = math.floor(-remaining / self.period)
+                self.skipped_deadlines += skipped
+                self.next_deadline += skipped * self.period
+                remaining = self.next_deadline - now
+                if remaining < 0:
+                    self.next_deadline += self.period
+                    remaining += self.period
+                    self.skipped_deadlines += 1
+        return remaining
+
+    def _coarse_sleep_duration(self, remaining: float) -> float:
+        return remaining - self._sleep_margin
+
+    def _spin_until_deadline(self):
+        deadline = self.next_deadline
+        while time.perf_counter() < deadline:
+            time.sleep(0)  # Отдаем GIL другим потокам Python на время ожидания
+
+    def _update_sleep_margin(self, sleep_requested: float, sleep_started: float):
+        """Подстраивает запас под фактическое опоздание пробуждения из сна (до активного ожидания)."""
+        if sleep_requested <= 0:
+            return
+        oversleep = max(0.0, (time.perf_counter() - sleep_started) - sleep_requested)
+        # Экспоненциальное сглаживание запаса: не больше MAX_SLEEP_MARGIN_SECONDS и периода
+        target_margin = oversleep + self.spin_threshold
+        self._sleep_margin = min(self.period, MAX_SLEEP_MARGIN_SECONDS,
+                                 0.9 * self._sleep_margin + 0.1 * target_margin)
+
+    def _end_wait(self):
+        """Фиксирует пробуждение, обновляет статистику и переходит к следующему дедлайну."""
+        now = time.perf_counter()
+        self._lateness.append(max(0.0, now - self.next_deadline))
+        self._wake_times.append(now)
+        self.frame_count += 1
+        self.next_deadline += self.period
+
+    def wait(self):
+        """Блокирующее ожидание следующего дедлайна."""
+        remaining = self._begin_wait()
+        sleep_duration = self._coarse_sleep_duration(remaining)
+        sleep_started = time.perf_counter()
+        if sleep_duration > 0:
+            time.sleep(sleep_duration)
+        self._update_sleep_margin(sleep_duration, sleep_started)
+        self._spin_until_deadline()
+        self._end_wait()
+
+    def get_stats(self) -> dict:
+        """
+        Статистика по последним STATS_WINDOW_SIZE кадрам и за все время:
+        достигнутый FPS, средний и максимальный джиттер (мс), пропущенные дедлайны.
+        """
+        achieved_fps = 0.0
+        if len(self._wake_times) > 1:
+            window = self._wake_times[-1] - self._wake_times[0]
+            if window > 0:
+                achieved_fps = (len(self._wake_times) - 1) / window
+        lateness_ms = [value * 1000 for value in self._lateness]
+        return {
+            "target_fps": self.fps,
+            "achieved_fps": achieved_fps,
+            "jitter_avg_ms": sum(lateness_ms) / len(lateness_ms) if lateness_ms else 0.0,
+            "jitter_max_ms": max(lateness_ms) if lateness_ms else 0.0,
+            "frames": self.frame_count,
+            "missed_deadlines": self.missed_deadlines,
+            "skipped_deadlines": self.skipped_deadlines,
+            "sleep_margin_ms": self._sleep_margin * 1000,
+        }
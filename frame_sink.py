@@ -0,0 +1,439 @@
+import sys
+import os
+import mmap  # Для работы с общей памятью
+import struct  # Для упаковки/распаковки структуры данных в общей памяти
+import select  # Для ожидания сигнала нового кадра на стороне читателя (Linux)
+
+import numpy as np
+
+# Win32 зависимости нужны только для бэкенда Windows
+try:
+    import win32event  # Для работы с Win32 событиями
+    import win32api  # Для закрытия дескрипторов Win32
+    import pywintypes  # Для обработки ошибок Win32 API
+except ImportError:
+    win32event = None
+    win32api = None
+    pywintypes = None
+
+# --- ПРОТОКОЛ ОБЩЕЙ ПАМЯТИ ---
+SHARED_MEM_NAME = "LunasVirtualCamSharedMemory"
+NEW_FRAME_EVENT_NAME = "LunasVirtualCamNewFrameEvent"
+MAX_BUFFER_SIZE = 1920 * 1080 * 3  # Максимальный размер буфера 1080p RGB24
+# Формат структуры SharedVideoBuffer: uint32_t (width, height, fps, format, frameSize, frameReady)
+# Little-endian, 6 unsigned ints
+SHARED_BUFFER_HEADER_FORMAT = "<IIIIII"  # 6 unsigned integers
+SHARED_BUFFER_HEADER_SIZE = struct.calcsize(SHARED_BUFFER_HEADER_FORMAT)
+TOTAL_SHARED_MEM_SIZE = SHARED_BUFFER_HEADER_SIZE + MAX_BUFFER_SIZE
+FRAME_FORMAT_RGB24 = 0
+FRAME_READY_OFFSET = SHARED_BUFFER_HEADER_SIZE - 4  # Смещение поля frameReady в заголовке
+
+# --- КОЛЬЦЕВОЙ БУФЕР (протокол v2) ---
+# При slot_count > 1 сразу после заголовка SharedVideoBuffer лежит заголовок кольца:
+# uint32_t (magic, version, slotCount, slotStride, latestSeq), затем MAX_RING_SLOTS счетчиков uint32_t slotSeq[],
+# а кадры лежат в слотах начиная с RING_DATA_OFFSET с шагом slotStride.
+# Писатель выбирает слот seq % slotCount, выставляет slotSeq[slot] = 0 (слот занят), пишет кадр,
+# выставляет slotSeq[slot] = seq и публикует кадр одной 4-байтной записью latestSeq = seq.
+# Читатель берет seq = latestSeq, копирует слот seq % slotCount и принимает копию,
+# только если slotSeq[slot] == seq и до, и после копирования. Писатель никогда не ждет читателя.
+# При slot_count == 1 используется исходный одиночный буфер (кадр сразу после заголовка), который читает DLL камеры.
+RING_MAGIC = 0x52435656  # "VVCR"
+RING_VERSION = 2
+RING_HEADER_FORMAT = "<IIIII"
+RING_HEADER_OFFSET = SHARED_BUFFER_HEADER_SIZE
+RING_LATEST_SEQ_OFFSET = RING_HEADER_OFFSET + 16
+MAX_RING_SLOTS = 8
+RING_SLOT_SEQ_OFFSET = RING_HEADER_OFFSET + struct.calcsize(RING_HEADER_FORMAT)
+RING_DATA_OFFSET = 128  # Начало данных слотов (выровнено по 64 байтам)
+RING_SLOT_STRIDE = MAX_BUFFER_SIZE
+DEFAULT_RING_SLOT_COUNT = 3
+
+# Каталог для файлового бэкенда на Linux (tmpfs)
+POSIX_SHARED_MEM_DIR = "/dev/shm"
+
+
+def get_shared_memory_size(slot_count: int) -> int:
+    """Возвращает размер общей памяти для заданного количества слотов."""
+    if slot_count <= 1:
+        return TOTAL_SHARED_MEM_SIZE
+    return RING_DATA_OFFSET + slot_count * RING_SLOT_STRIDE
+
+
+def union_rects(rect_a: tuple | None, rect_b: tuple | None) -> tuple | None:
+    """Объединяет два прямоугольника (x1, y1, x2, y2); None означает пустой прямоугольник."""
+    if rect_a is None:
+        return rect_b
+    if rect_b is None:
+        return rect_a
+    return (min(rect_a[0], rect_b[0]), min(rect_a[1], rect_b[1]),
+            max(rect_a[2], rect_b[2]), max(rect_a[3], rect_b[3]))
+
+
+class FrameSink:
+    """
+    Базовый интерфейс приемника кадров виртуальной камеры.
+    Приемник владеет областью памяти с заголовком SharedVideoBuffer и одним или несколькими слотами кадров,
+    записывает в нее кадры (write_frame) и сигнализирует потребителю о новом кадре.
+    """
+    # Понимает ли потребитель этого приемника кольцевой буфер (протокол v2). Если нет, приемник работает только
+    # с одиночным буфером, а композиция прямо в слот общей памяти недоступна
+    consumer_reads_ring = True
+
+    def __init__(self, slot_count: int = 1):
+        if not 1 <= slot_count <= MAX_RING_SLOTS:
+            raise ValueError(f"Количество слотов должно быть от 1 до {MAX_RING_SLOTS}.")
+        if slot_count > 1 and not self.consumer_reads_ring:
+            raise ValueError(f"{type(self).__name__}: потребитель читает только одиночный буфер, кольцо недоступно.")
+        self.slot_count = slot_count
+        self.width = 0
+        self.height = 0
+        self.fps = 0
+        self.slot_views = []  # NumPy массивы (height x width x 3) поверх каждого слота общей памяти
+        self._buffer = None  # memoryview всей области общей памяти
+        self._sequence = 0  # Номер последнего опубликованного кадра
+        self._pending_sequence = 0  # Номер кадра, который сейчас пишется в слот (между begin_frame и publish_frame)
+        # Для каждого слота: область, которая устарела с момента последней записи в этот слот ("FULL" = весь кадр)
+        self._slot_stale_rects = []
+
+    @property
+    def shared_memory_size(self) -> int:
+        return get_shared_memory_size(self.slot_count)
+
+    def open(self, width: int, height: int, fps: int):
+        """Открывает/создает общую память и объект сигнализации. Бросает исключение при ошибке."""
+        raise NotImplementedError
+
+    def _notify(self):
+        """Будит потребителя (событие Win32, FIFO и т.д.)."""
+        raise NotImplementedError
+
+    def close(self):
+        """Освобождает общую память и объект сигнализации."""
+        raise NotImplementedError
+
+    @property
+    def is_open(self) -> bool:
+        return self._buffer is not None
+
+    @property
+    def frame_view(self) -> np.ndarray | None:
+        """Слот, в котором лежит последний опубликованный кадр."""
+        if not self.slot_views:
+            return None
+        return self.slot_views[self._sequence % self.slot_count]
+
+    @property
+    def supports_direct_write(self) -> bool:
+        """
+        Можно ли композировать кадр прямо в слот общей памяти.
+        Только для кольцевого буфера, который читает потребитель (consumer_reads_ring): в одиночном буфере
+        потребитель может прочитать недорисованный кадр, поэтому там нужен write_frame.
+        """
+        return self.consumer_reads_ring and self.slot_count > 1
+
+    def begin_frame(self) -> tuple[int, np.ndarray]:
+        """
+        Выбирает следующий слот для записи и помечает его занятым.
+        Возвращает (номер слота, NumPy представление слота). Кадр публикуется вызовом publish_frame.
+        """
+        sequence = (self._sequence + 1) & 0xFFFFFFFF or 1  # 0 зарезервирован как "слот занят"
+        slot = sequence % self.slot_count
+        if self.slot_count > 1:
+            struct.pack_into("<I", self._buffer, RING_SLOT_SEQ_OFFSET + 4 * slot, 0)
+        self._pending_sequence = sequence
+        return slot, self.slot_views[slot]
+
+    def publish_frame(self, dirty_rect: tuple | None = None, signal: bool = True):
+        """
+        Публикует кадр, записанный в слот после begin_frame.
+        dirty_rect (x1, y1, x2, y2) - область, изменившаяся с прошлого кадра; None - изменился весь кадр.
+        signal=False - потребитель не будится, вызывающий сам вызовет signal_frame_ready().
+        """
+        if dirty_rect is None:
+            dirty_rect = (0, 0, self.width, self.height)
+        sequence = self._pending_sequence
+        slot = sequence % self.slot_count
+        for other_slot in range(self.slot_count):
+            if other_slot == slot:
+                self._slot_stale_rects[other_slot] = None
+            elif self._slot_stale_rects[other_slot] != "FULL":
+                self._slot_stale_rects[other_slot] = union_rects(self._slot_stale_rects[other_slot], dirty_rect)
+
+        self._sequence = sequence
+        if self.slot_count > 1:
+            struct.pack_into("<I", self._buffer, RING_SLOT_SEQ_OFFSET + 4 * slot, sequence)
+        if signal:
+            self.signal_frame_ready()
+
+    def write_frame(self, frame: np.ndarray, dirty_rect: tuple | None = None, signal: bool = True):
+        """
+        Копирует готовый кадр в следующий слот и публикует его.
+        dirty_rect (x1, y1, x2, y2) - область, изменившаяся с прошлого кадра; None - кадр записывается целиком.
+        В слот копируется только область, устаревшая с момента его последней записи.
+        """
+        slot, slot_view = self.begin_frame()
+        stale_rect = self._slot_stale_rects[slot]
+        if stale_rect == "FULL" or dirty_rect is None:
+            stale_rect = (0, 0, self.width, self.height)
+        else:
+            stale_rect = union_rects(stale_rect, dirty_rect)
+
+        x1, y1, x2, y2 = stale_rect
+        slot_view[y1:y2, x1:x2] = frame[y1:y2, x1:x2]
+        self.publish_frame(dirty_rect, signal)
+
+    def signal_frame_ready(self):
+        """Публикует последний записанный кадр одной 4-байтной записью и будит потребителя."""
+        if self.slot_count > 1:
+            struct.pack_into("<I", self._buffer, RING_LATEST_SEQ_OFFSET, self._sequence)
+        else:
+            struct.pack_into("<I", self._buffer, FRAME_READY_OFFSET, 1)  # frameReady = 1
+        self._notify()
+
+    def _attach_buffer(self, shared_map, width: int, height: int, fps: int):
+        """Создает представления поверх общей памяти и записывает начальный заголовок."""
+        frame_size = width * height * 3
+        if frame_size > MAX_BUFFER_SIZE:
+            raise ValueError(f"Кадр {width}x{height} не помещается в буфер общей памяти ({MAX_BUFFER_SIZE} байт).")
+
+        self.width, self.height, self.fps = width, height, fps
+        self._buffer = memoryview(shared_map)
+        if self.slot_count > 1:
+            slot_offsets = [RING_DATA_OFFSET + slot * RING_SLOT_STRIDE for slot in range(self.slot_count)]
+        else:
+            slot_offsets = [SHARED_BUFFER_HEADER_SIZE]
+        self.slot_views = [np.frombuffer(shared_map, dtype=np.uint8, count=frame_size,
+                                         offset=offset).reshape((height, width, 3)) for offset in slot_offsets]
+        self._slot_stale_rects = ["FULL"] * self.slot_count
+        self._sequence = 0
+
+        # Формат: width, height, fps, format (0=RGB24), frameSize, frameReady
+        # frameReady = 0, так как кадр еще не отправлен
+        struct.pack_into(SHARED_BUFFER_HEADER_FORMAT, self._buffer, 0, width, height, fps,
+                         FRAME_FORMAT_RGB24, frame_size, 0)
+        if self.slot_count > 1:
+            struct.pack_into(RING_HEADER_FORMAT, self._buffer, RING_HEADER_OFFSET, RING_MAGIC, RING_VERSION,
+                             self.slot_count, RING_SLOT_STRIDE, 0)
+            struct.pack_into(f"<{MAX_RING_SLOTS}I", self._buffer, RING_SLOT_SEQ_OFFSET, *([0] * MAX_RING_SLOTS))
+
+    def _detach_buffer(self):
+        """Освобождает представления, чтобы mmap можно было закрыть."""
+        self.slot_views = []
+        if self._buffer is not None:
+            self._buffer.release()
+            self._buffer = None
+
+
+class Win32SharedMemorySink(FrameSink):
+    """
+    Именованная общая память Windows (mmap tagname) и именованное Win32 Event, которые читает DLL камеры.
+    Зарегистрированная DLL читает только одиночный буфер (протокол v1, без номеров кадров), поэтому кольцо
+    и композиция прямо в слот здесь недоступны. Кадр копируется в буфер целиком через write_frame, и DLL
+    по-прежнему может прочитать кадр, который в этот момент перезаписывается: защита от разрыва кадра
+    действует только для потребителей кольцевого буфера.
+    """
+    consumer_reads_ring = False
+
+    def __init__(self, shared_mem_name: str = SHARED_MEM_NAME, event_name: str = NEW_FRAME_EVENT_NAME,
+                 slot_count: int = 1):
+        super().__init__(slot_count)
+        self.shared_mem_name = shared_mem_name
+        self.event_name = event_name
+        self._shared_memory_map = None
+        self._new_frame_event = None
+
+    def open(self, width: int, height: int, fps: int):
+        if win32event is None:
+            raise RuntimeError("Модуль pywin32 недоступен. Установите его (`pip install pywin32`).")
+
+        # Открытие/создание memory-mapped file
+        try:
+            self._shared_memory_map = mmap.mmap(-1, self.shared_memory_size, tagname=self.shared_mem_name)
+            print(f"  Открыт существующий Memory-Mapped File: {self.shared_mem_name}")
+        except Exception as e:  # Catch any error, typically FileNotFoundError on first run
+            print(f"  Не удалось открыть существующий Memory-Mapped File, попытка создания: {e}")
+            self._shared_memory_map = mmap.mmap(-1, self.shared_memory_size, tagname=self.shared_mem_name,
+                                                access=mmap.ACCESS_WRITE)
+            print(f"  Создан новый Memory-Mapped File: {self.shared_mem_name}")
+
+        # Открытие/создание Win32 Event
+        try:
+            self._new_frame_event = win32event.OpenEvent(win32event.EVENT_ALL_ACCESS, False, self.event_name)
+            print(f"  Открыто существующее Win32 Event: {self.event_name}")
+        except pywintypes.error as e:
+            if e.winerror == 2:  # ERROR_FILE_NOT_FOUND (Event not found)
+                print(f"  Не удалось открыть существующее Win32 Event, попытка создания: {e}")
+                self._new_frame_event = win32event.CreateEvent(None, False, False, self.event_name)
+                print(f"  Создано новое Win32 Event: {self.event_name}")
+            else:
+                raise e  # Перебрасываем другие ошибки Win32
+
+        self._attach_buffer(self._shared_memory_map, width, height, fps)
+
+    def _notify(self):
+        win32event.SetEvent(self._new_frame_event)
+
+    def close(self):
+        if self._shared_memory_map is not None:
+            print("  Закрытие общей памяти...")
+            try:
+                # mmap нельзя закрыть, пока на него существуют экспортированные представления
+                self._detach_buffer()
+                self._shared_memory_map.close()
+                print("  Общая память закрыта.")
+            except Exception as e:
+                print(f"  Ошибка при закрытии общей памяти: {e}")
+            self._shared_memory_map = None
+
+        if self._new_frame_event is not None:
+            print("  Закрытие Win32 Event...")
+            try:
+                win32api.CloseHandle(self._new_frame_event)
+                print("  Win32 Event закрыт.")
+            except Exception as e:
+                print(f"  Ошибка при закрытии Win32 Event: {e}")
+            self._new_frame_event = None
+
+
+class PosixSharedMemorySink(FrameSink):
+    """
+    Файловая общая память в /dev/shm для Linux (сборочные и тестовые машины).
+    Кадры лежат в файле с тем же заголовком SharedVideoBuffer, а о новом кадре сообщает байт,
+    записанный в именованный FIFO. Читатель в другом процессе использует PosixSharedMemoryReader.
+    """
+
+    def __init__(self, shared_mem_name: str = SHARED_MEM_NAME, event_name: str = NEW_FRAME_EVENT_NAME,
+                 directory: str = POSIX_SHARED_MEM_DIR, slot_count: int = DEFAULT_RING_SLOT_COUNT):
+        super().__init__(slot_count)
+        self.shared_mem_path = os.path.join(directory, shared_mem_name)
+        self.fifo_path = os.path.join(directory, f"{event_name}.fifo")
+        self._shared_memory_map = None
+        self._fifo_fd = None
+
+    def open(self, width: int, height: int, fps: int):
+        fd = os.open(self.shared_mem_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            os.ftruncate(fd, self.shared_memory_size)
+            self._shared_memory_map = mmap.mmap(fd, self.shared_memory_size, access=mmap.ACCESS_WRITE)
+        finally:
+            os.close(fd)
+        print(f"  Открыта общая память: {self.shared_mem_path}")
+
+        if not os.path.exists(self.fifo_path):
+            os.mkfifo(self.fifo_path, 0o600)
+        # O_RDWR не блокируется при отсутствии читателя и держит FIFO открытым
+        self._fifo_fd = os.open(self.fifo_path, os.O_RDWR | os.O_NONBLOCK)
+        print(f"  Открыт FIFO сигнализации кадров: {self.fifo_path}")
+
+        self._attach_buffer(self._shared_memory_map, width, height, fps)
+
+    def _notify(self):
+        try:
+            os.write(self._fifo_fd, b"\x01")
+        except BlockingIOError:
+            pass  # Читатель отстает, непрочитанных сигналов уже достаточно, чтобы он проснулся
+
+    def close(self):
+        if self._shared_memory_map is not None:
+            print("  Закрытие общей памяти...")
+            try:
+                self._detach_buffer()
+                self._shared_memory_map.close()
+                print("  Общая память закрыта.")
+            except Exception as e:
+                print(f"  Ошибка при закрытии общей памяти: {e}")
+            self._shared_memory_map = None
+
+        if self._fifo_fd is not None:
+            try:
+                os.close(self._fifo_fd)
+            except OSError as e:
+                print(f"  Ошибка при закрытии FIFO: {e}")
+            self._fifo_fd = None
+
+
+class PosixSharedMemoryReader:
+    """
+    Читатель кадров из PosixSharedMemorySink для локального процесса-потребителя (например, тестов пропускной способности).
+    Понимает и одиночный буфер, и кольцевой буфер (протокол v2).
+    """
+
+    def __init__(self, shared_mem_name: str = SHARED_MEM_NAME, event_name: str = NEW_FRAME_EVENT_NAME,
+                 directory: str = POSIX_SHARED_MEM_DIR):
+        self.shared_mem_path = os.path.join(directory, shared_mem_name)
+        self.fifo_path = os.path.join(directory, f"{event_name}.fifo")
+        self._shared_memory_map = None
+        self._fifo_fd = None
+        self.last_sequence = 0  # Номер последнего прочитанного кадра (для кольцевого буфера)
+        self.torn_reads = 0  # Сколько копий было отброшено, потому что писатель перезаписал слот во время чтения
+
+    def open(self):
+        with open(self.shared_mem_path, "r+b") as f:
+            self._shared_memory_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE)
+        self._fifo_fd = os.open(self.fifo_path, os.O_RDONLY | os.O_NONBLOCK)
+
+    def read_header(self) -> tuple:
+        """Возвращает заголовок (width, height, fps, format, frameSize, frameReady)."""
+        return struct.unpack_from(SHARED_BUFFER_HEADER_FORMAT, self._shared_memory_map, 0)
+
+    def _read_ring_header(self) -> tuple | None:
+        """Возвращает заголовок кольца (magic, version, slotCount, slotStride, latestSeq) или None для одиночного буфера."""
+        if len(self._shared_memory_map) < RING_DATA_OFFSET:
+            return None
+        ring_header = struct.unpack_from(RING_HEADER_FORMAT, self._shared_memory_map, RING_HEADER_OFFSET)
+        return ring_header if ring_header[0] == RING_MAGIC else None
+
+    def wait_for_frame(self, timeout: float | None = None) -> np.ndarray | None:
+        """
+        Ждет сигнала нового кадра и возвращает копию кадра (height x width x 3).
+        None, если за timeout секунд целый кадр не пришел.
+        """
+        readable, _, _ = select.select([self._fifo_fd], [], [], timeout)
+        if not readable:
+            return None
+        try:
+            while os.read(self._fifo_fd, 4096):  # Забираем все накопившиеся сигналы
+                pass
+        except BlockingIOError:
+            pass
+
+        width, height, _, _, frame_size, _ = self.read_header()
+        ring_header = self._read_ring_header()
+        if ring_header is None:
+            frame = np.frombuffer(self._shared_memory_map, dtype=np.uint8, count=frame_size,
+                                  offset=SHARED_BUFFER_HEADER_SIZE).reshape((height, width, 3)).copy()
+            # frameReady = 0: кадр прочитан (как это делает DLL камеры)
+            struct.pack_into("<I", self._shared_memory_map, FRAME_READY_OFFSET, 0)
+            return frame
+
+        _, _, slot_count, slot_stride, sequence = ring_header
+        slot = sequence % slot_count
+        seq_offset = RING_SLOT_SEQ_OFFSET + 4 * slot
+        if sequence == 0 or struct.unpack_from("<I", self._shared_memory_map, seq_offset)[0] != sequence:
+            self.torn_reads += 1
+            return None
+        frame = np.frombuffer(self._shared_memory_map, dtype=np.uint8, count=frame_size,
+                              offset=RING_DATA_OFFSET + slot * slot_stride).reshape((height, width, 3)).copy()
+        if struct.unpack_from("<I", self._shared_memory_map, seq_offset)[0] != sequence:
+            self.torn_reads += 1  # Писатель успел перезаписать слот во время копирования
+            return None
+        self.last_sequence = sequence
+        return frame
+
+    def close(self):
+        if self._fifo_fd is not None:
+            os.close(self._fifo_fd)
+            self._fifo_fd = None
+        if self._shared_memory_map is not None:
+            self._shared_memory_map.close()
+            self._shared_memory_map = None
+
+
+def create_frame_sink() -> FrameSink:
+    """
+    Создает приемник кадров для текущей платформы: Win32 на Windows (одиночный буфер для DLL камеры,
+    без защиты от разрыва кадра), /dev/shm + FIFO с кольцевым буфером на остальных.
+    """
+    if sys.platform == "win32":
+        return Win32SharedMemorySink()
+    return PosixSharedMemorySink()
@@ -0,0 +1,354 @@
+import threading  # Для фонового потока предзагрузки кадров
+import queue  # Очередь заданий предзагрузки
+import itertools  # Монотонные токены источников кадров
+from collections import OrderedDict  # LRU кэш декодированных кадров
+
+import numpy as np
+import cv2
+from PIL import Image, ImageSequence
+
+# --- НАСТРОЙКИ КЭША КАДРОВ ---
+DEFAULT_MEMORY_BUDGET_MB = 512  # Бюджет памяти на декодированные кадры ленивых источников
+DEFAULT_PREFETCH_COUNT = 4  # Сколько следующих кадров декодировать заранее в фоновом потоке
+
+# Токены источников кадров для ключей кэша. В отличие от id(), токен никогда не достается новому источнику,
+# поэтому кадры закрытого источника не могут быть выданы источнику, созданному после него
+_source_tokens = itertools.count(1)
+
+
+def _entry_size(value) -> int:
+    """Размер записи кэша в байтах: массив NumPy или кортеж массивов."""
+    if isinstance(value, tuple):
+        return sum(item.nbytes for item in value if isinstance(item, np.ndarray))
+    return value.nbytes
+
+
+class FrameCache:
+    """
+    LRU кэш декодированных кадров, общий для всех ленивых источников, с ограничением по памяти в байтах.
+    Также владеет фоновым потоком, который заранее декодирует следующие кадры (lookahead prefetch).
+    """
+
+    def __init__(self, memory_budget_bytes: int = DEFAULT_MEMORY_BUDGET_MB * 1024 * 1024):
+        self.memory_budget_bytes = memory_budget_bytes
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # (токен источника, индекс кадра) -> кадр
+        self._closed_owners = set()  # Токены закрытых источников: их кадры больше не принимаются
+        self._lock = threading.Lock()
+        self._prefetch_queue = queue.Queue()
+        self._prefetch_pending = set()
+        self._prefetch_thread = None
+
+    def get(self, key):
+        """Возвращает кадр из кэша (и отмечает его как недавно использованный) или None."""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def contains(self, key) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def put(self, key, value):
+        """
+        Кладет кадр в кэш и вытесняет давно не использованные кадры, пока не уложится в бюджет.
+        Кадр источника, который уже закрыт (например, его декодировал поток предзагрузки после close()), отбрасывается.
+        """
+        size = _entry_size(value)
+        with self._lock:
+            if key[0] in self._closed_owners:
+                return
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.used_bytes -= _entry_size(previous)
+            self._entries[key] = value
+            self.used_bytes += size
+            # Последний положенный кадр не вытесняем, даже если он один больше бюджета
+            while self.used_bytes > self.memory_budget_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self.used_bytes -= _entry_size(evicted)
+                self.evictions += 1
+
+    def discard_owner(self, owner_token: int):
+        """Удаляет из кэша все кадры указанного источника; последующие put() для него игнорируются."""
+        with self._lock:
+            self._closed_owners.add(owner_token)
+            for key in [key for key in self._entries if key[0] == owner_token]:
+                self.used_bytes -= _entry_size(self._entries.pop(key))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.used_bytes = 0
+
+    def request_prefetch(self, source: "LazyFrameSource", frame_index: int):
+        """Ставит кадр в очередь фоновой предзагрузки (повторные запросы одного кадра игнорируются)."""
+        key = (source.cache_token, frame_index)
+        with self._lock:
+            if key in self._entries or key in self._prefetch_pending or source.cache_token in self._closed_owners:
+                return
+            self._prefetch_pending.add(key)
+            if self._prefetch_thread is None or not self._prefetch_thread.is_alive():
+                self._prefetch_thread = threading.Thread(target=self._prefetch_worker, daemon=True)
+                self._prefetch_thread.start()
+        self._prefetch_queue.put((source, frame_index))
+
+    def stop(self):
+        """Останавливает поток предзагрузки и очищает кэш."""
+        thread = self._prefetch_thread
+        if thread is not None and thread.is_alive():
+            self._prefetch_queue.put(None)
+            thread.join(timeout=1.0)
+        self._prefetch_thread = None
+        with self._lock:
+            self._prefetch_pending.clear()
+        self.clear()
+
+    def _prefetch_worker(self):
+        while True:
+            task = self._prefetch_queue.get()
+            if task is None:
+                break
+            source, frame_index = task
+            try:
+                if not source.closed:
+                    source.load(frame_index)
+            except Exception as e:
+                print(f"ПРЕДУПРЕЖДЕНИЕ: Не удалось заранее декодировать кадр {frame_index}: {e}")
+            finally:
+                with self._lock:
+                    self._prefetch_pending.discard((source.cache_token, frame_index))
+
+
+def resize_interpolation(frame_size: tuple[int, int], target_size: tuple[int, int]) -> int:
+    """
+    Интерполяция cv2 для масштабирования кадра размера frame_size к target_size (ширина, высота):
+    уменьшение через INTER_AREA (без муара и ступенек), увеличение - через INTER_CUBIC.
+    """
+    return cv2.INTER_AREA if target_size[0] * target_size[1] < frame_size[0] * frame_size[1] else cv2.INTER_CUBIC
+
+
+def _resize_to_target(frame: np.ndarray, target_size: tuple[int, int] | None) -> np.ndarray:
+    """
+    Масштабирует кадр к target_size (ширина, высота), если он задан и отличается от размера кадра.
+    Интерполяция та же, что при масштабировании целого стека кадров (resize_interpolation).
+    """
+    frame_size = (frame.shape[1], frame.shape[0])
+    if target_size is not None and frame_size != target_size:
+        frame = cv2.resize(frame, target_size, interpolation=resize_interpolation(frame_size, target_size))
+    return frame
+
+
+class GifFrameDecoder:
+    """
+    Декодирует кадры анимированного изображения по индексу.
+    PIL декодирует GIF последовательно и не потокобезопасен, поэтому доступ к файлу сериализуется блокировкой.
+    При воспроизведении кадры запрашиваются по порядку, так что перемотка назад случается только при зацикливании.
+    """
+
+    def __init__(self, path: str, mode: str, target_size: tuple[int, int] | None = None):
+        self.path = path
+        self.mode = mode
+        self.target_size = target_size  # (ширина, высота) или None, если масштабировать не нужно
+        self._image = Image.open(path)
+        self._lock = threading.Lock()
+
+    def __call__(self, frame_index: int) -> np.ndarray:
+        with self._lock:
+            self._image.seek(frame_index)
+            frame = np.array(self._image.convert(self.mode))
+        return _resize_to_target(frame, self.target_size)
+
+    def close(self):
+        with self._lock:
+            if self._image is not None:
+                self._image.close()
+                self._image = None
+
+
+class MappedFrameDecoder:
+    """
+    Кадры по индексу из стека N x H x W x C, отображенного в память (запись дискового кэша кадров).
+    Кадр копируется из отображения только при обращении, поэтому в памяти процесса находятся лишь кадры из FrameCache.
+    """
+
+    def __init__(self, frames: np.ndarray, target_size: tuple[int, int] | None = None):
+        self.target_size = target_size  # (ширина, высота) или None, если масштабировать не нужно
+        self._frames = frames
+
+    def __call__(self, frame_index: int) -> np.ndarray:
+        return _resize_to_target(np.array(self._frames[frame_index]), self.target_size)
+
+    def close(self):
+        self._frames = None  # Отображение закрывается, когда на него не остается ссылок
+
+
+class LazyFrameSource:
+    """
+    Последовательность кадров, которые декодируются по требованию и хранятся в общем FrameCache.
+    Поддерживает len(), индексацию и bool, поэтому может использоваться вместо списка кадров.
+    После обращения к кадру следующие prefetch_count кадров декодируются в фоновом потоке.
+    """
+
+    def __init__(self, decode_frame, frame_count: int, cache: FrameCache,
+                 prefetch_count: int = DEFAULT_PREFETCH_COUNT, on_close=None):
+        self._decode_frame = decode_frame  # Функция: индекс кадра -> кадр
+        self._frame_count = frame_count
+        self._cache = cache
+        self._prefetch_count = prefetch_count
+        self._on_close = on_close
+        self.cache_token = next(_source_tokens)  # Ключ кадров источника в FrameCache
+        self.closed = False
+
+    def __len__(self) -> int:
+        return self._frame_count
+
+    def __getitem__(self, frame_index: int):
+        if frame_index < 0:
+            frame_index += self._frame_count
+        if not 0 <= frame_index < self._frame_count:
+            raise IndexError(f"Индекс кадра {frame_index} вне диапазона 0..{self._frame_count - 1}")
+
+        frame = self.load(frame_index)
+        for step in range(1, min(self._prefetch_count, self._frame_count - 1) + 1):
+            self._cache.request_prefetch(self, (frame_index + step) % self._frame_count)
+        return frame
+
+    def __iter__(self):
+        for frame_index in range(self._frame_count):
+            yield self[frame_index]
+
+    def load(self, frame_index: int):
+        """Возвращает кадр из кэша, декодируя его при промахе (без предзагрузки следующих кадров)."""
+        key = (self.cache_token, frame_index)
+        frame = self._cache.get(key)
+        if frame is None:
+            frame = self._decode_frame(frame_index)
+            self._cache.put(key, frame)
+        return frame
+
+    def close(self):
+        """Освобождает кадры источника в кэше и закрывает декодер."""
+        if self.closed:
+            return
+        self.closed = True
+        self._cache.discard_owner(self.cache_token)
+        if self._on_close is not None:
+            self._on_close()
+
+
+class PaletteFrames:
+    """
+    Компактное хранение кадров анимации: плоскость индексов (N x H x W, uint8) и палитра каждого кадра (N x 256 x C).
+    Занимает в C раз меньше памяти, чем полные кадры. Кадр разворачивается через таблицу палитры (LUT)
+    только при обращении к нему; последний развернутый кадр запоминается, поэтому повторные обращения
+    к тому же кадру (фон между сменами кадров GIF) ничего не стоят.
+    Поддерживает len(), индексацию, итерацию и shape, поэтому может использоваться вместо стека кадров.
+    """
+
+    def __init__(self, indices: np.ndarray, palettes: np.ndarray):
+        self.indices = indices
+        self.palettes = palettes
+        self._last_expanded = (None, None)  # (индекс кадра, развернутый кадр)
+
+    @property
+    def shape(self) -> tuple:
+        return (*self.indices.shape, self.palettes.shape[2])
+
+    @property
+    def nbytes(self) -> int:
+        return self.indices.nbytes + self.palettes.nbytes
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __getitem__(self, frame_index: int) -> np.ndarray:
+        if frame_index < 0:
+            frame_index += len(self.indices)
+        cached_index, cached_frame = self._last_expanded
+        if cached_index == frame_index:
+            return cached_frame
+        frame = np.take(self.palettes[frame_index], self.indices[frame_index], axis=0)
+        # Кортеж подменяется целиком, поэтому читатели из других потоков видят согласованную пару
+        self._last_expanded = (frame_index, frame)
+        return frame
+
+    def __iter__(self):
+        for frame_index in range(len(self.indices)):
+            yield np.take(self.palettes[frame_index], self.indices[frame_index], axis=0)
+
+
+def _palettize_frame(image: Image.Image) -> tuple[np.ndarray, np.ndarray] | None:
+    """
+    Переводит RGB кадр в плоскость индексов (H x W) и палитру (256 x 3) без потерь.
+    Возвращает None, если в кадре больше 256 цветов или кадр не совпадает с исходным после разворачивания.
+    """
+    if image.getcolors(256) is None:  # Больше 256 цветов
+        return None
+    palette_image = image.convert("P", palette=Image.Palette.ADAPTIVE, colors=256)
+    palette = np.zeros((256, 3), dtype=np.uint8)
+    used_colors = np.array(palette_image.getpalette("RGB") or [], dtype=np.uint8).reshape(-1, 3)[:256]
+    palette[:len(used_colors)] = used_colors
+    indices = np.asarray(palette_image)
+    if not np.array_equal(np.take(palette, indices, axis=0), np.asarray(image)):
+        return None
+    return indices, palette
+
+
+def decode_palette_frames(path: str, target_size: tuple[int, int] | None = None) -> PaletteFrames | None:
+    """
+    Декодирует анимированный GIF сразу в PaletteFrames (RGB) по одному кадру:
+    полный стек кадров не создается, выделяются только индексы (N x H x W) и палитры (N x 256 x 3).
+    Плоскости индексов масштабируются к target_size (ширина, высота) ближайшим соседом (INTER_NEAREST),
+    поскольку интерполяция индексов палитры дала бы цвета, которых нет в кадре.
+    Возвращает None, если хотя бы один кадр содержит больше 256 цветов.
+    """
+    with Image.open(path) as im:
+        frame_count = getattr(im, "n_frames", 1)
+        width, height = target_size if target_size is not None else im.size
+        indices = np.empty((frame_count, height, width), dtype=np.uint8)
+        palettes = np.zeros((frame_count, 256, 3), dtype=np.uint8)
+        for frame_index, frame in enumerate(ImageSequence.Iterator(im)):
+            palettized = _palettize_frame(frame.convert("RGB"))
+            if palettized is None:
+                return None
+            frame_indices, palettes[frame_index] = palettized
+            if frame_indices.shape != (height, width):
+                frame_indices = cv2.resize(frame_indices, (width, height), interpolation=cv2.INTER_NEAREST)
+            indices[frame_index] = frame_indices
+    return PaletteFrames(indices, palettes)
+
+
+def probe_animation(path: str) -> tuple[int, tuple[int, int], list[float], float]:
+    """
+    Читает параметры анимации без сохранения кадров.
+    Возвращает (количество кадров, (ширина, высота), длительности кадров в секундах, FPS из заголовка или 0).
+    """
+    with Image.open(path) as im:
+        size = (im.width, im.height)
+        header_fps = 1000.0 / im.info['duration'] if im.info.get('duration', 0) > 0 else 0.0
+        durations = [frame.info.get("duration", 100) / 1000.0 for frame in ImageSequence.Iterator(im)]
+    return len(durations), size, durations, header_fps
+
+
+def open_lazy_frames(path: str, mode: str, frame_count: int, cache: FrameCache,
+                     target_size: tuple[int, int] | None = None,
+                     prefetch_count: int = DEFAULT_PREFETCH_COUNT) -> LazyFrameSource:
+    """Создает ленивый источник кадров файла path в цветовом режиме mode ("RGB" или "RGBA")."""
+    decoder = GifFrameDecoder(path, mode, target_size)
+    return LazyFrameSource(decoder, frame_count, cache, prefetch_count, on_close=decoder.close)
+
+
+def open_lazy_mapped_frames(frames: np.ndarray, cache: FrameCache, target_size: tuple[int, int] | None = None,
+                            prefetch_count: int = DEFAULT_PREFETCH_COUNT) -> LazyFrameSource:
+    """Создает ленивый источник поверх стека кадров, отображенного в память, не копируя весь стек."""
+    decoder = MappedFrameDecoder(frames, target_size)
+    return LazyFrameSource(decoder, len(frames), cache, prefetch_count, on_close=decoder.close)
@@ -5,8 +5,6 @@ import cv2
 import numpy as np
 from PIL import Image
 from io import BytesIO
-import threading
-import asyncio
 import queue
 
 # Импортируем PyQt5
@@ -909,35 +907,26 @@ class CameraWindow(QWidget):
         self.load_window_state()
         self._update_main_container_style()
         self._update_demo_image_with_status_circle()
-        self.camera_thread = None
 
     def start_camera_thread(self):
         """Starts the virtual camera frame sending thread."""
-        if self.camera_thread and self.camera_thread.is_alive():
+        # Поток рендеринга принадлежит virtual_camera и всегда один: обычно он уже запущен initialize_virtual_camera
+        if virtual_camera.is_render_thread_running():
             print("GUI: Поток камеры уже запущен.")
             return
         print("GUI: Запуск нового потока камеры...")
-        def run_virtual_camera_asyncio():
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(virtual_camera.start_frame_sending_loop())
-            loop.close()
-        self.camera_thread = threading.Thread(target=run_virtual_camera_asyncio)
-        self.camera_thread.daemon = True
-        self.camera_thread.start()
+        virtual_camera.start_render_thread()
         print("GUI: Поток камеры запущен.")
 
     def stop_camera_thread(self):
         """Stops the virtual camera frame sending thread."""
-        if self.camera_thread and self.camera_thread.is_alive():
+        if virtual_camera.is_render_thread_running():
             print("GUI: Сигнализирую потоку камеры об остановке...")
-            virtual_camera.shutdown_virtual_camera()
-            self.camera_thread.join(timeout=5)
-            if self.camera_thread.is_alive():
-                print("ПРЕДУПРЕЖДЕНИЕ: Поток камеры не завершился в течение таймаута.")
-            else:
+            if virtual_camera.stop_render_thread(timeout=5):
                 print("GUI: Поток камеры успешно остановлен.")
-            self.camera_thread = None
+            else:
+                print("ПРЕДУПРЕЖДЕНИЕ: Поток камеры не завершился в течение таймаута.")
+            virtual_camera.shutdown_virtual_camera()
         else:
             print("GUI: Нет активного потока камеры для остановки.")
 
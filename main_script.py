@@ -8,6 +8,7 @@ from io import BytesIO
 import threading  # Для запуска асинхронной логики в отдельном потоке
 import atexit  # Импортируем atexit для регистрации функции завершения
 import webbrowser  # Импортируем webbrowser для открытия ссылок
+import multiprocessing  # freeze_support() для процессов пула декодирования ассетов в собранном приложении
 
 import aiohttp
 from PIL import Image
@@ -326,6 +327,8 @@ def start_playwright_thread(playwright_api_instance: type[Playwright], user_id:
 
 # --- Главная точка входа скрипта ---
 if __name__ == "__main__":
+    # Нужно собранному (frozen) приложению для запуска процессов пула декодирования ассетов
+    multiprocessing.freeze_support()
     # Настраиваем логирование в файл как можно раньше
     logging_manager.setup_logging()
     # Устанавливаем кастомный обработчик исключений, чтобы они тоже писались в лог
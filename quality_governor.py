@@ -0,0 +1,118 @@
+from collections import deque  # Скользящее окно времени работы кадра
+
+# Уровни качества: каждый следующий включает все упрощения предыдущих
+QUALITY_FULL = 0
+QUALITY_NO_CROSS_FADE = 1  # Смена статуса без кроссфейда
+QUALITY_COARSE_BOUNCE = 2  # Смещение подпрыгивания берется из ближайшего четного кадра кривой
+QUALITY_HALF_ANIMATION_RATE = 3  # Кадры анимаций переключаются не чаще, чем раз в два кадра камеры
+QUALITY_HALF_FPS = 4  # Кадры камеры отправляются с половинной частотой
+MAX_QUALITY_LEVEL = QUALITY_HALF_FPS
+
+QUALITY_LEVEL_NAMES = {
+    QUALITY_FULL: "полное качество",
+    QUALITY_NO_CROSS_FADE: "без кроссфейда",
+    QUALITY_COARSE_BOUNCE: "упрощенное подпрыгивание",
+    QUALITY_HALF_ANIMATION_RATE: "половинная частота анимаций",
+    QUALITY_HALF_FPS: "половинный FPS камеры",
+}
+
+STEP_DOWN_LOAD = 0.85  # Понижение качества, если время работы кадра превышает эту долю бюджета
+STEP_UP_LOAD = 0.5  # Повышение качества, если время работы кадра меньше этой доли бюджета
+STEP_DOWN_WINDOW_FRAMES = 30  # Кадров для решения о понижении (~0.5 с при 60 FPS)
+STEP_UP_WINDOW_FRAMES = 180  # Кадров с запасом для решения о повышении (~3 с при 60 FPS)
+MAX_STEP_UP_BACKOFF = 8  # Во сколько раз максимум растет окно повышения после неудачных попыток
+LOAD_PERCENTILE = 90  # Перцентиль времени работы кадра, по которому оценивается нагрузка
+
+
+class QualityGovernor:
+    """
+    Адаптивное качество цикла кадров: сравнивает время работы кадра (без ожидания дедлайна) с бюджетом 1/FPS
+    и при нехватке времени по одному шагу понижает уровень качества, а при запасе - повышает.
+    Нагрузка оценивается по LOAD_PERCENTILE-перцентилю окна, а не по среднему: кадры, пропущенные без изменений,
+    почти ничего не стоят и иначе скрывали бы перегрузку.
+    Повышение требует более длинного окна, чем понижение; если после повышения качество пришлось сразу
+    понизить снова, окно повышения удваивается, чтобы уровень не переключался туда-обратно.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.level = QUALITY_FULL
+        self.transitions = 0
+        self._work_times = deque(maxlen=STEP_UP_WINDOW_FRAMES * MAX_STEP_UP_BACKOFF)  # с
+        self._frames_at_level = 0
+        self._step_up_backoff = 1
+        self._last_change_was_step_up = False
+
+    def set_enabled(self, enabled: bool):
+        """Включает или выключает адаптацию; при выключении сразу возвращается полное качество."""
+        self.enabled = enabled
+        if not enabled and self.level != QUALITY_FULL:
+            self._set_level(QUALITY_FULL, "адаптивное качество выключено")
+
+    def _load_percentile(self, frame_count: int) -> float:
+        window = sorted(list(self._work_times)[-frame_count:])
+        return window[min(len(window) - 1, len(window) * LOAD_PERCENTILE // 100)]
+
+    def _set_level(self, level: int, reason: str):
+        print(f"Адаптивное качество: уровень {self.level} -> {level} ({QUALITY_LEVEL_NAMES[level]}), {reason}.")
+        self._last_change_was_step_up = level < self.level
+        self.level = level
+        self.transitions += 1
+        self._frames_at_level = 0
+        self._work_times.clear()
+
+    def record_frame(self, work_seconds: float, budget_seconds: float) -> bool:
+        """
+        Учитывает время работы очередного кадра и бюджет кадра (1 / целевой FPS).
+        Возвращает True, если уровень качества изменился.
+        """
+        if not self.enabled or budget_seconds <= 0:
+            return False
+        self._work_times.append(work_seconds)
+        self._frames_at_level += 1
+        if self._last_change_was_step_up and self._frames_at_level == STEP_UP_WINDOW_FRAMES:
+            self._step_up_backoff = 1  # Повышенный уровень продержался целое окно: задержка повышения не нужна
+
+        if self.level < MAX_QUALITY_LEVEL and self._frames_at_level >= STEP_DOWN_WINDOW_FRAMES:
+            load = self._load_percentile(STEP_DOWN_WINDOW_FRAMES) / budget_seconds
+            if load > STEP_DOWN_LOAD:
+                # Повышение не выдержало нагрузки: следующая попытка повышения будет позже
+                if self._last_change_was_step_up and self._frames_at_level < STEP_UP_WINDOW_FRAMES:
+                    self._step_up_backoff = min(self._step_up_backoff * 2, MAX_STEP_UP_BACKOFF)
+                self._set_level(self.level + 1, f"время кадра {load * budget_seconds * 1000:.2f} мс "
+                                                f"при бюджете {budget_seconds * 1000:.2f} мс")
+                return True
+
+        step_up_frames = STEP_UP_WINDOW_FRAMES * self._step_up_backoff
+        if self.level > QUALITY_FULL and self._frames_at_level >= step_up_frames:
+            load = self._load_percentile(step_up_frames) / budget_seconds
+            if load < STEP_UP_LOAD:
+                self._set_level(self.level - 1, f"время кадра {load * budget_seconds * 1000:.2f} мс "
+                                                f"при бюджете {budget_seconds * 1000:.2f} мс")
+                return True
+        return False
+
+    @property
+    def cross_fade_allowed(self) -> bool:
+        return self.level < QUALITY_NO_CROSS_FADE
+
+    @property
+    def coarse_bounce(self) -> bool:
+        return self.level >= QUALITY_COARSE_BOUNCE
+
+    @property
+    def animation_rate_divider(self) -> int:
+        return 2 if self.level >= QUALITY_HALF_ANIMATION_RATE else 1
+
+    @property
+    def fps_divider(self) -> int:
+        return 2 if self.level >= QUALITY_HALF_FPS else 1
+
+    def get_stats(self) -> dict:
+        """Текущий уровень качества, его название и количество переключений уровней."""
+        return {
+            "enabled": self.enabled,
+            "level": self.level,
+            "level_name": QUALITY_LEVEL_NAMES[self.level],
+            "transitions": self.transitions,
+        }
@@ -0,0 +1,119 @@
+import struct
+import sys
+
+import numpy as np
+import pytest
+
+import frame_sink
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="Бэкенд /dev/shm и FIFO доступны только вне Windows")
+
+WIDTH, HEIGHT, FPS = 64, 48, 30
+
+
+@pytest.fixture
+def open_sink(tmp_path):
+    """Открывает PosixSharedMemorySink во временном каталоге и читателя к нему; закрывает оба после теста."""
+    opened = []
+
+    def _open(slot_count: int):
+        sink = frame_sink.PosixSharedMemorySink(directory=str(tmp_path), slot_count=slot_count)
+        sink.open(WIDTH, HEIGHT, FPS)
+        reader = frame_sink.PosixSharedMemoryReader(directory=str(tmp_path))
+        reader.open()
+        opened.append((sink, reader))
+        return sink, reader
+
+    yield _open
+    for sink, reader in opened:
+        reader.close()
+        sink.close()
+
+
+def _random_frame(seed: int) -> np.ndarray:
+    return np.random.default_rng(seed).integers(0, 256, (HEIGHT, WIDTH, 3), dtype=np.uint8)
+
+
+def test_single_slot_frame_round_trip(open_sink):
+    sink, reader = open_sink(1)
+    frame = _random_frame(1)
+    sink.write_frame(frame)
+
+    assert reader.read_header() == (WIDTH, HEIGHT, FPS, frame_sink.FRAME_FORMAT_RGB24, WIDTH * HEIGHT * 3, 1)
+    received = reader.wait_for_frame(1.0)
+    assert received is not None
+    np.testing.assert_array_equal(received, frame)
+    # Читатель сбрасывает frameReady, как DLL камеры
+    assert reader.read_header()[5] == 0
+    assert reader.wait_for_frame(0.05) is None
+
+
+@pytest.mark.parametrize("slot_count", [2, 3, frame_sink.MAX_RING_SLOTS])
+def test_ring_frames_and_sequence_numbers(open_sink, slot_count):
+    sink, reader = open_sink(slot_count)
+    for sequence in range(1, 2 * slot_count + 2):
+        frame = _random_frame(sequence)
+        sink.write_frame(frame)
+        received = reader.wait_for_frame(1.0)
+        assert received is not None
+        np.testing.assert_array_equal(received, frame)
+        assert reader.last_sequence == sequence
+        slot = sequence % slot_count
+        assert struct.unpack_from("<I", reader._shared_memory_map,
+                                  frame_sink.RING_SLOT_SEQ_OFFSET + 4 * slot)[0] == sequence
+    assert reader.torn_reads == 0
+
+
+@pytest.mark.parametrize("slot_count", [1, 3])
+def test_dirty_rect_writes_keep_every_slot_current(open_sink, slot_count):
+    """Кадры, записанные с dirty_rect, читаются целиком, даже если слот в последний раз писался несколько кадров назад."""
+    sink, reader = open_sink(slot_count)
+    frame = _random_frame(0)
+    sink.write_frame(frame)
+    assert reader.wait_for_frame(1.0) is not None
+
+    rects = [(5, 4, 20, 30), (40, 0, 64, 10), (0, 40, 8, 48), (10, 10, 11, 11), (30, 20, 50, 40)]
+    for index, (x1, y1, x2, y2) in enumerate(rects, start=1):
+        frame = frame.copy()
+        frame[y1:y2, x1:x2] = _random_frame(index)[y1:y2, x1:x2]
+        sink.write_frame(frame, (x1, y1, x2, y2))
+        received = reader.wait_for_frame(1.0)
+        assert received is not None
+        np.testing.assert_array_equal(received, frame)
+
+
+def test_direct_slot_write_publishes_frame(open_sink):
+    sink, reader = open_sink(3)
+    frame = _random_frame(7)
+    for sequence in range(1, 5):
+        slot, slot_view = sink.begin_frame()
+        assert slot == sequence % 3
+        # Пока кадр пишется, слот помечен занятым и читатель его не принимает
+        assert struct.unpack_from("<I", reader._shared_memory_map, frame_sink.RING_SLOT_SEQ_OFFSET + 4 * slot)[0] == 0
+        frame = np.roll(frame, sequence, axis=1)
+        slot_view[:] = frame
+        sink.publish_frame()
+        received = reader.wait_for_frame(1.0)
+        assert received is not None
+        np.testing.assert_array_equal(received, frame)
+        assert reader.last_sequence == sequence
+
+
+def test_publish_without_signal_waits_for_signal_frame_ready(open_sink):
+    sink, reader = open_sink(3)
+    frame = _random_frame(3)
+    sink.write_frame(frame, signal=False)
+    assert reader.wait_for_frame(0.05) is None
+    sink.signal_frame_ready()
+    received = reader.wait_for_frame(1.0)
+    np.testing.assert_array_equal(received, frame)
+    assert reader.last_sequence == 1
+
+
+def test_direct_write_only_for_ring_consumers():
+    """Композиция прямо в слот включается только для потребителей кольца; DLL камеры на Windows читает одиночный буфер."""
+    assert frame_sink.PosixSharedMemorySink(slot_count=3).supports_direct_write
+    assert not frame_sink.PosixSharedMemorySink(slot_count=1).supports_direct_write
+    assert not frame_sink.Win32SharedMemorySink().supports_direct_write
+    with pytest.raises(ValueError):
+        frame_sink.Win32SharedMemorySink(slot_count=3)
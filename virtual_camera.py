@@ -4,23 +4,30 @@ import cv2  # Импортируем OpenCV для работы с изобра
 import numpy as np  # Импортируем NumPy, так как OpenCV использует массивы NumPy
 # import pyvirtualcam # Больше не нужен для отправки кадров напрямую в камеру
 import queue  # Импортируем модуль queue для создания очереди кадров
-from PIL import Image, ImageSequence  # Для работы с GIF и PNG
-import asyncio  # Импортируем asyncio для await
 import threading  # Импортируем threading для использования Lock
 import time  # Для time.time() и time.perf_counter() - измерения времени
-import math  # Для math.sin() - для плавности анимации
-
-import mmap  # Для работы с общей памятью
-import struct  # Для упаковки/распаковки структуры данных в общей памяти
-import win32event  # Для работы с Win32 событиями
-import win32file  # Для работы с файловыми отображениями (memory-mapped files)
-import win32api  # Для получения системных ошибок
-import pywintypes  # Для обработки ошибок Win32 API
+import math  # Для таблицы смещений подпрыгивания (math.pi, math.ceil)
 
 # Импортируем config_manager
 import config_manager
 
-# Импортируем POLLING_INTERVAL_SECONDS из reactive_monitor (если используется для asyncio.sleep)
+# Приемники кадров (общая память Win32 или /dev/shm на Linux) и объединение прямоугольников dirty-rect
+import frame_sink
+from frame_sink import union_rects
+# Ленивое декодирование больших GIF с общим LRU кэшем кадров
+import frame_source
+# Кэш декодированных кадров на диске
+import asset_cache
+# Планировщик кадров по абсолютным дедлайнам
+import frame_scheduler
+# Двухстадийный конвейер композиции и отправки кадров
+import frame_pipeline
+# Адаптивное понижение качества при нехватке времени на кадр
+import quality_governor
+# Гистограммы задержек стадий кадра и счетчики кадров
+import frame_metrics
+
+# Импортируем POLLING_INTERVAL_SECONDS из reactive_monitor (пауза цикла рендеринга, пока приемник кадров не готов)
 # Предполагается, что reactive_monitor также импортируется в других местах, и POLLING_INTERVAL_SECONDS нужен.
 try:
     from reactive_monitor import POLLING_INTERVAL_SECONDS
@@ -35,31 +42,29 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 # Папка для всех обработанных аватаров и статических изображений (фона, оверлеев)
 # Это папка, с которой работает пользователь.
 AVATAR_ASSETS_FOLDER = os.path.join(SCRIPT_DIR, "reactive_avatar")
+# Папка для кэша декодированных кадров (стеки кадров .npy и метаданные), чтобы не декодировать ассеты при каждом запуске
+ASSET_CACHE_FOLDER = os.path.join(SCRIPT_DIR, "frame_cache")
 
 # Глобальные переменные для размеров и FPS камеры (размеры будут определены динамически размерами BG.png/gif)
 CAM_WIDTH = 0
 CAM_HEIGHT = 0
+# Выходное разрешение из конфига (OUTPUT_RESOLUTION): высота кадра или None, если разрешение задает фон ("auto")
+_output_height = None
+# Масштаб, с которым фон и аватары один раз пересчитываются при загрузке: выходная высота / высота фона
+_asset_scale = 1.0
 # CAM_FPS будет установлен из конфига, по умолчанию 60
 CAM_FPS = 60  # Стандартное значение CAM_FPS перед загрузкой конфига
 _initial_cam_fps_default = 60  # Значение по умолчанию, если в конфиге не найдено
+_initial_frame_cache_memory_mb_default = frame_source.DEFAULT_MEMORY_BUDGET_MB  # Бюджет кэша кадров по умолчанию (МБ)
+# Хранить анимированный фон как индексы палитры (frame_source.PaletteFrames) вместо полных RGB кадров (из конфига)
+_compact_gif_frames = False
 
 # Глобальный объект для виртуальной камеры
 # virtual_cam_obj = None # Больше не объект pyvirtualcam, а флаг состояния
 virtual_cam_obj = False  # Флаг: True = камера инициализирована и работает, False = не инициализирована/ошибка
 
-# Глобальные переменные для общей памяти и событий Win32
-SHARED_MEM_NAME = "LunasVirtualCamSharedMemory"
-NEW_FRAME_EVENT_NAME = "LunasVirtualCamNewFrameEvent"
-MAX_BUFFER_SIZE = 1920 * 1080 * 3  # Максимальный размер буфера 1080p RGB24
-# Формат структуры SharedVideoBuffer: uint32_t (width, height, fps, format, frameSize, frameReady)
-# Little-endian, 6 unsigned ints
-SHARED_BUFFER_HEADER_FORMAT = "<IIIIII"  # 6 unsigned integers
-SHARED_BUFFER_HEADER_SIZE = struct.calcsize(SHARED_BUFFER_HEADER_FORMAT)
-TOTAL_SHARED_MEM_SIZE = SHARED_BUFFER_HEADER_SIZE + MAX_BUFFER_SIZE
-
-_shared_memory_map = None
-_shared_memory_buffer = None
-_new_frame_event = None
+# Приемник кадров (frame_sink.FrameSink): владеет общей памятью и сигнализацией нового кадра
+_frame_sink = None
 
 # Глобальная переменная для слушателя событий изменения статуса.
 # Сюда можно присвоить функцию, которая будет вызываться при изменении статуса.
@@ -70,13 +75,38 @@ _status_change_listener = None
 display_queue = queue.Queue(maxsize=1)
 
 # Глобальное хранилище для всех анимированных ассетов (фон и аватары)
-# Структура: "ключ_статуса" -> {"frames": [...], "original_fps": X, "current_float_index": 0.0, "animation_start_time": 0.0, "last_frame_time": 0.0, "smoothed_dt": 0.0, "durations": [...], "current_frame_index": 0, "frame_elapsed": 0.0}
+# Структура: "ключ_статуса" -> AnimationState (кадры ассета и состояние их воспроизведения)
 _animation_assets = {}
-
-# Коэффициент EMA сглаживания
-ALPHA = 0.1
+# Реестр загруженных файлов аватаров: (реальный путь, mtime) -> (кадры, FPS, длительности, подготовленные кадры).
+# Несколько статусов, ссылающихся на один файл, получают одни и те же кадры.
+_asset_registry = {}
+# Ключи записей дискового кэша кадров, использованных при последней инициализации (остальные записи удаляются)
+_asset_cache_keys_in_use = set()
+# Общий кэш декодированных кадров для ассетов, которые не помещаются в память целиком (создается при инициализации)
+_frame_cache = None
 
 _last_composed_frame = None
+# Постоянный выходной буфер кадра (CAM_HEIGHT x CAM_WIDTH x 3), переиспользуется на каждой итерации цикла
+_output_frame_buffer = None
+# Состояние dirty-rect композиции для каждого выходного буфера (слота общей памяти или _output_frame_buffer):
+# ключ буфера -> [ключ кадра фона, лежащего в буфере, прямоугольник, где в буфере нарисован аватар]
+_output_frame_states = {}
+# Буферы для предпросмотра в GUI: кадр копируется в них не чаще PREVIEW_FPS раз в секунду по кругу
+PREVIEW_FPS = 30
+PREVIEW_BUFFER_COUNT = 3
+_preview_buffers = []
+_preview_buffer_index = 0
+_last_preview_time = 0.0
+# Ключ последнего отправленного кадра: если он совпадает с ключом нового кадра, композиция и запись пропускаются
+_last_frame_key = None
+# Поколение ассетов: увеличивается при горячей перезагрузке, входит в ключ фона,
+# чтобы буферы с кадрами старого фона никогда не считались актуальными
+_assets_generation = 0
+
+# Отслеживание изменений файлов в AVATAR_ASSETS_FOLDER для горячей перезагрузки ассетов
+ASSET_WATCH_INTERVAL_SECONDS = 1.0
+_asset_watcher_thread = None
+_asset_watcher_stop_event = None
 _last_bg_index = -1
 _last_avatar_index = -1
 
@@ -85,13 +115,13 @@ _last_avatar_index = -1
 # _current_background_frame_index теперь не используется явно для индексации
 
 # Текущий активный набор кадров аватара (устанавливается voice_status_callback)
-# Это будет ссылка на один из словарей в _animation_assets
-_current_active_avatar_frames = {}
+# Это будет ссылка на один из AnimationState в _animation_assets
+_current_active_avatar_frames = None
 # Добавляем блокировку для потокобезопасного доступа к _current_active_avatar_frames
 _avatar_frames_lock = threading.Lock()
 
-# Флаг для управления циклом отправки кадров
-_cam_loop_running = False
+# Поток рендеринга и отправки кадров (FrameRenderThread), единственный на процесс; создается ниже
+_render_thread = None
 
 # Глобальная переменная для флага BOUNCING_ENABLED (из конфига)
 _bouncing_enabled = False
@@ -102,15 +132,18 @@ BOUNCING_MAX_OFFSET_PIXELS = 10  # Максимальное смещение в
 _bouncing_active = False  # Флаг, активна ли сейчас анимация подпрыгивания
 _bouncing_start_time = 0.0  # Время начала анимации
 BOUNCING_DURATION_MS = 150  # Длительность анимации в миллисекундах (0.15 секунды)
+# Смещения подпрыгивания по кадрам, посчитанные один раз для текущих CAM_FPS и BOUNCING_DURATION_MS
+_bounce_offset_table = []
+_bounce_offset_table_key = None  # (CAM_FPS, BOUNCING_DURATION_MS, BOUNCING_MAX_OFFSET_PIXELS) таблицы
 
 # Глобальные переменные для кроссфейда
 _cross_fade_enabled = False  # Флаг, включен ли кроссфейд
 _cross_fade_active = False  # Флаг, активен ли кроссфейд
 _cross_fade_start_time = 0.0  # Время начала кроссфейда
-# _old_avatar_frames_data теперь будет полным словарем: {"frames": [...], "original_fps": X, "current_float_index": Y}
-_old_avatar_frames_data = {"frames": [], "original_fps": 1.0, "current_float_index": 0.0, "animation_start_time": 0.0,
-                           "last_frame_time": 0.0, "smoothed_dt": 0.0, "durations": [], "current_frame_index": 0,
-                           "frame_elapsed": 0.0}
+# _old_avatar_frames_data - копия AnimationState уходящего аватара на время кроссфейда, иначе None
+_old_avatar_frames_data = None
+# Подготовленные к смешиванию слои уходящего аватара и буферы результата (см. _create_cross_fade_context)
+_cross_fade_context = None
 _initial_cross_fade_duration_default = 200  # Значение по умолчанию для длительности кроссфейда
 CROSS_FADE_DURATION_MS = _initial_cross_fade_duration_default  # Длительность кроссфейда в миллисекундах
 
@@ -146,12 +179,20 @@ BACKGROUND_IMAGE_PATH = "BG"
 
 CHECK_TIME = True
 
-# --- ГЛОБАЛЬНЫЕ ПЕРЕМЕННЫЕ ДЛЯ ОТОБРАЖЕНИЯ FPS ---
-_fps_history = []  # Список для хранения истории FPS
-_fps_display_frame_count = 0  # Счетчик кадров для обновления отображения FPS
-_last_displayed_avg_fps = 0.0  # Последнее отображенное значение среднего FPS
-FPS_DISPLAY_UPDATE_INTERVAL = 30  # Обновлять отображение FPS каждые N кадров
-_send_time_ms = 0.0  # Время передачи в общую память и сигнализации SetEvent
+# --- ТЕЛЕМЕТРИЯ КАДРОВ ---
+# Задержки стадий кадра, достигнутый FPS и счетчики кадров; сбрасывается при запуске цикла отправки кадров
+_frame_metrics = frame_metrics.FrameMetrics()
+# Планировщик цикла отправки кадров (frame_scheduler.FrameScheduler), создается при запуске цикла
+_frame_scheduler = None
+# Конвейер композиции/отправки (frame_pipeline.FramePipeline) для приемников без прямой записи в слот
+FRAME_PIPELINE_DEPTH = frame_pipeline.DEFAULT_PIPELINE_DEPTH
+_frame_pipeline = None
+# (ключ фона, прямоугольник аватара) последнего кадра, переданного конвейеру: по нему считается,
+# какую область приемник должен скопировать в общую память
+_pipeline_published_state = None
+
+_adaptive_quality_enabled = True  # По умолчанию качество понижается при нехватке времени на кадр (ADAPTIVE_QUALITY)
+_quality_governor = None
 
 
 def set_status_callback(callback_func):
@@ -160,86 +201,643 @@ def set_status_callback(callback_func):
     _status_change_listener = callback_func
 
 
-def _load_frames_from_file(base_name: str, is_avatar: bool = False, resize_to_cam: bool = False) -> tuple[
-    list[np.ndarray], float, list[float]]:
+class AnimationState:
+    """
+    Кадры одного ассета (фон или аватар) и состояние их воспроизведения.
+    Длительности кадров хранятся накопленной суммой, а часы анимации - абсолютным временем старта,
+    поэтому текущий кадр находится одним бинарным поиском по (now - start_time) % total_duration:
+    без накопления ошибки округления и без прохода по пропущенным кадрам после задержек.
+    """
+    __slots__ = ("frames", "prepared", "original_fps", "durations", "frame_end_times", "total_duration",
+                 "start_time", "paused_at", "current_frame_index", "is_static")
+
+    def __init__(self, frames: np.ndarray | frame_source.LazyFrameSource | None = None,
+                 durations: np.ndarray | None = None, original_fps: float = 1.0, prepared: dict | None = None,
+                 is_static: bool = False):
+        # Стек кадров N x H x W x C (или ленивый источник кадров)
+        self.frames = frames if frames is not None else _empty_frames(4)
+        self.prepared = prepared  # Подготовленные кадры аватара (_prepare_avatar_frames), для фона None
+        self.original_fps = original_fps
+        self.is_static = is_static
+        self.set_durations(durations if durations is not None else [])
+        self.reset(time.perf_counter())
+
+    @property
+    def has_frames(self) -> bool:
+        return len(self.frames) > 0
+
+    def set_durations(self, durations: np.ndarray):
+        """Задает длительности кадров (в секундах) и пересчитывает накопленные времена окончания кадров."""
+        self.durations = np.asarray(durations, dtype=np.float64)
+        self.frame_end_times = np.cumsum(self.durations)
+        self.total_duration = float(self.frame_end_times[-1]) if len(self.frame_end_times) else 0.0
+
+    def reset(self, now: float):
+        """Начинает анимацию с первого кадра."""
+        self.start_time = now
+        self.paused_at = None
+        self.current_frame_index = 0
+
+    def pause(self, now: float):
+        """Останавливает часы анимации; позиция сохраняется до вызова resume()."""
+        if self.paused_at is None:
+            self.paused_at = now
+
+    def resume(self, now: float):
+        """Продолжает анимацию с позиции, на которой она была остановлена pause()."""
+        if self.paused_at is not None:
+            self.start_time += now - self.paused_at
+            self.paused_at = None
+
+    def position(self, now: float) -> float:
+        """Позиция внутри цикла анимации (в секундах) на момент now."""
+        if self.total_duration <= 0:
+            return 0.0
+        clock = self.paused_at if self.paused_at is not None else now
+        return (clock - self.start_time) % self.total_duration
+
+    def advance(self, now: float) -> int:
+        """Возвращает индекс кадра, который должен отображаться в момент now."""
+        frame_count = min(len(self.frames), len(self.frame_end_times))
+        if frame_count <= 1 or self.total_duration <= 0:
+            self.current_frame_index = 0
+            return 0
+
+        frame_index = int(np.searchsorted(self.frame_end_times, self.position(now), side="right"))
+        self.current_frame_index = min(frame_index, frame_count - 1)
+        return self.current_frame_index
+
+    def copy(self) -> "AnimationState":
+        """Копия состояния воспроизведения, разделяющая с оригиналом кадры и длительности."""
+        state = AnimationState.__new__(AnimationState)
+        for slot in AnimationState.__slots__:
+            setattr(state, slot, getattr(self, slot))
+        return state
+
+
+def _empty_frames(channels: int) -> np.ndarray:
+    """Пустой стек кадров (0 x 0 x 0 x channels) для ассета без файла."""
+    return np.empty((0, 0, 0, channels), dtype=np.uint8)
+
+
+def _create_placeholder_avatar_state() -> AnimationState:
+    """Создает заглушку аватара из одного прозрачного кадра размером с камеру."""
+    frames = np.zeros((1, CAM_HEIGHT, CAM_WIDTH, 4), dtype=np.uint8)
+    return AnimationState(frames, np.array([0.1]), 1.0, prepared=_prepare_avatar_frames(frames))
+
+
+def _find_asset_file(base_name: str) -> str | None:
+    """Возвращает путь к GIF (приоритетно) или PNG файлу ассета в AVATAR_ASSETS_FOLDER, либо None."""
+    gif_path = os.path.join(AVATAR_ASSETS_FOLDER, f"{base_name}.gif")
+    png_path = os.path.join(AVATAR_ASSETS_FOLDER, f"{base_name}.png")
+    if os.path.exists(gif_path):
+        return gif_path
+    if os.path.exists(png_path):
+        return png_path
+    return None
+
+
+def _decode_assets_in_parallel():
+    """
+    Декодирует фон и файлы аватаров, которых еще нет в дисковом кэше, в пуле процессов (по задаче на файл),
+    чтобы время запуска определялось самым тяжелым ассетом, а не суммой всех.
+    GIF, которые будут декодироваться лениво (больше половины бюджета _frame_cache), пропускаются.
+    Анимированный GIF фона при COMPACT_GIF_FRAMES тоже пропускается: он декодируется сразу в индексы палитры.
+    """
+    files = []
+    for base_name, is_avatar in [(BACKGROUND_IMAGE_PATH, False)] + [(filename, True) for filename in
+                                                                    STATUS_TO_FILENAME_MAP.values()]:
+        file_path = _find_asset_file(base_name)
+        if _compact_gif_frames and not is_avatar and file_path is not None and file_path.endswith(".gif"):
+            continue
+        if file_path is not None:
+            files.append((file_path, "RGBA" if is_avatar else "RGB"))
+    max_decoded_bytes = _frame_cache.memory_budget_bytes // 2 if _frame_cache is not None else None
+    asset_cache.decode_files_in_parallel(ASSET_CACHE_FOLDER, files, max_decoded_bytes)
+
+
+def _load_avatar_asset(base_name: str) -> tuple:
+    """
+    Загружает и подготавливает аватар через реестр _asset_registry.
+    Ключ реестра - реальный путь к файлу и время его изменения, поэтому каждый физический файл
+    декодируется и хранится один раз, даже если на него ссылаются несколько статусов.
+    Возвращает (кадры, оригинальный FPS, длительности кадров, подготовленные кадры).
+    """
+    file_path = _find_asset_file(base_name)
+    asset_key = None
+    if file_path is not None:
+        try:
+            asset_key = (os.path.realpath(file_path), os.stat(file_path).st_mtime_ns)
+        except OSError:
+            asset_key = None
+        if asset_key in _asset_registry:
+            return _asset_registry[asset_key]
+
+    frames, original_fps, frame_durations = _load_frames_from_file(base_name, is_avatar=True)
+    if isinstance(frames, frame_source.LazyFrameSource):
+        prepared = _prepare_lazy_avatar_frames(frames)
+    else:
+        prepared = _prepare_avatar_frames(frames)
+    asset = (frames, original_fps, frame_durations, prepared)
+    if asset_key is not None and len(frames) > 0:
+        _asset_registry[asset_key] = asset
+    return asset
+
+
+def _load_frames_from_file(base_name: str, is_avatar: bool = False, resize_to_cam: bool = False,
+                           update_camera_size: bool = True) -> tuple[
+    np.ndarray | frame_source.LazyFrameSource | frame_source.PaletteFrames, float, np.ndarray]:
     """
     Загружает кадры из GIF или PNG файла.
     Пытается загрузить GIF, если не найдет, то PNG.
-    Возвращает список NumPy массивов (RGBA для аватаров, RGB для фона), оригинальный FPS и список длительностей кадров.
-    Если это фоновое изображение, устанавливает глобальные CAM_WIDTH и CAM_HEIGHT.
+    Возвращает стек кадров N x H x W x C (RGBA для аватаров, RGB для фона), оригинальный FPS
+    и массив длительностей кадров в секундах (float64).
+    Если кадры файла уже есть в дисковом кэше (ASSET_CACHE_FOLDER), файл не декодируется:
+    возвращается стек кадров, отображенный в память через np.load(mmap_mode='r').
+    GIF, декодированные кадры которого заняли бы больше половины бюджета _frame_cache, не декодируется целиком:
+    вместо стека возвращается frame_source.LazyFrameSource, который декодирует кадры по требованию.
+    То же ограничение действует для записи дискового кэша: такие кадры копируются из отображения по требованию.
+    Если включен COMPACT_GIF_FRAMES, анимированный GIF фона декодируется сразу в frame_source.PaletteFrames
+    в разрешении камеры (см. _load_compact_background).
+    Если это фоновое изображение и update_camera_size=True, устанавливает глобальные CAM_WIDTH и CAM_HEIGHT.
     """
     global CAM_WIDTH, CAM_HEIGHT
+    sets_camera_size = update_camera_size and base_name == BACKGROUND_IMAGE_PATH
 
-    gif_path = os.path.join(AVATAR_ASSETS_FOLDER, f"{base_name}.gif")
-    png_path = os.path.join(AVATAR_ASSETS_FOLDER, f"{base_name}.png")
-    frames = []
     original_fps = 1.0  # Дефолтное значение для PNG или неизвестного GIF
-    frame_durations = []  # Список длительностей каждого кадра в секундах
+    frame_mode = "RGBA" if is_avatar else "RGB"
 
-    file_to_load = None
-    if os.path.exists(gif_path):
-        file_to_load = gif_path
-    elif os.path.exists(png_path):
-        file_to_load = png_path
-    else:
+    file_to_load = _find_asset_file(base_name)
+    if file_to_load is None:
         print(
             f"  ПРЕДУПРЕЖДЕНИЕ: Ни GIF, ни PNG файл не найден для '{base_name}'. Возвращаю пустой список кадров, дефолтный FPS ({original_fps}) и пустые длительности кадров.")
-        return [], original_fps, []
+        return _empty_frames(len(frame_mode)), original_fps, np.empty(0)
+
+    if _compact_gif_frames and base_name == BACKGROUND_IMAGE_PATH:
+        compact = _load_compact_background(file_to_load, sets_camera_size)
+        if compact is not None:
+            return compact
+
+    cache_key = asset_cache.get_cache_key(file_to_load, frame_mode)
+    if cache_key is not None:
+        _asset_cache_keys_in_use.add(cache_key)
+    cached = asset_cache.load_frames(ASSET_CACHE_FOLDER, cache_key)
+    if cached is not None:
+        cached_frames, frame_durations, original_fps = cached
+        frame_count, height, width = cached_frames.shape[:3]
+        if sets_camera_size:
+            _set_camera_size_from_background(width, height)
+        if _exceeds_eager_decode_budget(frame_count, width, height, len(frame_mode)):
+            # Полная копия стека (масштабирование, подготовка слоев) нарушила бы бюджет кэша кадров
+            print(f"  '{base_name}': {frame_count} кадров из кэша кадров не помещаются в кэш кадров в памяти, "
+                  f"кадры будут копироваться из отображения по требованию.")
+            frames = frame_source.open_lazy_mapped_frames(cached_frames, _frame_cache,
+                                                          _get_lazy_target_size(base_name, is_avatar, width, height))
+            return frames, original_fps, frame_durations
+        print(f"  '{base_name}': {frame_count} кадров загружено из кэша кадров.")
+        return (_scale_avatar_frames(cached_frames) if is_avatar else cached_frames), original_fps, frame_durations
+
+    if file_to_load.endswith(".gif") and _frame_cache is not None:
+        try:
+            frame_count, (width, height), probed_durations, header_fps = frame_source.probe_animation(file_to_load)
+            if _exceeds_eager_decode_budget(frame_count, width, height, len(frame_mode)):
+                if sets_camera_size:
+                    _set_camera_size_from_background(width, height)
+                decoded_size = frame_count * width * height * len(frame_mode)
+                print(f"  '{base_name}': {frame_count} кадров ({decoded_size / (1024 * 1024):.0f} МБ в декодированном виде) "
+                      f"не помещаются в кэш кадров, кадры будут декодироваться по требованию.")
+                frames = frame_source.open_lazy_frames(file_to_load, frame_mode, frame_count, _frame_cache,
+                                                       _get_lazy_target_size(base_name, is_avatar, width, height))
+                original_fps = header_fps if header_fps > 0 else 15.0
+                # Пока кадры декодируются по требованию, в фоне заполняем дисковый кэш для следующих запусков
+                asset_cache.store_frames_in_background(ASSET_CACHE_FOLDER, cache_key, file_to_load, frame_mode,
+                                                       frame_count, (width, height), probed_durations, original_fps)
+                return frames, original_fps, np.asarray(probed_durations, dtype=np.float64)
+        except Exception as e:
+            print(f"  ПРЕДУПРЕЖДЕНИЕ: Не удалось открыть '{file_to_load}' для ленивого декодирования: {e}. Декодирую целиком.")
 
     try:
-        with Image.open(file_to_load) as im:
-            # Устанавливаем CAM_WIDTH и CAM_HEIGHT на основе первого кадра фона
-            if base_name == BACKGROUND_IMAGE_PATH:
-                CAM_WIDTH = im.width
-                CAM_HEIGHT = im.height
-                print(f"  Разрешение камеры установлено по фоновому изображению: {CAM_WIDTH}x{CAM_HEIGHT}")
-
-            if file_to_load.endswith(".gif"):
-                for frame in ImageSequence.Iterator(im):
-                    frames.append(np.array(frame.convert("RGBA" if is_avatar else "RGB")))
-                    # Сохраняем длительность каждого кадра в секундах
-                    frame_durations.append(frame.info.get("duration", 100) / 1000.0)
-
-                # Пытаемся получить duration из GIF и рассчитать FPS
-                if 'duration' in im.info and im.info['duration'] > 0:
-                    original_fps = 1000.0 / im.info['duration']
-                else:
-                    # Если duration не определен, используем разумное значение по умолчанию для GIF
-                    original_fps = 15.0
-                    print(
-                        f"  ПРЕДУПРЕЖДЕНИЕ: Не удалось определить точный FPS для GIF '{base_name}'. Использую значение по умолчанию ({original_fps:.2f}).")
-
-            else:  # PNG (статичное изображение)
-                frames.append(np.array(im.convert("RGBA" if is_avatar else "RGB")))
-                original_fps = 1.0  # Статичные изображения имеют 1 FPS
-                if original_fps > 0:
-                    frame_durations.append(1.0 / original_fps)  # Для PNG длительность кадра - 1/FPS
-                else:
-                    frame_durations.append(0.1)  # Fallback to 0.1s if FPS is 0
-
+        frames, original_fps, frame_durations = asset_cache.decode_frames(file_to_load, frame_mode)
     except Exception as e:
         print(f"  ОШИБКА: Не удалось загрузить кадры из '{file_to_load}': {e}")
-        return [], original_fps, []
+        return _empty_frames(len(frame_mode)), original_fps, np.empty(0)
+
+    # Устанавливаем CAM_WIDTH и CAM_HEIGHT на основе первого кадра фона
+    if sets_camera_size and len(frames) > 0:
+        _set_camera_size_from_background(frames.shape[2], frames.shape[1])
+
+    # В дисковом кэше кадры хранятся в исходном размере, масштаб применяется после загрузки
+    asset_cache.store_frames(ASSET_CACHE_FOLDER, cache_key, frames, frame_durations, original_fps)
+    return (_scale_avatar_frames(frames) if is_avatar else frames), original_fps, frame_durations
+
+
+def _load_compact_background(file_path: str, sets_camera_size: bool) -> tuple | None:
+    """
+    Загружает анимированный GIF фона как индексы палитры (COMPACT_GIF_FRAMES).
+    Кадры квантуются по одному при декодировании и сразу приводятся к CAM_WIDTH x CAM_HEIGHT,
+    поэтому полный RGB стек фона не создается ни в исходном, ни в выходном разрешении.
+    Возвращает (frame_source.PaletteFrames, оригинальный FPS, длительности кадров) или None,
+    если компактное хранение неприменимо (причина печатается) и фон нужно загрузить как обычно.
+    """
+    if not file_path.endswith(".gif"):
+        print("  Фон не является анимированным GIF, компактное хранение (COMPACT_GIF_FRAMES) не применяется.")
+        return None
+    try:
+        frame_count, (width, height), frame_durations, header_fps = frame_source.probe_animation(file_path)
+    except Exception as e:
+        print(f"  ПРЕДУПРЕЖДЕНИЕ: Не удалось прочитать '{file_path}' для компактного хранения: {e}. Загружаю фон как обычно.")
+        return None
+    if frame_count <= 1:
+        print("  Фон состоит из одного кадра, компактное хранение (COMPACT_GIF_FRAMES) не применяется.")
+        return None
+
+    if sets_camera_size:
+        _set_camera_size_from_background(width, height)
+    if _exceeds_eager_decode_budget(frame_count, CAM_WIDTH, CAM_HEIGHT, 1):
+        print(f"  Индексы палитры {frame_count} кадров фона не помещаются в кэш кадров, "
+              f"компактное хранение не применяется: кадры будут декодироваться по требованию.")
+        return None
+
+    try:
+        frames = frame_source.decode_palette_frames(file_path, (CAM_WIDTH, CAM_HEIGHT))
+    except Exception as e:
+        print(f"  ПРЕДУПРЕЖДЕНИЕ: Не удалось декодировать '{file_path}' в индексы палитры: {e}. Загружаю фон как обычно.")
+        return None
+    if frames is None:
+        print("  В кадрах фона больше 256 цветов, компактное хранение невозможно. Кадры хранятся целиком.")
+        return None
+
+    full_size = frame_count * CAM_WIDTH * CAM_HEIGHT * 3
+    print(f"  Фон хранится в виде индексов палитры: {frames.nbytes / (1024 * 1024):.1f} МБ "
+          f"вместо {full_size / (1024 * 1024):.1f} МБ.")
+    original_fps = header_fps if header_fps > 0 else 15.0
+    return frames, original_fps, np.asarray(frame_durations, dtype=np.float64)
+
+
+def _exceeds_eager_decode_budget(frame_count: int, width: int, height: int, channels: int) -> bool:
+    """Заняли бы декодированные кадры анимации больше половины бюджета _frame_cache (тогда они загружаются лениво)."""
+    if _frame_cache is None or frame_count <= 1:
+        return False
+    return frame_count * width * height * channels > _frame_cache.memory_budget_bytes // 2
+
+
+def _get_lazy_target_size(base_name: str, is_avatar: bool, width: int, height: int) -> tuple[int, int] | None:
+    """
+    Размер, к которому ленивый источник масштабирует кадры при декодировании:
+    фон - к разрешению камеры, аватар - с масштабом ассетов. None, если масштабировать не нужно.
+    """
+    if base_name == BACKGROUND_IMAGE_PATH:
+        return (CAM_WIDTH, CAM_HEIGHT) if (width, height) != (CAM_WIDTH, CAM_HEIGHT) else None
+    return _get_scaled_asset_size(width, height) if is_avatar and _asset_scale != 1.0 else None
+
+
+def _parse_output_resolution(value: str) -> int | None:
+    """
+    Разбирает OUTPUT_RESOLUTION: "auto" (разрешение фона) -> None, "720p"/"1080p"/"720" -> высота кадра.
+    Неверное значение считается "auto". Высота, кадр которой с пропорциями фона не помещается в буфер
+    общей памяти, уменьшается при загрузке фона (_set_camera_size_from_background).
+    """
+    value = value.strip().lower()
+    if value in ("", "auto"):
+        return None
+    try:
+        output_height = int(value[:-1] if value.endswith("p") else value)
+    except ValueError:
+        output_height = 0
+    if output_height < 2:
+        print(f"ПРЕДУПРЕЖДЕНИЕ: Неверное значение OUTPUT_RESOLUTION '{value}'. Использую разрешение фона.")
+        return None
+    return output_height
+
+
+def _get_output_width(width: int, height: int, output_height: int) -> int:
+    """Ширина кадра высотой output_height с пропорциями фона width x height (четная, как требуют YUV форматы)."""
+    return max(2, round(width * output_height / height / 2) * 2)
+
+
+def _fit_output_height(width: int, height: int) -> int:
+    """Наибольшая высота кадра с пропорциями фона, кадр которой (RGB24) помещается в буфер общей памяти."""
+    output_height = int(math.sqrt(frame_sink.MAX_BUFFER_SIZE / 3 * height / width))
+    while output_height > 2 and _get_output_width(width, height, output_height) * output_height * 3 > \
+            frame_sink.MAX_BUFFER_SIZE:
+        output_height -= 1
+    return output_height
 
-    return frames, original_fps, frame_durations
+
+def _set_camera_size_from_background(width: int, height: int):
+    """
+    Устанавливает CAM_WIDTH и CAM_HEIGHT по размеру фонового изображения.
+    Если в конфиге задано выходное разрешение, кадр получает заданную высоту и пропорции фона,
+    а _asset_scale запоминает, во сколько раз нужно один раз масштабировать фон и аватары.
+    """
+    global CAM_WIDTH, CAM_HEIGHT, _asset_scale
+    output_height = _output_height
+    if output_height is not None and _get_output_width(width, height, output_height) * output_height * 3 > \
+            frame_sink.MAX_BUFFER_SIZE:
+        # Кадр такого размера не поместится в буфер общей памяти, и камера не откроется
+        fitted_height = _fit_output_height(width, height)
+        print(f"ПРЕДУПРЕЖДЕНИЕ: OUTPUT_RESOLUTION {output_height}p с пропорциями фона {width}x{height} "
+              f"не помещается в буфер общей памяти камеры ({frame_sink.MAX_BUFFER_SIZE} байт, 1920x1080 RGB24). "
+              f"Использую {fitted_height}p.")
+        output_height = fitted_height
+    if output_height is None or output_height == height:
+        _asset_scale = 1.0
+        CAM_WIDTH, CAM_HEIGHT = width, height
+        print(f"  Разрешение камеры установлено по фоновому изображению: {CAM_WIDTH}x{CAM_HEIGHT}")
+        return
+    _asset_scale = output_height / height
+    CAM_HEIGHT = output_height
+    CAM_WIDTH = _get_output_width(width, height, output_height)
+    print(f"  Разрешение камеры установлено из конфига (OUTPUT_RESOLUTION): {CAM_WIDTH}x{CAM_HEIGHT}. "
+          f"Фон {width}x{height} и аватары масштабируются один раз при загрузке (x{_asset_scale:.3f}).")
+
+
+def _get_scaled_asset_size(width: int, height: int) -> tuple[int, int]:
+    """Размер (ширина, высота) ассета после масштабирования на _asset_scale."""
+    return max(1, round(width * _asset_scale)), max(1, round(height * _asset_scale))
+
+
+def _resize_frames(frames: np.ndarray, size: tuple[int, int]) -> np.ndarray:
+    """
+    Масштабирует стек кадров к размеру size (ширина, высота) в новый стек.
+    Интерполяция выбирается frame_source.resize_interpolation, как и у ленивых источников кадров.
+    """
+    frame_h, frame_w = frames.shape[1:3]
+    interpolation = frame_source.resize_interpolation((frame_w, frame_h), size)
+    resized = np.empty((len(frames), size[1], size[0], frames.shape[3]), dtype=np.uint8)
+    for frame, resized_frame in zip(frames, resized):
+        cv2.resize(frame, size, dst=resized_frame, interpolation=interpolation)
+    return resized
+
+
+def _scale_avatar_frames(frames: np.ndarray) -> np.ndarray:
+    """Масштабирует кадры аватара вместе с фоном, чтобы аватар сохранил свой размер относительно кадра камеры."""
+    if _asset_scale == 1.0 or len(frames) == 0:
+        return frames
+    return _resize_frames(frames, _get_scaled_asset_size(frames.shape[2], frames.shape[1]))
+
+
+def _prepare_background_frames(frames: np.ndarray | frame_source.PaletteFrames) -> tuple[
+    np.ndarray | frame_source.PaletteFrames, bool]:
+    """
+    Один раз приводит кадры фона к выходному разрешению CAM_WIDTH x CAM_HEIGHT,
+    чтобы композитор больше никогда не масштабировал фон.
+    Кадры нужного размера остаются как есть (в том числе отображенными в память из кэша
+    и индексами палитры из _load_compact_background), остальные масштабируются в один новый стек.
+    Определяет статичный фон (PNG или GIF из одинаковых кадров), такой фон сворачивается в один кадр.
+    Возвращает стек кадров и флаг статичности.
+    """
+    scaled_frames = frames
+    if len(frames) > 0 and frames.shape[1:3] != (CAM_HEIGHT, CAM_WIDTH):
+        scaled_frames = _resize_frames(frames, (CAM_WIDTH, CAM_HEIGHT))
+
+    # Кадры сравниваются по индексу: PaletteFrames не поддерживает срезы и разворачивает по одному кадру
+    first_frame = scaled_frames[0] if len(scaled_frames) > 0 else None
+    is_static = len(scaled_frames) <= 1 or all(np.array_equal(scaled_frames[frame_index], first_frame)
+                                               for frame_index in range(1, len(scaled_frames)))
+    if is_static and len(scaled_frames) > 1:
+        print(f"  Фон состоит из {len(scaled_frames)} одинаковых кадров. Использую его как статичный.")
+        scaled_frames = first_frame[np.newaxis]
+    return scaled_frames, is_static
+
+
+def _prepare_avatar_frames(frames: np.ndarray) -> dict:
+    """
+    Один раз переводит стек RGBA кадров аватара (N x H x W x 4) в компактное представление для быстрой композиции.
+    Кадры обрезаются по общему для всего ассета прямоугольнику непрозрачных пикселей,
+    RGB умножается на альфу (premultiplied alpha), а альфа хранится инвертированной (255 - A) в 3 каналах.
+    Тогда наложение на фон сводится к out = bg * inv_alpha / 255 + premultiplied без преобразований в float.
+    Обрезка и premultiply выполняются сразу для всех кадров: стек обрабатывается как одно изображение высотой N * h.
+    Возвращает словарь: {"premultiplied": N x h x w x 3, "inv_alpha": N x h x w x 3,
+    "crop_offset": (x, y), "frame_size": (w, h)}.
+    """
+    frame_count = len(frames)
+    frame_h, frame_w = frames.shape[1:3] if frame_count else (0, 0)
+    # Объединение альфа-каналов всех кадров, чтобы у всех кадров ассета был один и тот же прямоугольник обрезки
+    alpha_union = frames[..., 3].max(axis=0) if frame_count else np.zeros((0, 0), dtype=np.uint8)
+    crop_x, crop_y, crop_w, crop_h = cv2.boundingRect(alpha_union) if alpha_union.size else (0, 0, 0, 0)
+    prepared = {"premultiplied": np.empty((frame_count, crop_h, crop_w, 3), dtype=np.uint8),
+                "inv_alpha": np.empty((frame_count, crop_h, crop_w, 3), dtype=np.uint8),
+                "crop_offset": (crop_x, crop_y), "frame_size": (frame_w, frame_h)}
+    if frame_count == 0 or crop_w == 0 or crop_h == 0:
+        return prepared
+
+    cropped = np.ascontiguousarray(frames[:, crop_y:crop_y + crop_h, crop_x:crop_x + crop_w])
+    premultiplied, inv_alpha = _prepare_avatar_layer(cropped.reshape(frame_count * crop_h, crop_w, 4))
+    prepared["premultiplied"] = premultiplied.reshape(frame_count, crop_h, crop_w, 3)
+    prepared["inv_alpha"] = inv_alpha.reshape(frame_count, crop_h, crop_w, 3)
+    return prepared
+
+
+def _prepare_avatar_layer(frame: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Переводит один RGBA кадр в пару (premultiplied RGB, инвертированная альфа в 3 каналах)."""
+    alpha_3_chan = cv2.merge([frame[:, :, 3], frame[:, :, 3], frame[:, :, 3]])
+    return cv2.multiply(frame[:, :, :3], alpha_3_chan, scale=1.0 / 255.0), cv2.bitwise_not(alpha_3_chan)
+
+
+def _prepare_lazy_avatar_frames(frames: frame_source.LazyFrameSource) -> dict:
+    """
+    Подготовка аватара, кадры которого декодируются по требованию.
+    Слои (premultiplied, inv_alpha) тоже вычисляются лениво и хранятся в общем кэше кадров.
+    Общий прямоугольник обрезки потребовал бы декодировать все кадры, поэтому кадры не обрезаются.
+    """
+    frame_h, frame_w = frames.load(0).shape[:2]
+    layers = frame_source.LazyFrameSource(lambda frame_index: _prepare_avatar_layer(frames.load(frame_index)),
+                                          len(frames), _frame_cache)
+    return {"layers": layers, "crop_offset": (0, 0), "frame_size": (frame_w, frame_h)}
+
+
+def _get_avatar_layer(prepared: dict, frame_index: int) -> tuple | None:
+    """
+    Возвращает слой аватара для _compose_frame: (premultiplied, inv_alpha, crop_offset, frame_size).
+    None, если подготовленных кадров нет.
+    """
+    if not prepared:
+        return None
+    if "layers" in prepared:  # Лениво декодируемый аватар
+        if not prepared["layers"]:
+            return None
+        premultiplied, inv_alpha = prepared["layers"][frame_index % len(prepared["layers"])]
+        return premultiplied, inv_alpha, prepared["crop_offset"], prepared["frame_size"]
+    if len(prepared["premultiplied"]) == 0:
+        return None
+    frame_index %= len(prepared["premultiplied"])
+    return (prepared["premultiplied"][frame_index], prepared["inv_alpha"][frame_index],
+            prepared["crop_offset"], prepared["frame_size"])
+
+
+def _create_dim_variant(prepared: dict) -> dict:
+    """
+    Создает затемненный вариант подготовленных кадров аватара для текущего DIM_PERCENTAGE.
+    Для premultiplied alpha затемнение - это умножение RGB, альфа не меняется, поэтому хранится только RGB.
+    Стек кадров затемняется целиком одним вызовом; у ленивых ассетов кадры затемняются при первом обращении
+    и хранятся в общем кэше кадров.
+    """
+    dim_factor = 1.0 - (DIM_PERCENTAGE / 100.0)
+    if "layers" in prepared:
+        layers = prepared["layers"]
+        dimmed = frame_source.LazyFrameSource(
+            lambda frame_index: cv2.convertScaleAbs(layers.load(frame_index)[0], alpha=dim_factor),
+            len(layers), _frame_cache)
+    else:
+        premultiplied = prepared["premultiplied"]
+        dimmed = np.empty_like(premultiplied)
+        if premultiplied.size:
+            dimmed = cv2.convertScaleAbs(premultiplied.reshape(-1, premultiplied.shape[2], 3),
+                                         alpha=dim_factor).reshape(premultiplied.shape)
+    return {"percentage": DIM_PERCENTAGE, "premultiplied": dimmed}
+
+
+def _close_dim_variant(prepared: dict | None):
+    """Удаляет затемненный вариант кадров ассета (освобождая кадры ленивого варианта в кэше)."""
+    if not prepared:
+        return
+    dim_variant = prepared.pop("dimmed", None)
+    if dim_variant is not None and isinstance(dim_variant["premultiplied"], frame_source.LazyFrameSource):
+        dim_variant["premultiplied"].close()
+
+
+def _clear_dim_variants():
+    """Сбрасывает затемненные варианты всех ассетов (после изменения DIM_PERCENTAGE)."""
+    with _avatar_frames_lock:
+        for state in _animation_assets.values():
+            _close_dim_variant(state.prepared)
+
+
+def _get_dimmed_avatar_layer(prepared: dict, frame_index: int) -> tuple | None:
+    """Как _get_avatar_layer, но с затемненным RGB из варианта ассета для текущего DIM_PERCENTAGE."""
+    avatar_layer = _get_avatar_layer(prepared, frame_index)
+    if avatar_layer is None or DIM_PERCENTAGE == 0:
+        return avatar_layer
+
+    dim_variant = prepared.get("dimmed")
+    if dim_variant is None or dim_variant["percentage"] != DIM_PERCENTAGE:
+        _close_dim_variant(prepared)
+        dim_variant = _create_dim_variant(prepared)
+        prepared["dimmed"] = dim_variant
+
+    dimmed_frames = dim_variant["premultiplied"]
+    return (dimmed_frames[frame_index % len(dimmed_frames)], *avatar_layer[1:])
+
+
+def _get_layer_rect(avatar_layer: tuple, frame_size: tuple[int, int]) -> tuple[int, int, int, int]:
+    """Прямоугольник (x1, y1, x2, y2) обрезанного слоя в координатах кадра ассета, масштабированного до frame_size."""
+    avatar_premultiplied, _, (crop_x, crop_y), (frame_w, frame_h) = avatar_layer
+    crop_h, crop_w = avatar_premultiplied.shape[:2]
+    scale_x, scale_y = frame_size[0] / frame_w, frame_size[1] / frame_h
+    return (round(crop_x * scale_x), round(crop_y * scale_y),
+            round((crop_x + crop_w) * scale_x), round((crop_y + crop_h) * scale_y))
+
+
+def _create_cross_fade_context(old_state: AnimationState | None, new_prepared: dict, new_layer: tuple | None) -> dict:
+    """
+    Готовит кроссфейд один раз в его начале. Слои уходящего аватара масштабируются до размера кадра нового
+    и размещаются в общем для обоих аватаров прямоугольнике, после чего смешивание каждого кадра -
+    это два cv2.addWeighted по premultiplied плоскостям без преобразований во float и выделения памяти.
+    Масштабированные слои кэшируются по индексу кадра: каждый кадр уходящего аватара готовится не больше одного раза.
+    """
+    old_prepared = old_state.prepared if old_state is not None and old_state.has_frames else None
+    old_layer = _get_avatar_layer(old_prepared, old_state.current_frame_index) if old_prepared else None
+    if new_layer is not None:
+        frame_size = new_layer[3]
+    elif old_layer is not None:
+        frame_size = old_layer[3]
+    else:
+        frame_size = (CAM_WIDTH, CAM_HEIGHT)
+
+    rect = union_rects(_get_layer_rect(old_layer, frame_size) if old_layer is not None else None,
+                        _get_layer_rect(new_layer, frame_size) if new_layer is not None else None)
+    context = {"old_state": old_state, "old_prepared": old_prepared, "new_prepared": new_prepared,
+               "frame_size": frame_size, "rect": rect, "old_layers": {}}
+    if rect is not None and rect[2] > rect[0] and rect[3] > rect[1]:
+        shape = (rect[3] - rect[1], rect[2] - rect[0], 3)
+        context["premultiplied"] = np.empty(shape, dtype=np.uint8)
+        context["inv_alpha"] = np.empty(shape, dtype=np.uint8)
+        if old_layer is not None:
+            _get_cross_fade_old_layer(context, old_state.current_frame_index)
+    else:
+        context["rect"] = None
+    return context
+
+
+def _get_cross_fade_old_layer(context: dict, frame_index: int | None) -> tuple[np.ndarray, np.ndarray]:
+    """Слой уходящего аватара, масштабированный и размещенный в прямоугольнике кроссфейда (с кэшированием)."""
+    cached_layer = context["old_layers"].get(frame_index)
+    if cached_layer is not None:
+        return cached_layer
+
+    rect_x1, rect_y1, rect_x2, rect_y2 = context["rect"]
+    premultiplied = np.zeros((rect_y2 - rect_y1, rect_x2 - rect_x1, 3), dtype=np.uint8)
+    inv_alpha = np.full_like(premultiplied, 255)  # Полностью прозрачный слой: 255 - A = 255
+    old_layer = _get_avatar_layer(context["old_prepared"], frame_index) \
+        if context["old_prepared"] and frame_index is not None else None
+    if old_layer is not None:
+        x1, y1, x2, y2 = _get_layer_rect(old_layer, context["frame_size"])
+        old_premultiplied, old_inv_alpha = old_layer[0], old_layer[1]
+        if x2 > x1 and y2 > y1:
+            if old_premultiplied.shape[:2] != (y2 - y1, x2 - x1):
+                old_premultiplied = cv2.resize(old_premultiplied, (x2 - x1, y2 - y1), interpolation=cv2.INTER_AREA)
+                old_inv_alpha = cv2.resize(old_inv_alpha, (x2 - x1, y2 - y1), interpolation=cv2.INTER_AREA)
+            target = np.s_[y1 - rect_y1:y2 - rect_y1, x1 - rect_x1:x2 - rect_x1]
+            premultiplied[target] = old_premultiplied
+            inv_alpha[target] = old_inv_alpha
+
+    cached_layer = (premultiplied, inv_alpha)
+    context["old_layers"][frame_index] = cached_layer
+    return cached_layer
+
+
+def _blend_cross_fade_layer(context: dict, old_frame_index: int | None, new_layer: tuple | None,
+                            fade_progress: float, old_brightness: float = 1.0) -> tuple | None:
+    """
+    Смешивает слои уходящего и нового аватара в буферы кроссфейда.
+    Для premultiplied alpha смешивание линейно и по RGB, и по инвертированной альфе: out = old * (1 - t) + new * t.
+    Вне прямоугольника нового аватара он прозрачен (RGB = 0, 255 - A = 255), это учитывается через beta.
+    old_brightness затемняет уходящий аватар прямо в весе смешивания (новый слой приходит уже затемненным).
+    Возвращает слой для _compose_frame или None, если смешивать нечего.
+    """
+    if context["rect"] is None:
+        return new_layer
+    old_premultiplied, old_inv_alpha = _get_cross_fade_old_layer(context, old_frame_index)
+    premultiplied, inv_alpha = context["premultiplied"], context["inv_alpha"]
+    old_weight = 1.0 - fade_progress
+
+    cv2.convertScaleAbs(old_premultiplied, dst=premultiplied, alpha=old_weight * old_brightness)
+    cv2.convertScaleAbs(old_inv_alpha, dst=inv_alpha, alpha=old_weight, beta=255.0 * fade_progress)
+    if new_layer is not None and new_layer[0].size:
+        new_premultiplied, new_inv_alpha = new_layer[0], new_layer[1]
+        x1, y1, _, _ = _get_layer_rect(new_layer, context["frame_size"])
+        new_h, new_w = new_premultiplied.shape[:2]
+        target = np.s_[y1 - context["rect"][1]:y1 - context["rect"][1] + new_h,
+                       x1 - context["rect"][0]:x1 - context["rect"][0] + new_w]
+        cv2.addWeighted(old_premultiplied[target], old_weight * old_brightness, new_premultiplied, fade_progress, 0.0,
+                        dst=premultiplied[target])
+        cv2.addWeighted(old_inv_alpha[target], old_weight, new_inv_alpha, fade_progress, 0.0,
+                        dst=inv_alpha[target])
+
+    return premultiplied, inv_alpha, context["rect"][:2], context["frame_size"]
 
 
 def initialize_virtual_camera():
     """
     Инициализирует объект виртуальной камеры pyvirtualcam и предварительно загружает все изображения.
-    Размеры камеры теперь определяются размерами фонового изображения BG.png/gif.
+    Размеры камеры определяются размерами фонового изображения BG.png/gif или OUTPUT_RESOLUTION из конфига.
     Эта функция предназначена для вызова из gui_elements.py.
     """
     global virtual_cam_obj, CAM_WIDTH, CAM_HEIGHT, CAM_FPS
     global _animation_assets, _current_active_avatar_frames, _avatar_frames_lock, _old_avatar_frames_data
     global _bouncing_enabled, _cross_fade_enabled, CROSS_FADE_DURATION_MS, _reset_animation_on_status_change, _instant_talk_transition
     global _dim_enabled, DIM_PERCENTAGE
-    global _shared_memory_map, _shared_memory_buffer, _new_frame_event
+    global _frame_sink, _output_frame_buffer, _frame_cache, _compact_gif_frames, _output_height, _asset_scale
+    global _adaptive_quality_enabled
 
     # Закрываем существующие ресурсы общей памяти и события, если они активны
-    if _shared_memory_map is not None:
+    if _frame_sink is not None:
         print("Общая память уже активна. Закрываю перед повторной инициализации.")
         shutdown_virtual_camera()
+    _stop_asset_watcher()
+    _release_animation_assets()
+    _asset_cache_keys_in_use.clear()
 
     print("\n--- Инициализация виртуальной камеры и предварительная загрузка изображений/анимаций ---")
 
@@ -266,22 +864,31 @@ def initialize_virtual_camera():
     except ValueError:
         pass  # Используем дефолтное значение
 
+    # Кэш кадров для GIF, которые слишком велики, чтобы декодировать их целиком
+    frame_cache_memory_mb = _initial_frame_cache_memory_mb_default
+    try:
+        frame_cache_memory_mb_from_config = int(
+            config.get('FRAME_CACHE_MEMORY_MB', str(_initial_frame_cache_memory_mb_default)))
+        if frame_cache_memory_mb_from_config > 0:
+            frame_cache_memory_mb = frame_cache_memory_mb_from_config
+    except ValueError:
+        pass  # Используем дефолтное значение
+    _frame_cache = frame_source.FrameCache(frame_cache_memory_mb * 1024 * 1024)
+    _compact_gif_frames = config.get('COMPACT_GIF_FRAMES', 'False').lower() == 'true'
+    _output_height = _parse_output_resolution(config.get('OUTPUT_RESOLUTION', 'auto'))
+    _asset_scale = 1.0
+    _adaptive_quality_enabled = config.get('ADAPTIVE_QUALITY', 'True').lower() == 'true'
+
+    # Декодируем все уникальные файлы ассетов параллельно в отдельных процессах прямо в дисковый кэш кадров,
+    # после чего загрузка ниже только отображает готовые кадры в память
+    _decode_assets_in_parallel()
+
     # Загружаем фон и аватары первыми.
     # CAM_WIDTH и CAM_HEIGHT будут установлены функцией _load_frames_from_file при загрузке BG.
     bg_frames, bg_fps, bg_durations = _load_frames_from_file(BACKGROUND_IMAGE_PATH, is_avatar=False, resize_to_cam=True)
-    _animation_assets["Background"] = {
-        "frames": bg_frames,
-        "original_fps": bg_fps,
-        "current_float_index": 0.0,
-        "animation_start_time": time.perf_counter(),
-        "last_frame_time": time.perf_counter(),
-        "smoothed_dt": 1.0 / CAM_FPS if CAM_FPS > 0 else POLLING_INTERVAL_SECONDS,  # Начальное сглаженное dt
-        "durations": bg_durations,
-        "current_frame_index": 0,  # Добавляем текущий индекс кадра для покадровой анимации
-        "frame_elapsed": 0.0  # Добавляем время, прошедшее для текущего кадра
-    }
-
-    if not bg_frames:
+    _animation_assets["Background"] = AnimationState(bg_frames, bg_durations, bg_fps)
+
+    if len(bg_frames) == 0:
         print("КРИТИЧЕСКАЯ ОШИБКА: Не удалось загрузить фоновое изображение. Не могу инициализировать камеру.")
         virtual_cam_obj = False  # Сигнал об ошибке запуска камеры
         return
@@ -289,24 +896,18 @@ def initialize_virtual_camera():
     # Загружаем аватары и находим максимальный FPS среди всех ассетов
     max_effective_fps_found = bg_fps  # Начинаем с FPS фона
     for status, filename in STATUS_TO_FILENAME_MAP.items():
-        frames, original_fps, frame_durations = _load_frames_from_file(filename, is_avatar=True)
-        _animation_assets[status] = {
-            "frames": frames,
-            "original_fps": original_fps,
-            "current_float_index": 0.0,
-            "animation_start_time": time.perf_counter(),
-            "last_frame_time": time.perf_counter(),
-            "smoothed_dt": 1.0 / CAM_FPS if CAM_FPS > 0 else POLLING_INTERVAL_SECONDS,  # Начальное сглаженное dt
-            "durations": frame_durations,
-            "current_frame_index": 0,  # Добавляем текущий индекс кадра для покадровой анимации
-            "frame_elapsed": 0.0  # Добавляем время, прошедшее для текущего кадра
-        }
-        if not frames:
+        # Статусы с одним и тем же файлом разделяют кадры, но у каждого свое состояние воспроизведения
+        frames, original_fps, frame_durations, prepared = _load_avatar_asset(filename)
+        _animation_assets[status] = AnimationState(frames, frame_durations, original_fps, prepared=prepared)
+        if len(frames) == 0:
             print(f"ПРЕДУПРЕЖДЕНИЕ: Не удалось загрузить аватар для статуса '{status}'. Использую пустой набор кадров.")
 
         # Обновляем максимальный FPS, если найден новый
         max_effective_fps_found = max(max_effective_fps_found, original_fps)
 
+    # Записи дискового кэша для файлов, которых больше нет или которые изменились, больше не нужны
+    asset_cache.prune(ASSET_CACHE_FOLDER, _asset_cache_keys_in_use)
+
     # Проверка, что CAM_WIDTH и CAM_HEIGHT были установлены
     if CAM_WIDTH == 0 or CAM_HEIGHT == 0:
         print(
@@ -314,6 +915,14 @@ def initialize_virtual_camera():
         CAM_WIDTH = 640
         CAM_HEIGHT = 360
 
+    # Фон хранится сразу в выходном разрешении, а выходной буфер выделяется один раз
+    bg_state = _animation_assets["Background"]
+    if not isinstance(bg_state.frames, frame_source.LazyFrameSource):
+        bg_state.frames, bg_state.is_static = _prepare_background_frames(bg_state.frames)
+    bg_state.set_durations(bg_state.durations[:len(bg_state.frames)])
+    _output_frame_buffer = np.empty((CAM_HEIGHT, CAM_WIDTH, 3), dtype=np.uint8)
+    _invalidate_output_frame()
+
     try:
         fade_duration_from_config = int(config.get('CROSS_FADE_DURATION_MS', str(_initial_cross_fade_duration_default)))
         CROSS_FADE_DURATION_MS = fade_duration_from_config if fade_duration_from_config >= 0 else _initial_cross_fade_duration_default
@@ -328,85 +937,41 @@ def initialize_virtual_camera():
         f"Итоговая частота кадров виртуальной камеры установлена на: {CAM_FPS} FPS.")
 
     try:
-        print(f"Попытка открытия/создания общей памяти и события Win32: {CAM_WIDTH}x{CAM_HEIGHT} @ {CAM_FPS} FPS...")
-
-        # Открытие/создание memory-mapped file
-        try:
-            _shared_memory_map = mmap.mmap(-1, TOTAL_SHARED_MEM_SIZE, tagname=SHARED_MEM_NAME)
-            print(f"  Открыт существующий Memory-Mapped File: {SHARED_MEM_NAME}")
-        except Exception as e:  # Catch any error, typically FileNotFoundError on first run
-            print(f"  Не удалось открыть существующий Memory-Mapped File, попытка создания: {e}")
-            _shared_memory_map = mmap.mmap(-1, TOTAL_SHARED_MEM_SIZE, tagname=SHARED_MEM_NAME, access=mmap.ACCESS_WRITE)
-            print(f"  Создан новый Memory-Mapped File: {SHARED_MEM_NAME}")
-
-        _shared_memory_buffer = memoryview(_shared_memory_map)
-
-        # Открытие/создание Win32 Event
-        try:
-            _new_frame_event = win32event.OpenEvent(win32event.EVENT_ALL_ACCESS, False, NEW_FRAME_EVENT_NAME)
-            print(f"  Открыто существующее Win32 Event: {NEW_FRAME_EVENT_NAME}")
-        except pywintypes.error as e:
-            if e.winerror == 2:  # ERROR_FILE_NOT_FOUND (Event not found)
-                print(f"  Не удалось открыть существующее Win32 Event, попытка создания: {e}")
-                _new_frame_event = win32event.CreateEvent(None, False, False, NEW_FRAME_EVENT_NAME)
-                print(f"  Создано новое Win32 Event: {NEW_FRAME_EVENT_NAME}")
-            else:
-                raise e  # Перебрасываем другие ошибки Win32
+        sink = frame_sink.create_frame_sink()
+        print(f"Попытка открытия/создания приемника кадров {type(sink).__name__}: {CAM_WIDTH}x{CAM_HEIGHT} @ {CAM_FPS} FPS...")
+        # Приемник записывает начальные параметры в заголовок общей памяти (frameReady = 0)
+        sink.open(CAM_WIDTH, CAM_HEIGHT, CAM_FPS)
+        _frame_sink = sink
+        print("  Начальные параметры записаны в общую память.")
 
         virtual_cam_obj = True  # Отмечаем, что инициализация прошла успешно
 
-        # Записываем начальные параметры в общую память
-        # Формат: width, height, fps, format (0=RGB24), frameSize, frameReady
-        # frameSize будет обновляться при отправке каждого кадра,
-        # frameReady устанавливается в 0 после использования в C++
-        header_data = struct.pack(SHARED_BUFFER_HEADER_FORMAT,
-                                  CAM_WIDTH, CAM_HEIGHT, CAM_FPS, 0,  # Format 0 for RGB24
-                                  CAM_WIDTH * CAM_HEIGHT * 3,  # Initial frameSize
-                                  0  # frameReady = 0, так как кадр еще не отправлен
-                                  )
-        _shared_memory_buffer[:SHARED_BUFFER_HEADER_SIZE] = header_data
-        print("  Начальные параметры записаны в общую память.")
-
-        initial_avatar_data = _animation_assets.get("Молчит",
-                                                    {"frames": [], "original_fps": 1.0, "current_float_index": 0.0,
-                                                     "animation_start_time": 0.0, "last_frame_time": 0.0,
-                                                     "smoothed_dt": 0.0, "durations": [], "current_frame_index": 0,
-                                                     "frame_elapsed": 0.0})
-        _current_active_avatar_frames = initial_avatar_data
-        # Инициализируем _old_avatar_frames_data пустой структурой
-        _old_avatar_frames_data = {"frames": [], "original_fps": 1.0, "current_float_index": 0.0,
-                                   "animation_start_time": 0.0, "last_frame_time": 0.0, "smoothed_dt": 0.0,
-                                   "durations": [], "current_frame_index": 0, "frame_elapsed": 0.0}
-
-        if not initial_avatar_data['frames']:
-            # Создаем пустой черный RGBA кадр, если нет аватаров
-            initial_avatar_data['frames'] = [np.zeros((CAM_HEIGHT, CAM_WIDTH, 4), dtype=np.uint8)]
-            # Для заглушки используем оригинальный FPS или 1.0, если он не определен
-            initial_avatar_data['durations'] = [1.0 / initial_avatar_data['original_fps']] if initial_avatar_data[
-                                                                                                  'original_fps'] > 0 else [
-                0.1]
+        initial_avatar_data = _animation_assets.get("Молчит")
+        if initial_avatar_data is None or not initial_avatar_data.has_frames:
+            # Создаем пустой прозрачный RGBA кадр, если нет аватаров
+            initial_avatar_data = _create_placeholder_avatar_state()
+            _animation_assets["Молчит"] = initial_avatar_data
             print("ПРЕДУПРЕЖДЕНИЕ: Нет кадров для 'Молчит' при инициализации. Использую заглушку.")
+        _current_active_avatar_frames = initial_avatar_data
+        _old_avatar_frames_data = None
+        # Часы неактивных статусов стоят, пока статус не станет активным
+        start_time = time.perf_counter()
+        for status_name, state in _animation_assets.items():
+            if status_name != "Background" and state is not initial_avatar_data:
+                state.pause(start_time)
 
         # Композируем первый кадр для отправки
-        initial_frame_rgb = _compose_frame(_animation_assets["Background"]["frames"][0],
-                                           initial_avatar_data['frames'][0], y_offset_addition=0)
+        initial_frame_rgb = _compose_frame(_animation_assets["Background"].frames[0],
+                                           _get_avatar_layer(initial_avatar_data.prepared, 0),
+                                           y_offset_addition=0, output_frame=_output_frame_buffer)
 
         # Отправляем первый кадр в общую память
         if initial_frame_rgb is not None:
             # Убедимся, что кадр в RGB24 (3 байта на пиксель) и правильного размера
             if initial_frame_rgb.shape[2] == 3 and initial_frame_rgb.shape[0] == CAM_HEIGHT and initial_frame_rgb.shape[
                 1] == CAM_WIDTH:
-                frame_data_bytes = initial_frame_rgb.tobytes()
-                # Записываем данные кадра после заголовка
-                _shared_memory_buffer[
-                SHARED_BUFFER_HEADER_SIZE:SHARED_BUFFER_HEADER_SIZE + len(frame_data_bytes)] = frame_data_bytes
-
-                # Обновляем frameReady в заголовке
-                _shared_memory_buffer[SHARED_BUFFER_HEADER_SIZE - 4: SHARED_BUFFER_HEADER_SIZE] = struct.pack("<I",
-                                                                                                              1)  # frameReady = 1
-
-                # Сигнализируем событие
-                win32event.SetEvent(_new_frame_event)
+                # Записываем кадр целиком в слот общей памяти и сигнализируем о нем
+                _frame_sink.write_frame(initial_frame_rgb)
                 print("  Первый кадр отправлен в общую память.")
             else:
                 print("ОШИБКА: Неверный формат или размер первого кадра для общей памяти.")
@@ -416,17 +981,15 @@ def initialize_virtual_camera():
         try:
             while not display_queue.empty():  # Очищаем очередь перед помещением первого кадра
                 display_queue.get_nowait()
-            display_queue.put_nowait(initial_frame_rgb)
+            display_queue.put_nowait(initial_frame_rgb.copy())
         except queue.Full:
             pass
 
-        # Запускаем основной поток камеры (который теперь включает логику генерации)
-        camera_loop = asyncio.new_event_loop()
-        camera_thread = threading.Thread(target=run_camera_sending_loop_in_thread, args=(camera_loop,),
-                                         name="CameraMainLoopThread")
-        camera_thread.daemon = True  # Поток завершится при завершении основной программы
-        camera_thread.start()
-        print(f"Запущен основной поток камеры: {camera_thread.name}")
+        # Запускаем поток рендеринга (повторный запуск из GUI ничего не делает, пока этот поток работает)
+        start_render_thread()
+
+        # Изменения файлов в AVATAR_ASSETS_FOLDER подхватываются без перезапуска камеры
+        _start_asset_watcher()
 
 
     except Exception as e:
@@ -434,6 +997,9 @@ def initialize_virtual_camera():
         print(
             "Пожалуйста, убедитесь, что у вас установлен 'pywin32' (`pip install pywin32`) и DLL виртуальной камеры зарегистрирована.")
         virtual_cam_obj = False  # Отмечаем, что инициализация не удалась
+        if _frame_sink is not None:
+            _frame_sink.close()
+            _frame_sink = None
 
 
 def update_camera_parameters():
@@ -449,6 +1015,7 @@ def update_camera_parameters():
     global _reset_animation_on_status_change, _instant_talk_transition
     global _dim_enabled, DIM_PERCENTAGE
     global _camera_needs_restart  # New flag
+    global _adaptive_quality_enabled
     global _animation_assets  # Добавлено для доступа к original_fps ассетов
 
     print("\n--- Обновление параметров виртуальной камеры в рантайме (только глобальные переменные) ---")
@@ -463,12 +1030,19 @@ def update_camera_parameters():
     _reset_animation_on_status_change = config.get('RESET_ANIMATION_ON_STATUS_CHANGE', 'True').lower() == 'true'
     _instant_talk_transition = config.get('INSTANT_TALK_TRANSITION', 'True').lower() == 'true'
     _dim_enabled = config.get('DIM_ENABLED', 'True').lower() == 'true'
+    _adaptive_quality_enabled = config.get('ADAPTIVE_QUALITY', 'True').lower() == 'true'
+    if _quality_governor is not None:
+        _quality_governor.set_enabled(_adaptive_quality_enabled)
 
+    old_dim_percentage = DIM_PERCENTAGE
     try:
         dim_percentage_from_config = int(config.get('DIM_PERCENTAGE', '50'))
         DIM_PERCENTAGE = dim_percentage_from_config if 0 <= dim_percentage_from_config <= 100 else 50
     except ValueError:
         DIM_PERCENTAGE = 50
+    if DIM_PERCENTAGE != old_dim_percentage:
+        # Затемненные кадры подготовлены для старого процента и будут пересозданы при следующем обращении
+        _clear_dim_variants()
 
     try:
         CAM_FPS_from_config = int(config.get('CAM_FPS', str(_initial_cam_fps_default)))
@@ -483,8 +1057,12 @@ def update_camera_parameters():
     except ValueError:
         _camera_needs_restart = False  # Если конфиг FPS невалиден
 
-    # CAM_WIDTH и CAM_HEIGHT не обновляются здесь из конфига, они устанавливаются initialize_virtual_camera
-    # на основе фонового изображения.
+    # CAM_WIDTH и CAM_HEIGHT не обновляются здесь: ассеты масштабируются под разрешение при initialize_virtual_camera,
+    # поэтому новое OUTPUT_RESOLUTION применяется через перезапуск камеры
+    new_output_height = _parse_output_resolution(config.get('OUTPUT_RESOLUTION', 'auto'))
+    if new_output_height != _output_height:
+        _camera_needs_restart = True
+        print("Выходное разрешение (OUTPUT_RESOLUTION) изменилось. Сигнализирую GUI о необходимости перезапуска камеры.")
     print(f"  Разрешение камеры остается: {CAM_WIDTH}x{CAM_HEIGHT}")
 
     try:
@@ -493,6 +1071,9 @@ def update_camera_parameters():
     except ValueError:
         CROSS_FADE_DURATION_MS = _initial_cross_fade_duration_default
 
+    # Параметры (подпрыгивание, затемнение) влияют на содержимое кадра, поэтому следующий кадр перерисовывается целиком
+    _invalidate_output_frame()
+
     print("Параметры виртуальной камеры и настройки анимации успешно обновлены (только глобальные).")
 
 
@@ -510,91 +1091,297 @@ def reset_camera_needs_restart_flag():
 
 def get_calculated_bg_16_9_resolution():
     """
-    Возвращает текущие CAM_WIDTH и CAM_HEIGHT, которые теперь напрямую отражают размеры BG.
-    Это заглушка, чтобы GUI не ломался при попытке получить 16:9 разрешение.
+    Возвращает текущие CAM_WIDTH и CAM_HEIGHT: выходное разрешение из OUTPUT_RESOLUTION
+    (с пропорциями фона) или размеры BG, если разрешение не задано.
     """
     global CAM_WIDTH, CAM_HEIGHT
     return (CAM_WIDTH, CAM_HEIGHT)
 
 
-def _compose_frame(background_frame_rgb: np.ndarray, avatar_rgba_image: np.ndarray | None,
-                   y_offset_addition: int = 0) -> np.ndarray:
+def _compose_frame(background_frame_rgb: np.ndarray, avatar_layer: tuple | None,
+                   y_offset_addition: int = 0, output_frame: np.ndarray | None = None) -> np.ndarray:
     """
-    Композирует текущий кадр фона и заданное RGBA изображение аватара, применяя опциональное смещение по Y.
-    Фон масштабируется точно до CAM_WIDTH и CAM_HEIGHT (без сохранения соотношения сторон).
+    Композирует текущий кадр фона и подготовленный слой аватара, применяя опциональное смещение по Y.
+    Фон ожидается уже в разрешении CAM_WIDTH x CAM_HEIGHT (см. _prepare_background_frames).
     Возвращает NumPy массив RGB для отправки в виртуальную камеру.
     background_frame_rgb: RGB NumPy массив фонового кадра.
-    avatar_rgba_image: RGBA NumPy массив изображения аватара, или None, если аватара нет.
+    avatar_layer: слой из _get_avatar_layer (premultiplied, inv_alpha, crop_offset, frame_size), или None, если аватара нет.
     y_offset_addition: Дополнительное смещение по оси Y для аватара.
+    output_frame: Необязательный буфер (CAM_HEIGHT x CAM_WIDTH x 3), в который записывается результат вместо нового массива.
     """
     global CAM_WIDTH, CAM_HEIGHT
 
     if background_frame_rgb is None or CAM_WIDTH == 0 or CAM_HEIGHT == 0:
         return np.zeros((CAM_HEIGHT, CAM_WIDTH, 3), dtype=np.uint8)
 
-    # Непосредственное масштабирование фона до размеров камеры.
-    # Это приведет к растягиванию или сжатию, если соотношение сторон фона не совпадает с CAM_WIDTH/CAM_HEIGHT.
-    output_frame = cv2.resize(background_frame_rgb, (CAM_WIDTH, CAM_HEIGHT), interpolation=cv2.INTER_LINEAR)
+    if output_frame is None:
+        output_frame = np.empty((CAM_HEIGHT, CAM_WIDTH, 3), dtype=np.uint8)
 
-    # Остальная логика наложения аватара остается прежней
-    if avatar_rgba_image is None or avatar_rgba_image.shape[0] == 0 or avatar_rgba_image.shape[1] == 0:
-        return output_frame
+    if background_frame_rgb.shape[0] == CAM_HEIGHT and background_frame_rgb.shape[1] == CAM_WIDTH:
+        np.copyto(output_frame, background_frame_rgb)
+    else:
+        # Фон не был подготовлен заранее (не должно происходить в рабочем цикле)
+        cv2.resize(background_frame_rgb, (CAM_WIDTH, CAM_HEIGHT), dst=output_frame, interpolation=cv2.INTER_LINEAR)
 
-    avatar_height, avatar_width, _ = avatar_rgba_image.shape
+    _blend_avatar_layer(output_frame, avatar_layer, y_offset_addition)
+
+    return output_frame
 
-    new_avatar_w = int(avatar_width)
-    new_avatar_h = int(avatar_height)
 
-    if new_avatar_w <= 0 or new_avatar_h <= 0:
-        return output_frame
+def _get_bounce_offset_table() -> list[int]:
+    """
+    Возвращает смещения подпрыгивания по номеру кадра от начала анимации (кадры идут с шагом 1/CAM_FPS).
+    Кривая -BOUNCING_MAX_OFFSET_PIXELS * sin(pi * progress) считается один раз и пересчитывается,
+    только если изменились CAM_FPS, BOUNCING_DURATION_MS или BOUNCING_MAX_OFFSET_PIXELS.
+    Смещения целые, поэтому подпрыгивание - это сдвиг уже подготовленного слоя без пересчета его пикселей.
+    """
+    global _bounce_offset_table, _bounce_offset_table_key
+    table_key = (CAM_FPS, BOUNCING_DURATION_MS, BOUNCING_MAX_OFFSET_PIXELS)
+    if table_key != _bounce_offset_table_key:
+        frames_per_bounce = BOUNCING_DURATION_MS * max(CAM_FPS, 1) / 1000
+        frame_count = max(1, math.ceil(frames_per_bounce))
+        progress = np.arange(frame_count) / frames_per_bounce if frames_per_bounce > 0 else np.zeros(1)
+        # Усечение к нулю, как int(), чтобы кривая совпадала с прежним покадровым расчетом
+        _bounce_offset_table = np.trunc(-BOUNCING_MAX_OFFSET_PIXELS * np.sin(progress * math.pi)).astype(int).tolist()
+        _bounce_offset_table_key = table_key
+    return _bounce_offset_table
+
+
+def _get_avatar_rect(avatar_layer: tuple | None, y_offset_addition: int = 0) -> tuple | None:
+    """
+    Вычисляет положение слоя аватара на кадре камеры.
+    Возвращает ((x1, y1, x2, y2), (x_offset, y_offset)): прямоугольник, обрезанный по границам кадра,
+    и исходную точку обрезанного слоя. None, если аватар не попадает в кадр.
+    """
+    if avatar_layer is None:
+        return None
 
-    # Используем cv2.INTER_LINEAR для масштабирования аватара
-    avatar_resized = cv2.resize(avatar_rgba_image, (new_avatar_w, new_avatar_h), interpolation=cv2.INTER_LINEAR)
+    avatar_premultiplied, _, (crop_x, crop_y), (frame_w, frame_h) = avatar_layer
+    crop_h, crop_w = avatar_premultiplied.shape[:2]
+    if crop_w <= 0 or crop_h <= 0:
+        return None
 
-    # Центрируем аватар относительно CAM_WIDTH/CAM_HEIGHT
-    x_offset = (CAM_WIDTH - new_avatar_w) // 2
+    # Центрируем аватар относительно CAM_WIDTH/CAM_HEIGHT, затем сдвигаем на смещение обрезки
+    x_offset = (CAM_WIDTH - frame_w) // 2 + crop_x
     # Смещаем аватар ниже, если масштабирован и включено подпрыгивание
     total_bounce_range = BOUNCING_MAX_OFFSET_PIXELS if _bouncing_enabled else 0
-    y_offset = CAM_HEIGHT - new_avatar_h + total_bounce_range + y_offset_addition
+    y_offset = CAM_HEIGHT - frame_h + total_bounce_range + y_offset_addition + crop_y
 
-    avatar_rgb_float = avatar_resized[:, :, :3].astype(np.float32)
-    alpha_channel_float = avatar_resized[:, :, 3].astype(np.float32) / 255.0
-    alpha_factor_3_chan = cv2.merge([alpha_channel_float, alpha_channel_float, alpha_channel_float])
+    x1, y1 = max(0, x_offset), max(0, y_offset)
+    x2, y2 = min(x_offset + crop_w, CAM_WIDTH), min(y_offset + crop_h, CAM_HEIGHT)
+    if y2 <= y1 or x2 <= x1:
+        return None
 
-    y1, y2 = y_offset, y_offset + new_avatar_h
-    x1, x2 = x_offset, x_offset + new_avatar_w
+    return (x1, y1, x2, y2), (x_offset, y_offset)
 
-    y2_clip = min(y2, CAM_HEIGHT)
-    x2_clip = min(x2, CAM_WIDTH)
-    y1_clip = max(0, y1)
-    x1_clip = max(0, x1)
 
-    actual_h = y2_clip - y1_clip
-    actual_w = x2_clip - x1_clip
+def _blend_avatar_layer(output_frame: np.ndarray, avatar_layer: tuple | None,
+                        y_offset_addition: int = 0, background_frame_rgb: np.ndarray | None = None) -> tuple | None:
+    """
+    Накладывает слой аватара на output_frame на месте.
+    Если передан background_frame_rgb, фон под аватаром берется из него, а не из output_frame:
+    тогда восстанавливать фон в прямоугольнике аватара перед наложением не нужно.
+    Возвращает прямоугольник (x1, y1, x2, y2), в который был наложен аватар, или None.
+    """
+    placement = _get_avatar_rect(avatar_layer, y_offset_addition)
+    if placement is None:
+        return None
 
-    if actual_h <= 0 or actual_w <= 0:
-        return output_frame
+    (x1, y1, x2, y2), (x_offset, y_offset) = placement
+    avatar_premultiplied, avatar_inv_alpha = avatar_layer[0], avatar_layer[1]
+    src_y1, src_x1 = y1 - y_offset, x1 - x_offset
+    src_y2, src_x2 = src_y1 + (y2 - y1), src_x1 + (x2 - x1)
 
-    avatar_rgb_clipped = avatar_rgb_float[
-                         (y1_clip - y_offset):(y1_clip - y_offset) + actual_h,
-                         (x1_clip - x_offset):(x1_clip - x_offset) + actual_w
-                         ]
-    alpha_factor_clipped = alpha_factor_3_chan[
-                           (y1_clip - y_offset):(y1_clip - y_offset) + actual_h,
-                           (x1_clip - x_offset):(x1_clip - x_offset) + actual_w
-                           ]
+    # Целочисленное наложение premultiplied alpha прямо в ROI фона: bg * (255 - A) / 255 + RGB * A / 255
+    bg_roi = output_frame[y1:y2, x1:x2]
+    source_roi = bg_roi if background_frame_rgb is None else background_frame_rgb[y1:y2, x1:x2]
+    cv2.multiply(source_roi, avatar_inv_alpha[src_y1:src_y2, src_x1:src_x2], dst=bg_roi, scale=1.0 / 255.0)
+    cv2.add(bg_roi, avatar_premultiplied[src_y1:src_y2, src_x1:src_x2], dst=bg_roi)
 
-    if avatar_rgb_clipped.shape[0] == 0 or avatar_rgb_clipped.shape[1] == 0:
-        return output_frame
+    return x1, y1, x2, y2
 
-    bg_roi = output_frame[y1_clip:y2_clip, x1_clip:x2_clip].astype(np.float32)
 
-    blended_roi = avatar_rgb_clipped * alpha_factor_clipped + \
-                  bg_roi * (1 - alpha_factor_clipped)
+def _invalidate_output_frame():
+    """Сбрасывает состояние dirty-rect композиции: каждый выходной буфер будет перерисован целиком."""
+    global _last_frame_key, _pipeline_published_state
+    _output_frame_states.clear()
+    _last_frame_key = None
+    _pipeline_published_state = None
 
-    output_frame[y1_clip:y2_clip, x1_clip:x2_clip] = blended_roi.astype(np.uint8)
 
-    return output_frame
+def get_frame_scheduler_stats() -> dict:
+    """Статистика планировщика кадров: достигнутый FPS, джиттер и пропущенные дедлайны (пустой словарь до запуска цикла)."""
+    if _frame_scheduler is None:
+        return {}
+    return _frame_scheduler.get_stats()
+
+
+def get_quality_governor_stats() -> dict:
+    """Текущий уровень адаптивного качества и количество переключений (пустой словарь до запуска цикла)."""
+    if _quality_governor is None:
+        return {}
+    return _quality_governor.get_stats()
+
+
+def get_frame_metrics_snapshot() -> dict:
+    """
+    Снимок телеметрии цикла кадров (frame_metrics.FrameMetrics.snapshot): достигнутый FPS, отправленные, пропущенные,
+    отброшенные и опоздавшие кадры, перцентили задержек стадий. Дешевый, можно опрашивать из GUI и логов.
+    """
+    return _frame_metrics.snapshot()
+
+
+def get_skipped_frames_count() -> int:
+    """Возвращает количество кадров, для которых композиция и запись в общую память были пропущены."""
+    return _frame_metrics.skipped_frames
+
+
+def _subtract_rect(rect: tuple, hole: tuple | None) -> list[tuple]:
+    """
+    Разность прямоугольников rect - hole в виде не более четырех полос (сверху, снизу, слева, справа).
+    При вертикальном сдвиге аватара это ровно строки, которые аватар покинул.
+    """
+    x1, y1, x2, y2 = rect
+    if hole is None or hole[0] >= x2 or hole[2] <= x1 or hole[1] >= y2 or hole[3] <= y1:
+        return [rect]
+    hole_x1, hole_y1 = max(x1, hole[0]), max(y1, hole[1])
+    hole_x2, hole_y2 = min(x2, hole[2]), min(y2, hole[3])
+    strips = [(x1, y1, x2, hole_y1), (x1, hole_y2, x2, y2),
+              (x1, hole_y1, hole_x1, hole_y2), (hole_x2, hole_y1, x2, hole_y2)]
+    return [strip for strip in strips if strip[2] > strip[0] and strip[3] > strip[1]]
+
+
+def _compose_dirty_region(background_frame_rgb: np.ndarray, background_key, avatar_layer: tuple | None,
+                          y_offset_addition: int, output_frame: np.ndarray, output_key) -> tuple:
+    """
+    Обновляет постоянный выходной буфер только в изменившейся области.
+    output_key идентифицирует буфер (номер слота общей памяти или буфер конвейера), для каждого буфера
+    запоминается, какой кадр фона в нем лежит и где в нем нарисован аватар.
+    Если фон (background_key) в буфере тот же, из фона восстанавливаются лишь строки и столбцы, которые аватар
+    покинул (например, при подпрыгивании), а текущий прямоугольник аватара смешивается прямо из кадра фона.
+    Иначе фон копируется целиком.
+    Возвращает грязный прямоугольник (x1, y1, x2, y2), который нужно отправить потребителю, или None,
+    и запомненное состояние буфера (background_key, прямоугольник аватара) - его нельзя перечитывать
+    из _output_frame_states, поскольку другие потоки могут очистить словарь (_invalidate_output_frame).
+    """
+    placement = _get_avatar_rect(avatar_layer, y_offset_addition)
+    current_rect = placement[0] if placement is not None else None
+    output_state = _output_frame_states.get(output_key)
+    previous_background_key, previous_rect = output_state if output_state is not None else (None, None)
+
+    if background_key is None or background_key != previous_background_key:
+        np.copyto(output_frame, background_frame_rgb)
+        dirty_rect = (0, 0, CAM_WIDTH, CAM_HEIGHT)
+    else:
+        dirty_rect = union_rects(previous_rect, current_rect)
+        if previous_rect is not None:
+            for x1, y1, x2, y2 in _subtract_rect(previous_rect, current_rect):
+                output_frame[y1:y2, x1:x2] = background_frame_rgb[y1:y2, x1:x2]
+
+    _blend_avatar_layer(output_frame, avatar_layer, y_offset_addition, background_frame_rgb)
+
+    output_state = (background_key, current_rect)
+    _output_frame_states[output_key] = output_state
+    return dirty_rect, output_state
+
+
+def _get_pipeline_dirty_rect(output_state: tuple) -> tuple | None:
+    """
+    Область, которую поток отправки должен скопировать в общую память для только что собранного буфера конвейера.
+    Буферы конвейера сменяют друг друга, поэтому грязный прямоугольник самого буфера (относительно его прошлого
+    содержимого) не подходит: нужна разница с последним отправленным кадром. Возвращает None, если кадр не изменился.
+    output_state - состояние буфера, которое вернул _compose_dirty_region.
+    """
+    global _pipeline_published_state
+    background_key, current_rect = output_state
+    published_state = _pipeline_published_state
+    _pipeline_published_state = output_state
+    if published_state is None or background_key is None or published_state[0] != background_key:
+        return 0, 0, CAM_WIDTH, CAM_HEIGHT
+    return union_rects(published_state[1], current_rect)
+
+
+def _send_pipeline_frame(frame_rgb: np.ndarray | None, payload: tuple):
+    """Стадия отправки конвейера: копирует кадр в общую память, сигнализирует потребителю и обновляет предпросмотр."""
+    sink, dirty_rect, now = payload
+    if frame_rgb is not None and dirty_rect is not None:
+        write_start = time.perf_counter()
+        sink.write_frame(frame_rgb, dirty_rect, signal=False)
+        _frame_metrics.record_stage(frame_metrics.STAGE_SHM_WRITE, (time.perf_counter() - write_start) * 1000)
+    signal_start = time.perf_counter()
+    sink.signal_frame_ready()
+    _frame_metrics.record_stage(frame_metrics.STAGE_SIGNAL, (time.perf_counter() - signal_start) * 1000)
+    if frame_rgb is not None:
+        _publish_preview_frame(frame_rgb, now)
+
+
+def _get_frame_pipeline() -> frame_pipeline.FramePipeline:
+    """Возвращает запущенный конвейер композиции/отправки под текущий размер кадра, пересоздавая его при смене размера."""
+    global _frame_pipeline
+    frame_shape = (CAM_HEIGHT, CAM_WIDTH, 3)
+    if _frame_pipeline is None or _frame_pipeline.frame_shape != frame_shape:
+        _stop_frame_pipeline()
+        if _frame_pipeline is not None:
+            for buffer_index in range(_frame_pipeline.depth):
+                _output_frame_states.pop(("pipeline", buffer_index), None)
+        _frame_pipeline = frame_pipeline.FramePipeline(frame_shape, _send_pipeline_frame, FRAME_PIPELINE_DEPTH,
+                                                       metrics=_frame_metrics)
+    _frame_pipeline.start()
+    return _frame_pipeline
+
+
+def _stop_frame_pipeline():
+    """
+    Дожидается отправки поставленных кадров и останавливает поток отправки конвейера.
+    Буферы и статистика сохраняются до следующего запуска; следующий кадр будет скопирован в общую память целиком.
+    """
+    global _pipeline_published_state
+    if _frame_pipeline is not None and not _frame_pipeline.stop():
+        print("ПРЕДУПРЕЖДЕНИЕ: Поток отправки кадров не завершился вовремя.")
+    _pipeline_published_state = None
+
+
+def get_frame_pipeline_stats() -> dict:
+    """
+    Статистика конвейера композиции/отправки из телеметрии _frame_metrics: время стадий (среднее/максимум в мс)
+    и кадры, отброшенные из-за заполненного конвейера (пустой словарь, если конвейер не используется).
+    """
+    if _frame_pipeline is None:
+        return {}
+    snapshot = _frame_metrics.snapshot()
+    stats = {"depth": _frame_pipeline.depth, "dropped_frames": snapshot["dropped_frames"]}
+    for name, stage in (("compose", frame_metrics.STAGE_COMPOSE), ("send", frame_metrics.STAGE_PIPELINE_SEND),
+                        ("queue", frame_metrics.STAGE_PIPELINE_QUEUE)):
+        stats[f"{name}_avg_ms"] = snapshot["stages"][stage]["avg_ms"]
+        stats[f"{name}_max_ms"] = snapshot["stages"][stage]["max_ms"]
+    return stats
+
+
+def _publish_preview_frame(frame_rgb: np.ndarray, now: float):
+    """
+    Отдает кадр в display_queue для предпросмотра в GUI не чаще PREVIEW_FPS раз в секунду.
+    Кадр копируется в один из заранее выделенных буферов, чтобы не выделять память на каждом кадре.
+    """
+    global _preview_buffers, _preview_buffer_index, _last_preview_time
+
+    if now - _last_preview_time < 1.0 / PREVIEW_FPS:
+        return
+    _last_preview_time = now
+    preview_start = time.perf_counter()
+
+    if not _preview_buffers or _preview_buffers[0].shape != frame_rgb.shape:
+        _preview_buffers = [np.empty_like(frame_rgb) for _ in range(PREVIEW_BUFFER_COUNT)]
+    _preview_buffer_index = (_preview_buffer_index + 1) % PREVIEW_BUFFER_COUNT
+    preview_frame = _preview_buffers[_preview_buffer_index]
+    np.copyto(preview_frame, frame_rgb)
+
+    try:
+        while not display_queue.empty():
+            display_queue.get_nowait()
+        display_queue.put_nowait(preview_frame)
+    except (queue.Full, queue.Empty):
+        pass
+    _frame_metrics.record_stage(frame_metrics.STAGE_PREVIEW, (time.perf_counter() - preview_start) * 1000)
 
 
 def get_static_preview_frame(current_status: str) -> np.ndarray:
@@ -606,307 +1393,312 @@ def get_static_preview_frame(current_status: str) -> np.ndarray:
     global _animation_assets, CAM_WIDTH, CAM_HEIGHT
 
     # Используем CAM_WIDTH и CAM_HEIGHT, так как _compose_frame уже обработает масштабирование
-    if "Background" not in _animation_assets or not _animation_assets["Background"][
-        "frames"] or CAM_WIDTH == 0 or CAM_HEIGHT == 0:
+    if "Background" not in _animation_assets or not _animation_assets[
+        "Background"].has_frames or CAM_WIDTH == 0 or CAM_HEIGHT == 0:
         print(
             "ПРЕДУПРЕЖДЕНИЕ (get_static_preview_frame): Фон не загружен или размеры камеры не определены. Возвращаю пустой кадр.")
         return np.zeros((360, 640, 3), dtype=np.uint8)
 
     # Получаем данные фона из _animation_assets
-    background_data_for_preview = _animation_assets["Background"]
-    background_frames_for_preview = background_data_for_preview['frames']
+    background_frames_for_preview = _animation_assets["Background"].frames
 
-    avatar_data_for_preview = _animation_assets.get(current_status,
-                                                    {"frames": [], "original_fps": 1.0, "current_float_index": 0.0})
-    avatar_frames_for_preview = avatar_data_for_preview['frames']
+    avatar_data_for_preview = _animation_assets.get(current_status) or AnimationState()
 
-    if not avatar_frames_for_preview:
-        fallback_data = _animation_assets.get("Молчит",
-                                              {"frames": [], "original_fps": 1.0, "current_float_index": 0.0})
-        fallback_frames = fallback_data['frames']
+    if not avatar_data_for_preview.has_frames:
+        fallback_data = _animation_assets.get("Молчит") or AnimationState()
         print(
-            f"ПРЕДУПРЕЖДЕНИЕ (get_static_preview_frame): Кадры для статуса '{current_status}' не найдены. Использую 'Молчит' ({len(fallback_frames)} кадров) для предпросмотра.")
-        avatar_frames_for_preview = fallback_frames  # Use fallback if original is empty
+            f"ПРЕДУПРЕЖДЕНИЕ (get_static_preview_frame): Кадры для статуса '{current_status}' не найдены. Использую 'Молчит' ({len(fallback_data.frames)} кадров) для предпросмотра.")
+        avatar_data_for_preview = fallback_data  # Use fallback if original is empty
 
-    preview_frame = _compose_frame(background_frames_for_preview[0], avatar_frames_for_preview[0], y_offset_addition=0)
+    preview_frame = _compose_frame(background_frames_for_preview[0],
+                                   _get_avatar_layer(avatar_data_for_preview.prepared, 0), y_offset_addition=0)
     return preview_frame
 
 
-def run_camera_sending_loop_in_thread(loop):
-    """Целевая функция для основного потока виртуальной камеры."""
-    asyncio.set_event_loop(loop)
-    loop.run_until_complete(start_frame_sending_loop())
+class FrameRenderThread:
+    """
+    Владелец потока, который генерирует и отправляет кадры в виртуальную камеру.
+    Поток всегда один: start() ничего не делает, если поток уже работает, stop() просит его завершиться,
+    join() дожидается завершения. Кадры ждут дедлайна обычным блокирующим ожиданием (FrameScheduler.wait),
+    а вся тяжелая работа кадра выполняется вызовами OpenCV/NumPy, которые отпускают GIL,
+    поэтому потоки GUI (Qt) и мониторинга (Playwright) не отнимают у кадра время.
+    """
+
+    def __init__(self):
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> bool:
+        """Запускает поток рендеринга. Возвращает False, если поток уже работает."""
+        if self.is_running:
+            return False
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(self._stop_event,), name="CameraRenderThread",
+                                        daemon=True)  # Поток завершится при завершении основной программы
+        self._thread.start()
+        return True
+
+    def stop(self):
+        """Сигнализирует потоку рендеринга о завершении (не дожидаясь его)."""
+        self._stop_event.set()
+
+    def join(self, timeout: float | None = None) -> bool:
+        """Дожидается завершения потока. Возвращает True, если поток завершился."""
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+            if thread.is_alive():
+                return False
+        self._thread = None
+        return True
+
+    @staticmethod
+    def _run(stop_event: threading.Event):
+        frame_scheduler.raise_current_thread_priority()
+        _render_frames(stop_event)
 
 
-async def start_frame_sending_loop():
+_render_thread = FrameRenderThread()
+
+
+def start_render_thread() -> bool:
+    """Запускает поток рендеринга, если он еще не запущен. Возвращает True, если поток был запущен этим вызовом."""
+    started = _render_thread.start()
+    if started:
+        print("Запущен поток рендеринга камеры: CameraRenderThread")
+    return started
+
+
+def stop_render_thread(timeout: float = 5.0) -> bool:
+    """Останавливает поток рендеринга и дожидается его завершения. Возвращает False, если поток не успел завершиться."""
+    _render_thread.stop()
+    return _render_thread.join(timeout)
+
+
+def is_render_thread_running() -> bool:
+    return _render_thread.is_running
+
+
+def _render_frames(stop_event: threading.Event):
     """
-    Асинхронный цикл, который постоянно генерирует и отправляет кадры в виртуальную камеру.
+    Цикл, который постоянно генерирует и отправляет кадры в виртуальную камеру, пока не установлен stop_event.
     Эта функция предполагает, что виртуальная камера уже инициализирована (через общую память).
     """
     print(f"[{threading.current_thread().name}] Цикл отправки кадров запущен.")
-    global _cam_loop_running, display_queue, virtual_cam_obj, _current_active_avatar_frames, _animation_assets, _avatar_frames_lock
+    global display_queue, virtual_cam_obj, _current_active_avatar_frames, _animation_assets, _avatar_frames_lock
     global _bouncing_enabled, BOUNCING_MAX_OFFSET_PIXELS, _bouncing_active, _bouncing_start_time, CAM_FPS
     global _cross_fade_active, _cross_fade_start_time, _old_avatar_frames_data, _cross_fade_enabled, CROSS_FADE_DURATION_MS
+    global _cross_fade_context
     global _dim_enabled, DIM_PERCENTAGE, _last_composed_frame, _last_known_voice_status
-    global _shared_memory_buffer, _new_frame_event, SHARED_BUFFER_HEADER_SIZE, SHARED_BUFFER_HEADER_FORMAT
-    global _fps_history, _fps_display_frame_count, _last_displayed_avg_fps, FPS_DISPLAY_UPDATE_INTERVAL
-    global _send_time_ms
-    global ALPHA  # Добавлено для использования в EMA
-
-    _cam_loop_running = True
-
-    while _cam_loop_running:
+    global _frame_sink
+    global _output_frame_buffer, _last_frame_key, _frame_scheduler
+    global _quality_governor
+
+    # Кадры отправляются по абсолютным дедлайнам с шагом 1/CAM_FPS, поэтому задержки сна не накапливаются
+    scheduler = frame_scheduler.FrameScheduler(CAM_FPS)
+    _frame_scheduler = scheduler
+    # Время работы каждого кадра сравнивается с бюджетом 1/CAM_FPS; при нехватке качество понижается по шагам
+    governor = quality_governor.QualityGovernor(_adaptive_quality_enabled)
+    _quality_governor = governor
+    metrics = _frame_metrics
+    metrics.reset()
+
+    while not stop_event.is_set():
         real_frame_start = time.perf_counter()  # Начало измерения цикла кадра
+        frame_sent = frame_skipped = frame_dropped = False  # Итог итерации для телеметрии
 
         current_bounce_offset = 0
 
         now = time.perf_counter()  # Текущее время для расчетов elapsed
+        # Часы анимаций: при пониженном качестве кадры ассетов переключаются только на сетке из нескольких кадров камеры,
+        # а промежуточные кадры камеры пропускаются по ключу кадра без композиции
+        animation_now = now
+        if governor.animation_rate_divider > 1 and CAM_FPS > 0:
+            animation_step = governor.animation_rate_divider / CAM_FPS
+            animation_now = math.floor(now / animation_step) * animation_step
 
         # --- Логика расчета смещения для разового подпрыгивания ---
         if _bouncing_active and _bouncing_enabled:
             elapsed_ms = (now - _bouncing_start_time) * 1000
-            if elapsed_ms >= BOUNCING_DURATION_MS:
+            bounce_offsets = _get_bounce_offset_table()
+            bounce_frame_index = int(elapsed_ms * CAM_FPS / 1000)
+            if governor.coarse_bounce:
+                # Ближайший четный кадр кривой: смещение (и область перерисовки) меняется вдвое реже
+                bounce_frame_index -= bounce_frame_index % 2
+            if elapsed_ms >= BOUNCING_DURATION_MS or bounce_frame_index >= len(bounce_offsets):
                 _bouncing_active = False
                 current_bounce_offset = 0
             else:
-                progress = elapsed_ms / BOUNCING_DURATION_MS
-                current_bounce_offset = int(-BOUNCING_MAX_OFFSET_PIXELS * math.sin(progress * math.pi))
+                current_bounce_offset = bounce_offsets[bounce_frame_index]
 
         try:
             # Если общая память/событие не активны, пауза и продолжение
-            if _shared_memory_buffer is None or _new_frame_event is None:
-                await asyncio.sleep(POLLING_INTERVAL_SECONDS)  # Пауза, чтобы не нагружать ЦПУ
+            sink = _frame_sink
+            if sink is None or not sink.is_open:
+                stop_event.wait(POLLING_INTERVAL_SECONDS)  # Пауза, чтобы не нагружать ЦПУ
                 continue  # Продолжаем цикл, ожидая, что ресурсы могут быть инициализированы позже
 
-            final_avatar_image_rgba = None
+            final_avatar_layer = None
+            current_avatar_idx_to_use = None
+            fade_key = None  # (индекс кадра старого аватара, прогресс кроссфейда), пока кроссфейд активен
+            # Затемнение включено и статус не "Говорит"
+            dim_active = _dim_enabled and _last_known_voice_status != "Говорит"
 
+            animation_start = time.perf_counter()
             with _avatar_frames_lock:
                 # --- Обработка фонового кадра ---
-                background_idx_to_use = 0
-                if "Background" in _animation_assets and _animation_assets["Background"]["frames"]:
-                    bg_data = _animation_assets["Background"]
-
-                    # Логика покадрового продвижения для фона (если это GIF с duration)
-                    if bg_data['durations'] and len(bg_data['frames']) > 0:
-                        delta = now - bg_data['last_frame_time']
-                        bg_data['frame_elapsed'] += delta
-                        bg_data['last_frame_time'] = now
-
-                        while bg_data['frame_elapsed'] >= bg_data['durations'][bg_data['current_frame_index']]:
-                            bg_data['frame_elapsed'] -= bg_data['durations'][bg_data['current_frame_index']]
-                            bg_data['current_frame_index'] = (bg_data['current_frame_index'] + 1) % len(
-                                bg_data['durations'])
-                        background_idx_to_use = bg_data['current_frame_index']
-                    else:  # Если PNG или GIF без durations, используем старую логику (или просто первый кадр)
-                        # Для PNG или GIF без durations, используем original_fps для продвижения
-                        bg_elapsed = now - bg_data['last_frame_time']
-                        bg_data['last_frame_time'] = now
-                        bg_data['smoothed_dt'] = (1 - ALPHA) * bg_data['smoothed_dt'] + ALPHA * bg_elapsed
-                        if bg_data['original_fps'] > 0:
-                            bg_advance = bg_data['original_fps'] * bg_data['smoothed_dt']
-                            bg_data['current_float_index'] = (bg_data['current_float_index'] + bg_advance) % len(
-                                bg_data['frames'])
-                        background_idx_to_use = int(bg_data['current_float_index']) % len(bg_data['frames'])
-
-                    background_frame_to_composite = bg_data['frames'][background_idx_to_use]
+                bg_state = _animation_assets.get("Background")
+                if bg_state is not None and bg_state.has_frames:
+                    # Статичный фон не требует продвижения анимации
+                    background_idx_to_use = 0 if bg_state.is_static else bg_state.advance(animation_now)
+                    background_frame_to_composite = bg_state.frames[background_idx_to_use]
+                    background_key = (_assets_generation, background_idx_to_use)
                 else:
                     print("ПРЕДУПРЕЖДЕНИЕ: Фон не загружен в _animation_assets. Используется черный кадр.")
                     background_frame_to_composite = np.zeros((CAM_HEIGHT, CAM_WIDTH, 3), dtype=np.uint8)
+                    background_key = None  # Без ключа кадр всегда перерисовывается целиком
 
                 # --- Обработка текущего аватара ---
-                current_avatar_data = _current_active_avatar_frames
-                current_avatar_frames_list = current_avatar_data.get('frames', [])
-
-                if current_avatar_frames_list:
-                    # Логика покадрового продвижения для аватара
-                    if current_avatar_data['durations'] and len(current_avatar_frames_list) > 0:
-                        delta = now - current_avatar_data['last_frame_time']
-                        current_avatar_data['frame_elapsed'] += delta
-                        current_avatar_data['last_frame_time'] = now
-
-                        while current_avatar_data['frame_elapsed'] >= current_avatar_data['durations'][
-                            current_avatar_data['current_frame_index']]:
-                            current_avatar_data['frame_elapsed'] -= current_avatar_data['durations'][
-                                current_avatar_data['current_frame_index']]
-                            current_avatar_data['current_frame_index'] = (current_avatar_data[
-                                                                              'current_frame_index'] + 1) % len(
-                                current_avatar_data['durations'])
-                        current_avatar_idx_to_use = current_avatar_data['current_frame_index']
-                    else:  # Если PNG или GIF без durations, используем старую логику
-                        current_avatar_elapsed = now - current_avatar_data['last_frame_time']
-                        current_avatar_data['last_frame_time'] = now
-                        current_avatar_data['smoothed_dt'] = (1 - ALPHA) * current_avatar_data[
-                            'smoothed_dt'] + ALPHA * current_avatar_elapsed
-
-                        if current_avatar_data['original_fps'] > 0:
-                            current_avatar_advance = current_avatar_data['original_fps'] * current_avatar_data[
-                                'smoothed_dt']
-                            current_avatar_data['current_float_index'] = (current_avatar_data[
-                                                                              'current_float_index'] + current_avatar_advance) % len(
-                                current_avatar_frames_list)
-                        current_avatar_idx_to_use = int(current_avatar_data['current_float_index']) % len(
-                            current_avatar_frames_list)
-
-                    current_avatar_rgba = current_avatar_frames_list[current_avatar_idx_to_use].copy()
+                current_avatar_state = _current_active_avatar_frames
+                if current_avatar_state is not None and current_avatar_state.has_frames:
+                    current_avatar_idx_to_use = current_avatar_state.advance(animation_now)
+                    # Затемненный слой берется из заранее подготовленного варианта ассета
+                    if dim_active:
+                        current_avatar_layer = _get_dimmed_avatar_layer(current_avatar_state.prepared,
+                                                                        current_avatar_idx_to_use)
+                    else:
+                        current_avatar_layer = _get_avatar_layer(current_avatar_state.prepared,
+                                                                 current_avatar_idx_to_use)
                 else:
-                    current_avatar_rgba = np.zeros((CAM_HEIGHT, CAM_WIDTH, 4), dtype=np.uint8)
+                    current_avatar_layer = None
 
                 # --- Обработка старого аватара (для кроссфейда) ---
                 if _cross_fade_active and _cross_fade_enabled:
                     elapsed_ms_fade = (now - _cross_fade_start_time) * 1000
-                    if elapsed_ms_fade >= CROSS_FADE_DURATION_MS:
+                    # При пониженном качестве кроссфейд завершается сразу: новый аватар показывается без смешивания
+                    if elapsed_ms_fade >= CROSS_FADE_DURATION_MS or not governor.cross_fade_allowed:
                         _cross_fade_active = False
-                        final_avatar_image_rgba = current_avatar_rgba
+                        final_avatar_layer = current_avatar_layer
                         # Очищаем _old_avatar_frames_data после завершения кроссфейда
-                        _old_avatar_frames_data = {"frames": [], "original_fps": 1.0, "current_float_index": 0.0,
-                                                   "animation_start_time": 0.0, "last_frame_time": 0.0,
-                                                   "smoothed_dt": 0.0, "durations": [], "current_frame_index": 0,
-                                                   "frame_elapsed": 0.0}
+                        _old_avatar_frames_data = None
+                        _cross_fade_context = None
                     else:
                         fade_progress = elapsed_ms_fade / CROSS_FADE_DURATION_MS
-                        old_opacity = 1.0 - fade_progress
-                        new_opacity = fade_progress
-
-                        old_avatar_frames_list = _old_avatar_frames_data.get('frames', [])
-
-                        old_avatar_rgba = np.zeros((CAM_HEIGHT, CAM_WIDTH, 4), dtype=np.uint8)
-                        if old_avatar_frames_list:
-                            # Логика покадрового продвижения для старого аватара
-                            if _old_avatar_frames_data['durations'] and len(old_avatar_frames_list) > 0:
-                                delta = now - _old_avatar_frames_data['last_frame_time']
-                                _old_avatar_frames_data['frame_elapsed'] += delta
-                                _old_avatar_frames_data['last_frame_time'] = now
-
-                                while _old_avatar_frames_data['frame_elapsed'] >= _old_avatar_frames_data['durations'][
-                                    _old_avatar_frames_data['current_frame_index']]:
-                                    _old_avatar_frames_data['frame_elapsed'] -= _old_avatar_frames_data['durations'][
-                                        _old_avatar_frames_data['current_frame_index']]
-                                    _old_avatar_frames_data['current_frame_index'] = (_old_avatar_frames_data[
-                                                                                          'current_frame_index'] + 1) % len(
-                                        _old_avatar_frames_data['durations'])
-                                old_avatar_idx_to_use = _old_avatar_frames_data['current_frame_index']
-                            else:  # Если PNG или GIF без durations, используем старую логику
-                                old_avatar_elapsed = now - _old_avatar_frames_data['last_frame_time']
-                                _old_avatar_frames_data['last_frame_time'] = now
-                                _old_avatar_frames_data['smoothed_dt'] = (1 - ALPHA) * _old_avatar_frames_data[
-                                    'smoothed_dt'] + ALPHA * old_avatar_elapsed
-
-                                if _old_avatar_frames_data['original_fps'] > 0:
-                                    old_avatar_advance = _old_avatar_frames_data['original_fps'] * \
-                                                         _old_avatar_frames_data['smoothed_dt']
-                                    _old_avatar_frames_data['current_float_index'] = (_old_avatar_frames_data[
-                                                                                          'current_float_index'] + old_avatar_advance) % len(
-                                        old_avatar_frames_list)
-                                old_avatar_idx_to_use = int(_old_avatar_frames_data['current_float_index']) % len(
-                                    old_avatar_frames_list)
-
-                            old_avatar_rgba = old_avatar_frames_list[old_avatar_idx_to_use].copy()
-
-                        target_h, target_w = current_avatar_rgba.shape[0], current_avatar_rgba.shape[1]
-                        if old_avatar_rgba.shape[:2] != (target_h, target_w):
-                            old_avatar_rgba = cv2.resize(old_avatar_rgba, (target_w, target_h),
-                                                         interpolation=cv2.INTER_AREA)
-
-                        old_rgb_float = old_avatar_rgba[:, :, :3].astype(np.float32)
-                        old_alpha_float = old_avatar_rgba[:, :, 3].astype(np.float32) / 255.0
-
-                        new_rgb_float = current_avatar_rgba[:, :, :3].astype(np.float32)
-                        new_alpha_float = current_avatar_rgba[:, :, 3].astype(np.float32) / 255.0
-
-                        blended_alpha = old_alpha_float * old_opacity + new_alpha_float * new_opacity
-                        blended_alpha = np.clip(blended_alpha, 0.0, 1.0)
-
-                        blended_rgb = old_rgb_float * old_opacity + new_rgb_float * new_opacity
-
-                        final_avatar_image_rgba = np.zeros((target_h, target_w, 4), dtype=np.uint8)
-                        final_avatar_image_rgba[:, :, :3] = np.clip(blended_rgb, 0, 255).astype(np.uint8)
-                        final_avatar_image_rgba[:, :, 3] = np.clip(blended_alpha * 255, 0, 255).astype(np.uint8)
+
+                        old_avatar_idx_to_use = None
+                        if _old_avatar_frames_data is not None and _old_avatar_frames_data.has_frames:
+                            old_avatar_idx_to_use = _old_avatar_frames_data.advance(animation_now)
+
+                        current_prepared = current_avatar_state.prepared if current_avatar_layer is not None else None
+                        if (_cross_fade_context is None or _cross_fade_context["old_state"] is not _old_avatar_frames_data
+                                or _cross_fade_context["new_prepared"] is not current_prepared):
+                            _cross_fade_context = _create_cross_fade_context(_old_avatar_frames_data, current_prepared,
+                                                                             current_avatar_layer)
+                        final_avatar_layer = _blend_cross_fade_layer(
+                            _cross_fade_context, old_avatar_idx_to_use, current_avatar_layer, fade_progress,
+                            1.0 - (DIM_PERCENTAGE / 100.0) if dim_active else 1.0)
+                        fade_key = (old_avatar_idx_to_use, fade_progress)
 
                 else:
-                    final_avatar_image_rgba = current_avatar_rgba
-
-            # --- Применение затемнения ---
-            # Применяем затемнение, если оно включено и статус не "Говорит"
-            if _dim_enabled and _last_known_voice_status != "Говорит" and final_avatar_image_rgba is not None:
-                dim_factor = 1.0 - (DIM_PERCENTAGE / 100.0)
-                # Применяем затемнение только к RGB каналам, альфа-канал оставляем неизменным
-                final_avatar_image_rgba[:, :, :3] = (final_avatar_image_rgba[:, :, :3] * dim_factor).astype(np.uint8)
-
-            composition_end_time = time.perf_counter()  # Время окончания композиции
-            composed_frame_rgb = _compose_frame(background_frame_to_composite, final_avatar_image_rgba,
-                                                y_offset_addition=current_bounce_offset)
-            frame_gen_ms = (
-                                   time.perf_counter() - composition_end_time) * 1000  # Время генерации текущего кадра (фактически, время выполнения _compose_frame)
-
-            # --- Измерение времени отправки в общую память и сигнализации события ---
-            start_send_time = time.perf_counter()
-
-            # --- Отправка кадра в общую память ---
-            if composed_frame_rgb is not None:
-                # Убедимся, что кадр в RGB24 (3 байта на пиксель) и правильного размера
-                if composed_frame_rgb.shape[2] == 3 and composed_frame_rgb.shape[0] == CAM_HEIGHT and \
-                        composed_frame_rgb.shape[1] == CAM_WIDTH:
-                    frame_data_bytes = composed_frame_rgb.tobytes()
-                    # Записываем данные кадра после заголовка
-                    _shared_memory_buffer[
-                    SHARED_BUFFER_HEADER_SIZE:SHARED_BUFFER_HEADER_SIZE + len(frame_data_bytes)] = frame_data_bytes
-
-                    # Обновляем frameReady в заголовке
-                    # Сначала читаем текущий заголовок, чтобы не перезаписывать другие поля
-                    current_header = struct.unpack(SHARED_BUFFER_HEADER_FORMAT,
-                                                   _shared_memory_buffer[:SHARED_BUFFER_HEADER_SIZE])
-                    updated_header = list(current_header)
-                    updated_header[5] = 1  # frameReady = 1 (индекс 5)
-                    _shared_memory_buffer[:SHARED_BUFFER_HEADER_SIZE] = struct.pack(SHARED_BUFFER_HEADER_FORMAT,
-                                                                                    *updated_header)
-
-                    # Сигнализируем событие
-                    win32event.SetEvent(_new_frame_event)
+                    final_avatar_layer = current_avatar_layer
+                    _cross_fade_context = None
+
+            metrics.record_stage(frame_metrics.STAGE_ANIMATION, (time.perf_counter() - animation_start) * 1000)
+
+            # --- Пропуск кадра, если видимое содержимое не изменилось ---
+            # Ключ кадра: индекс фона, ассет и индекс аватара, смещение подпрыгивания, прогресс кроссфейда и затемнение
+            if background_key is None:
+                frame_key = None
+            else:
+                frame_key = (background_key, id(_current_active_avatar_frames), current_avatar_idx_to_use,
+                             current_bounce_offset, fade_key, dim_active, DIM_PERCENTAGE)
+
+            if frame_key is not None and frame_key == _last_frame_key and _last_composed_frame is not None:
+                frame_skipped = True
+                # Кадр в общей памяти уже актуален, обновляем только frameReady и событие для потребителя
+                if sink.supports_direct_write:
+                    signal_start = time.perf_counter()
+                    sink.signal_frame_ready()
+                    metrics.record_stage(frame_metrics.STAGE_SIGNAL, (time.perf_counter() - signal_start) * 1000)
                 else:
-                    print("ОШИБКА: Неверный формат или размер композированного кадра для общей памяти.")
+                    # Сигнал идет через поток отправки, чтобы не писать в заголовок одновременно с ним
+                    _get_frame_pipeline().submit(None, (sink, None, now))
             else:
-                print("ПРЕДУПРЕЖДЕНИЕ: Композированный кадр для отправки оказался None. Отправляю черный кадр.")
-                black_frame = np.zeros((CAM_HEIGHT, CAM_WIDTH, 3), dtype=np.uint8)
-                frame_data_bytes = black_frame.tobytes()
-                _shared_memory_buffer[
-                SHARED_BUFFER_HEADER_SIZE:SHARED_BUFFER_HEADER_SIZE + len(frame_data_bytes)] = frame_data_bytes
-                current_header = struct.unpack(SHARED_BUFFER_HEADER_FORMAT,
-                                               _shared_memory_buffer[:SHARED_BUFFER_HEADER_SIZE])
-                updated_header = list(current_header)
-                updated_header[5] = 1  # frameReady = 1
-                _shared_memory_buffer[:SHARED_BUFFER_HEADER_SIZE] = struct.pack(SHARED_BUFFER_HEADER_FORMAT,
-                                                                                *updated_header)
-                win32event.SetEvent(_new_frame_event)
-
-
-            # Обновление очереди для GUI предпросмотра
-            try:
-                while not display_queue.empty():
-                    display_queue.get_nowait()
-                display_queue.put_nowait(composed_frame_rgb)
-            except queue.Full:
-                pass
+                composition_start_time = time.perf_counter()
+                if sink.frame_view is None or sink.frame_view.shape[:2] != (CAM_HEIGHT, CAM_WIDTH):
+                    raise ValueError("Неверный формат или размер кадра в общей памяти.")
+
+                if sink.supports_direct_write:
+                    # Композиция прямо в следующий слот общей памяти, без промежуточного буфера
+                    slot, composed_frame_rgb = sink.begin_frame()
+                    # Перерисовываем только области прошлого и текущего положения аватара в этом слоте
+                    dirty_rect, _ = _compose_dirty_region(background_frame_to_composite, background_key,
+                                                          final_avatar_layer, current_bounce_offset,
+                                                          composed_frame_rgb, slot)
+                    publish_start = time.perf_counter()
+                    metrics.record_stage(frame_metrics.STAGE_COMPOSE, (publish_start - composition_start_time) * 1000)
+                    sink.publish_frame(dirty_rect, signal=False)
+                    signal_start = time.perf_counter()
+                    sink.signal_frame_ready()
+                    metrics.record_stage(frame_metrics.STAGE_SHM_WRITE, (signal_start - publish_start) * 1000)
+                    metrics.record_stage(frame_metrics.STAGE_SIGNAL, (time.perf_counter() - signal_start) * 1000)
+                    frame_sent = True
+                    _last_composed_frame = composed_frame_rgb
+                    _last_frame_key = frame_key
+                    # Обновление очереди для GUI предпросмотра (отдельная копия с ограничением частоты)
+                    _publish_preview_frame(composed_frame_rgb, now)
+                else:
+                    # Одиночный буфер читается потребителем в любой момент, поэтому кадр собирается в буфер
+                    # конвейера, а копирование в общую память и сигнал выполняет поток отправки,
+                    # пока здесь уже собирается следующий кадр. Копирование сокращает время, в течение которого
+                    # потребитель одиночного буфера (DLL камеры на Windows) может увидеть недописанный кадр,
+                    # но не исключает его: номеров кадров в протоколе v1 нет
+                    pipeline = _get_frame_pipeline()
+                    buffer_index = pipeline.acquire(timeout=scheduler.period)
+                    if buffer_index is not None:  # Иначе все буферы заняты отправкой: кадр пропускается
+                        composed_frame_rgb = pipeline.buffers[buffer_index]
+                        try:
+                            _, output_state = _compose_dirty_region(background_frame_to_composite, background_key,
+                                                                    final_avatar_layer, current_bounce_offset,
+                                                                    composed_frame_rgb, ("pipeline", buffer_index))
+                            sink_dirty_rect = _get_pipeline_dirty_rect(output_state)
+                            metrics.record_stage(frame_metrics.STAGE_COMPOSE,
+                                                 (time.perf_counter() - composition_start_time) * 1000)
+                            pipeline.submit(buffer_index, (sink, sink_dirty_rect, now))
+                        except Exception:
+                            # Буфер возвращается в пул только потоком отправки; без этого он был бы потерян,
+                            # и после FRAME_PIPELINE_DEPTH ошибок все кадры отбрасывались бы
+                            pipeline.release(buffer_index)
+                            raise
+                        frame_sent = True
+                        _last_composed_frame = composed_frame_rgb
+                        _last_frame_key = frame_key
+                    else:
+                        frame_dropped = True
 
         except Exception as e:
             print(f"ОШИБКА в цикле генерации кадров: {e}")
-            await asyncio.sleep(POLLING_INTERVAL_SECONDS)  # Используем POLLING_INTERVAL_SECONDS
-
-        # Добавляем задержку для поддержания FPS
-        # Время, которое должно пройти для следующего кадра (в секундах)
-        frame_time_target = 1.0 / CAM_FPS if CAM_FPS > 0 else POLLING_INTERVAL_SECONDS
-        # Время, которое заняла вся итерация цикла до момента сна
-        current_loop_duration = time.perf_counter() - real_frame_start  # Использование real_frame_start
-
-        sleep_duration = frame_time_target - current_loop_duration
-        if sleep_duration > 0:
-            await asyncio.sleep(sleep_duration)
+            stop_event.wait(POLLING_INTERVAL_SECONDS)  # Используем POLLING_INTERVAL_SECONDS
+
+        # Ждем дедлайна следующего кадра (CAM_FPS мог измениться через update_camera_parameters)
+        frame_work_seconds = time.perf_counter() - real_frame_start  # Работа итерации без ожидания дедлайна
+        # Бюджет - действующий период кадра: на половинном FPS (QUALITY_HALF_FPS) он вдвое длиннее 1/CAM_FPS
+        frame_budget_ms = 1000.0 * governor.fps_divider / CAM_FPS if CAM_FPS > 0 else 0.0
+        metrics.record_frame(frame_work_seconds * 1000, frame_budget_ms,
+                             sent=frame_sent, skipped=frame_skipped, dropped=frame_dropped)
+        if CAM_FPS > 0:
+            governor.record_frame(frame_work_seconds, 1.0 / CAM_FPS)
+            scheduler.set_fps(CAM_FPS / governor.fps_divider)
+            scheduler.wait()
         else:
-            await asyncio.sleep(0.001)  # Минимальная задержка, чтобы не нагружать ЦПУ
-            # print(f"ПРЕДУПРЕЖДЕНИЕ: Не успеваем за FPS {CAM_FPS}. Пропуск задержки. (Заняло {current_loop_duration*1000:.2f} мс)")
+            stop_event.wait(POLLING_INTERVAL_SECONDS)
 
-        real_frame_end = time.perf_counter()  # Конец измерения цикла кадра
-        real_frame_ms = (real_frame_end - real_frame_start) * 1000
-        # print(f"[DEBUG] Цикл кадра занял: {real_frame_ms:.1f} мс")  # Отладочный вывод
+    # Поток отправки пишет в общую память, поэтому он останавливается до того, как приемник будет закрыт
+    _stop_frame_pipeline()
 
 
 def voice_status_callback(status_message: str, debug_message: str):
@@ -919,87 +1711,68 @@ def voice_status_callback(status_message: str, debug_message: str):
     global _bouncing_active, _bouncing_start_time, _bouncing_enabled, _last_known_voice_status
     global _cross_fade_active, _cross_fade_start_time, _old_avatar_frames_data, _cross_fade_enabled, CROSS_FADE_DURATION_MS
     global _reset_animation_on_status_change, _instant_talk_transition
-    global CAM_FPS  # Для инициализации smoothed_dt
 
     if _status_change_listener:
         _status_change_listener(status_message, debug_message)
 
     with _avatar_frames_lock:
-        # Получаем шаблон данных для нового активного аватара
-        new_active_avatar_data_template = _animation_assets.get(status_message,
-                                                                {"frames": [], "original_fps": 1.0,
-                                                                 "current_float_index": 0.0,
-                                                                 "animation_start_time": 0.0, "last_frame_time": 0.0,
-                                                                 "smoothed_dt": 0.0, "durations": [],
-                                                                 "current_frame_index": 0, "frame_elapsed": 0.0})
+        # Получаем данные нового активного аватара
+        new_active_avatar_state = _animation_assets.get(status_message)
         # Если для нового статуса нет кадров, используем запасной вариант 'Молчит'
-        if not new_active_avatar_data_template['frames']:
-            fallback_data = _animation_assets.get("Молчит",
-                                                  {"frames": [], "original_fps": 1.0, "current_float_index": 0.0,
-                                                   "animation_start_time": 0.0, "last_frame_time": 0.0,
-                                                   "smoothed_dt": 0.0, "durations": [], "current_frame_index": 0,
-                                                   "frame_elapsed": 0.0})
-            if not fallback_data['frames']:  # Если и 'Молчит' не найден, создаем пустую заглушку
-                fallback_data['frames'] = [np.zeros((CAM_HEIGHT, CAM_WIDTH, 4), dtype=np.uint8)]
-                fallback_data['durations'] = [0.1]  # Default duration for empty frame
+        if new_active_avatar_state is None or not new_active_avatar_state.has_frames:
+            fallback_state = _animation_assets.get("Молчит")
+            if fallback_state is None or not fallback_state.has_frames:  # Если и 'Молчит' не найден, создаем пустую заглушку
+                fallback_state = _create_placeholder_avatar_state()
+                _animation_assets["Молчит"] = fallback_state
 
             # Только если запасной вариант - это другой ассет
-            if fallback_data is not new_active_avatar_data_template:
+            if fallback_state is not new_active_avatar_state:
                 print(
                     f"ПРЕДУПРЕЖДЕНИЕ (voice_status_callback): Кадры для статуса '{status_message}' не найдены. Использую запасной вариант 'Молчит'.")
-                new_active_avatar_data_template = fallback_data
+                new_active_avatar_state = fallback_state
             else:
                 print(
                     f"ПРЕДУПРЕЖДЕНИЕ (voice_status_callback): Кадры для статуса '{status_message}' не найдены. Уже использую 'Молчит'.")
 
         # Сравниваем объекты, чтобы определить, действительно ли это новый набор кадров
-        if new_active_avatar_data_template is not _current_active_avatar_frames:
+        if new_active_avatar_state is not _current_active_avatar_frames:
+            now = time.perf_counter()
             # Логика для INSTANT_TALK_TRANSITION: если включен и статус "Говорит"
             if _instant_talk_transition and status_message == "Говорит":
                 _cross_fade_active = False  # Отключаем кроссфейд для этого перехода
                 # Очищаем старые данные для чистого появления
-                _old_avatar_frames_data = {"frames": [], "original_fps": 1.0, "current_float_index": 0.0,
-                                           "animation_start_time": 0.0, "last_frame_time": 0.0, "smoothed_dt": 0.0,
-                                           "durations": [], "current_frame_index": 0, "frame_elapsed": 0.0}
-            elif _cross_fade_enabled:  # Если INSTANT_TALK_TRANSITION не активен или не статус "Говорит", и кроссфейд включен
-                # Копируем текущее состояние активного аватара в старые данные для кроссфейда
+                _old_avatar_frames_data = None
+            elif _cross_fade_enabled and _current_active_avatar_frames is not None:  # Если INSTANT_TALK_TRANSITION не активен или не статус "Говорит", и кроссфейд включен
+                # Копируем текущее состояние активного аватара (кадр и время внутри кадра) в старые данные для кроссфейда
                 _old_avatar_frames_data = _current_active_avatar_frames.copy()
                 _cross_fade_active = True
-                _cross_fade_start_time = time.perf_counter()  # Используем perf_counter()
-                # Важно: Сбрасываем last_frame_time и animation_start_time для старого аватара,
-                # чтобы его анимация начиналась корректно с момента начала кроссфейда.
-                _old_avatar_frames_data['last_frame_time'] = time.perf_counter()
-                _old_avatar_frames_data['animation_start_time'] = time.perf_counter()
-                _old_avatar_frames_data[
-                    'smoothed_dt'] = 1.0 / CAM_FPS if CAM_FPS > 0 else POLLING_INTERVAL_SECONDS  # Re-initialize smoothed_dt
-                _old_avatar_frames_data['current_frame_index'] = _current_active_avatar_frames.get(
-                    'current_frame_index', 0)
-                _old_avatar_frames_data['frame_elapsed'] = _current_active_avatar_frames.get('frame_elapsed', 0.0)
+                _cross_fade_start_time = now
+                # Копия продолжает идти по тем же часам, что и оригинал, поэтому уходящий аватар
+                # плавно доигрывает анимацию во время кроссфейда.
+                _old_avatar_frames_data.resume(now)
             else:  # Если кроссфейд выключен
                 _cross_fade_active = False
                 # Очищаем старые данные
-                _old_avatar_frames_data = {"frames": [], "original_fps": 1.0, "current_float_index": 0.0,
-                                           "animation_start_time": 0.0, "last_frame_time": 0.0, "smoothed_dt": 0.0,
-                                           "durations": [], "current_frame_index": 0, "frame_elapsed": 0.0}
+                _old_avatar_frames_data = None
+
+            # Останавливаем часы уходящего статуса, чтобы при возврате к нему анимация продолжилась с той же позиции
+            if _current_active_avatar_frames is not None:
+                _current_active_avatar_frames.pause(now)
 
             # Обновляем _current_active_avatar_frames ссылкой на данные из _animation_assets
-            _current_active_avatar_frames = new_active_avatar_data_template
+            _current_active_avatar_frames = new_active_avatar_state
 
             # Применяем логику сброса/продолжения анимации для НОВОГО активного аватара
             # Если это мгновенный переход на "Говорит" или сброс включен, сбрасываем индекс и таймеры
             if (_instant_talk_transition and status_message == "Говорит") or _reset_animation_on_status_change:
-                _current_active_avatar_frames['current_float_index'] = 0.0
-                _current_active_avatar_frames['animation_start_time'] = time.perf_counter()
-                _current_active_avatar_frames['last_frame_time'] = time.perf_counter()
-                _current_active_avatar_frames[
-                    'smoothed_dt'] = 1.0 / CAM_FPS if CAM_FPS > 0 else POLLING_INTERVAL_SECONDS
-                _current_active_avatar_frames['current_frame_index'] = 0  # Сбрасываем покадровый индекс
-                _current_active_avatar_frames['frame_elapsed'] = 0.0  # Сбрасываем прошедшее время для кадра
-            # else: если RESET_ANIMATION_ON_STATUS_CHANGE False,
-            # new_active_avatar_data['current_float_index'] и smoothed_dt для этого статуса сохраняют свои предыдущие значения.
+                _current_active_avatar_frames.reset(now)
+            else:
+                # Если RESET_ANIMATION_ON_STATUS_CHANGE False,
+                # анимация этого статуса продолжается с сохраненной позиции.
+                _current_active_avatar_frames.resume(now)
 
             # Если после всех проверок кадры все еще пусты, выводим критическое предупреждение
-            if not _current_active_avatar_frames['frames']:
+            if not _current_active_avatar_frames.has_frames:
                 print(
                     "КРИТИЧЕСКОЕ ПРЕДУПРЕЖДЕНИЕ: Нет доступных кадров ни для текущего статуса, ни для 'Молчит'. Анимация аватара будет пустой.")
 
@@ -1015,36 +1788,201 @@ def voice_status_callback(status_message: str, debug_message: str):
         _last_known_voice_status = status_message
 
 
+def _get_asset_file_signature(base_name: str) -> tuple | None:
+    """Подпись файла ассета для отслеживания изменений: (путь, mtime, размер) или None, если файла нет."""
+    file_path = _find_asset_file(base_name)
+    if file_path is None:
+        return None
+    try:
+        file_stat = os.stat(file_path)
+    except OSError:
+        return None
+    return file_path, file_stat.st_mtime_ns, file_stat.st_size
+
+
+def _close_frames_if_unused(states):
+    """Закрывает ленивые источники кадров замененных состояний, если их больше не использует ни один ассет."""
+    frames_in_use = {id(state.frames) for state in _animation_assets.values()}
+    for state in states:
+        if isinstance(state.frames, frame_source.LazyFrameSource) and id(state.frames) not in frames_in_use:
+            state.frames.close()
+            if state.prepared and "layers" in state.prepared:
+                state.prepared["layers"].close()
+            _close_dim_variant(state.prepared)
+
+
+def _reload_asset(base_name: str):
+    """
+    Заново загружает измененный файл ассета и атомарно подменяет его кадры в _animation_assets.
+    Декодирование выполняется в вызывающем (фоновом) потоке, под _avatar_frames_lock происходит только подмена,
+    поэтому цикл отправки кадров не останавливается, а приемник кадров не пересоздается.
+    Разрешение камеры не меняется: новый фон масштабируется к текущему CAM_WIDTH x CAM_HEIGHT.
+    """
+    global _current_active_avatar_frames, _old_avatar_frames_data, _cross_fade_active, _assets_generation
+    print(f"Файл ассета '{base_name}' изменен. Перезагружаю...")
+
+    if base_name == BACKGROUND_IMAGE_PATH:
+        frames, original_fps, frame_durations = _load_frames_from_file(base_name, is_avatar=False,
+                                                                      update_camera_size=False)
+        if len(frames) == 0:
+            print("ПРЕДУПРЕЖДЕНИЕ: Не удалось перезагрузить фон. Продолжаю использовать загруженные кадры.")
+            return
+        new_state = AnimationState(frames, frame_durations, original_fps)
+        if not isinstance(frames, frame_source.LazyFrameSource):
+            new_state.frames, new_state.is_static = _prepare_background_frames(frames)
+        new_state.set_durations(new_state.durations[:len(new_state.frames)])
+        new_states = {"Background": new_state}
+    else:
+        # Записи реестра для прежней версии файла больше не нужны
+        for asset_key in [key for key in _asset_registry
+                          if os.path.basename(key[0]).rsplit(".", 1)[0] == base_name]:
+            del _asset_registry[asset_key]
+        frames, original_fps, frame_durations, prepared = _load_avatar_asset(base_name)
+        if len(frames) == 0:
+            print(f"ПРЕДУПРЕЖДЕНИЕ: Не удалось перезагрузить аватар '{base_name}'. Продолжаю использовать загруженные кадры.")
+            return
+        new_states = {status: AnimationState(frames, frame_durations, original_fps, prepared=prepared)
+                      for status, filename in STATUS_TO_FILENAME_MAP.items() if filename == base_name}
+
+    with _avatar_frames_lock:
+        replaced_states = []
+        for status, new_state in new_states.items():
+            old_state = _animation_assets.get(status)
+            if old_state is not None:
+                # Новые кадры продолжают играть по часам прежнего состояния (в том числе на паузе)
+                new_state.start_time = old_state.start_time
+                new_state.paused_at = old_state.paused_at
+                replaced_states.append(old_state)
+                if _current_active_avatar_frames is old_state:
+                    _current_active_avatar_frames = new_state
+            _animation_assets[status] = new_state
+
+        # Кроссфейд от кадров замененного файла завершаем сразу: их источник может быть закрыт
+        if _old_avatar_frames_data is not None and any(
+                _old_avatar_frames_data.frames is state.frames for state in replaced_states):
+            _old_avatar_frames_data = None
+            _cross_fade_active = False
+
+        _assets_generation += 1
+        _invalidate_output_frame()
+        _close_frames_if_unused(replaced_states)
+
+    print(f"Ассет '{base_name}' перезагружен.")
+
+
+def _asset_watcher_loop(stop_event: threading.Event):
+    """
+    Раз в ASSET_WATCH_INTERVAL_SECONDS проверяет файлы фона и аватаров.
+    Файл перезагружается, когда его подпись изменилась и осталась прежней при следующей проверке,
+    чтобы не читать файл, который еще записывается.
+    """
+    base_names = [BACKGROUND_IMAGE_PATH] + list(dict.fromkeys(STATUS_TO_FILENAME_MAP.values()))
+    known_signatures = {base_name: _get_asset_file_signature(base_name) for base_name in base_names}
+    pending_signatures = {}
+
+    while not stop_event.wait(ASSET_WATCH_INTERVAL_SECONDS):
+        for base_name in base_names:
+            signature = _get_asset_file_signature(base_name)
+            if signature == known_signatures[base_name]:
+                pending_signatures.pop(base_name, None)
+                continue
+            if pending_signatures.get(base_name) != signature:
+                pending_signatures[base_name] = signature
+                continue
+
+            del pending_signatures[base_name]
+            known_signatures[base_name] = signature
+            if signature is None:
+                print(f"ПРЕДУПРЕЖДЕНИЕ: Файл ассета '{base_name}' удален. Продолжаю использовать загруженные кадры.")
+                continue
+            try:
+                _reload_asset(base_name)
+            except Exception as e:
+                print(f"ОШИБКА: Не удалось перезагрузить ассет '{base_name}': {e}")
+
+
+def _start_asset_watcher():
+    """Запускает фоновый поток отслеживания изменений файлов ассетов."""
+    global _asset_watcher_thread, _asset_watcher_stop_event
+    _stop_asset_watcher()
+    _asset_watcher_stop_event = threading.Event()
+    _asset_watcher_thread = threading.Thread(target=_asset_watcher_loop, args=(_asset_watcher_stop_event,),
+                                             name="AssetWatcherThread", daemon=True)
+    _asset_watcher_thread.start()
+
+
+def _stop_asset_watcher():
+    """Останавливает поток отслеживания изменений файлов ассетов и дожидается его завершения."""
+    global _asset_watcher_thread, _asset_watcher_stop_event
+    if _asset_watcher_stop_event is not None:
+        _asset_watcher_stop_event.set()
+    if _asset_watcher_thread is not None and _asset_watcher_thread is not threading.current_thread():
+        _asset_watcher_thread.join(timeout=5.0)
+    _asset_watcher_thread = None
+    _asset_watcher_stop_event = None
+
+
+def _release_animation_assets():
+    """Закрывает ленивые источники кадров (файлы GIF) и останавливает поток предзагрузки кэша кадров."""
+    global _frame_cache
+    _asset_registry.clear()
+    for state in _animation_assets.values():
+        if isinstance(state.frames, frame_source.LazyFrameSource):
+            state.frames.close()
+        if state.prepared and "layers" in state.prepared:
+            state.prepared["layers"].close()
+        _close_dim_variant(state.prepared)
+    if _frame_cache is not None:
+        _frame_cache.stop()
+        _frame_cache = None
+
+
 def shutdown_virtual_camera():
-    """Закрывает общую память и Win32 Event."""
+    """Закрывает приемник кадров (общую память и объект сигнализации)."""
     print("Запрос на завершение виртуальной камеры (освобождение общей памяти)...")
-    global virtual_cam_obj, _cam_loop_running, _shared_memory_map, _shared_memory_buffer, _new_frame_event
+    global virtual_cam_obj, _frame_sink, _last_composed_frame
 
-    _cam_loop_running = False  # Это приведет к завершению цикла asyncio в потоке
+    # Поток рендеринга пишет прямо в общую память, поэтому он должен завершиться до ее закрытия
+    if not stop_render_thread():
+        print("ПРЕДУПРЕЖДЕНИЕ: Поток рендеринга камеры не завершился в течение таймаута.")
+    _stop_asset_watcher()
+    _last_composed_frame = None  # Может ссылаться на слот общей памяти
 
-    if _shared_memory_map is not None:
-        print("  Закрытие общей памяти...")
-        try:
-            _shared_memory_map.close()
-            _shared_memory_map = None
-            _shared_memory_buffer = None
-            print("  Общая память закрыта.")
-        except Exception as e:
-            print(f"  Ошибка при закрытии общей памяти: {e}")
-            _shared_memory_map = None
-            _shared_memory_buffer = None  # Ensure it's None even if close fails
+    if _frame_sink is not None:
+        sink = _frame_sink
+        _frame_sink = None
+        sink.close()
 
-    if _new_frame_event is not None:
-        print("  Закрытие Win32 Event...")
-        try:
-            win32api.CloseHandle(_new_frame_event)
-            _new_frame_event = None
-            print("  Win32 Event закрыт.")
-        except Exception as e:
-            print(f"  Ошибка при закрытии Win32 Event: {e}")
-            _new_frame_event = None  # Ensure it's None even if close fails
+    _release_animation_assets()
 
     virtual_cam_obj = False  # Mark camera as shut down
+    print(f"  Кадров пропущено без изменений: {get_skipped_frames_count()}")
+    scheduler_stats = get_frame_scheduler_stats()
+    if scheduler_stats:
+        print(f"  Планировщик кадров: {scheduler_stats['achieved_fps']:.1f}/{scheduler_stats['target_fps']} FPS, "
+              f"джиттер {scheduler_stats['jitter_avg_ms']:.2f} мс (макс. {scheduler_stats['jitter_max_ms']:.2f} мс), "
+              f"пропущено дедлайнов: {scheduler_stats['missed_deadlines']} (перескочено: {scheduler_stats['skipped_deadlines']})")
+    pipeline_stats = get_frame_pipeline_stats()
+    if pipeline_stats:
+        print(f"  Конвейер кадров: композиция {pipeline_stats['compose_avg_ms']:.2f} мс, "
+              f"отправка {pipeline_stats['send_avg_ms']:.2f} мс, ожидание в очереди {pipeline_stats['queue_avg_ms']:.2f} мс, "
+              f"пропущено из-за заполненного конвейера: {pipeline_stats['dropped_frames']}")
+    metrics_snapshot = get_frame_metrics_snapshot()
+    if metrics_snapshot["stages"][frame_metrics.STAGE_FRAME]["count"]:
+        frame_stats = metrics_snapshot["stages"][frame_metrics.STAGE_FRAME]
+        print(f"  Телеметрия кадров: {metrics_snapshot['achieved_fps']:.1f} FPS, время кадра p50 {frame_stats['p50_ms']:.2f} мс, "
+              f"p95 {frame_stats['p95_ms']:.2f} мс, p99 {frame_stats['p99_ms']:.2f} мс (макс. {frame_stats['max_ms']:.2f} мс), "
+              f"опоздавших кадров: {metrics_snapshot['late_frames']}, отброшенных: {metrics_snapshot['dropped_frames']}")
+        for stage in (frame_metrics.STAGE_ANIMATION, frame_metrics.STAGE_COMPOSE, frame_metrics.STAGE_SHM_WRITE,
+                      frame_metrics.STAGE_SIGNAL, frame_metrics.STAGE_PREVIEW):
+            stage_stats = metrics_snapshot["stages"][stage]
+            if stage_stats["count"]:
+                print(f"    {stage}: p50 {stage_stats['p50_ms']:.3f} мс, p99 {stage_stats['p99_ms']:.3f} мс, "
+                      f"макс. {stage_stats['max_ms']:.3f} мс ({stage_stats['count']} раз)")
+    quality_stats = get_quality_governor_stats()
+    if quality_stats:
+        print(f"  Адаптивное качество: уровень {quality_stats['level']} ({quality_stats['level_name']}), "
+              f"переключений: {quality_stats['transitions']}")
     print("Виртуальная камера (ресурсы общей памяти) завершена.")
 
 